@@ -0,0 +1,325 @@
+"""Нагрузочный бенчмарк HTTP API.
+
+Заполняет систему N агентами, сообщениями и задачами, затем гоняет
+смесь типичных вызовов (вход, отправка и чтение сообщений, создание и
+получение задач, статус агента, метрики) с заданным числом одновременных
+клиентов и печатает для каждого эндпоинта p50/p95/p99 задержки и
+пропускную способность. Сценарий детерминирован (--seed).
+
+Режимы: inprocess — приложение вызывается напрямую через ASGI-транспорт
+httpx (без сети, видна стоимость самого кода); uvicorn — отдельный процесс
+uvicorn на локальном порту (с сетью и сериализацией HTTP).
+
+Результаты сравниваются с базовой линией (--baseline, по умолчанию
+baseline_api.json рядом со скриптом): регрессией считается рост p95 или
+падение пропускной способности больше чем на --tolerance. При регрессии
+код выхода 1. Базовая линия хранит параметры прогона (params); если
+они отличаются от текущих, сравнение для режима не выполняется и
+печатается предупреждение. --save-baseline перезаписывает базовую линию
+для выполненных режимов. Базовая линия зависит от машины: сравнивайте
+результаты, снятые на одном и том же окружении.
+
+Вход намеренно дорог: хэш scrypt с N=2^14 стоит около 55 мс процессора.
+Хэши считаются в пуле из min(4, число ядер) потоков, поэтому при 32
+клиентах входы ждут в очереди пула (p50 входа — секунды), а на машине с
+одним ядром хэширование отнимает процессор у остальных эндпоинтов (их p95
+около 5 мс вместо 1–2 мс). baseline_api.json снят с этими настройками по
+умолчанию на 1 CPU. Чтобы измерить сам код без стоимости хэширования,
+запускайте с дешёвым SCRYPT_N (например, SCRYPT_N=1024) и отдельной
+базовой линией (--baseline).
+
+Запуск: python benchmarks/bench_api.py --modes inprocess uvicorn --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+import httpx  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_api.json")
+USERNAME, PASSWORD = "bench", "bench-password"
+SEED_BATCH = 1000
+
+
+class Context:
+    """Данные, созданные при заполнении и используемые сценарием."""
+
+    def __init__(self, token: str, agent_ids: List[int], task_ids: List[int]):
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.agent_ids = agent_ids
+        self.task_ids = task_ids
+
+
+async def login(client: httpx.AsyncClient) -> httpx.Response:
+    return await client.post("/auth/login", data={"username": USERNAME, "password": PASSWORD})
+
+
+async def send_message(client, ctx: Context, rnd: random.Random) -> httpx.Response:
+    sender, receiver = rnd.sample(ctx.agent_ids, 2)
+    return await client.post("/messages", json={"sender_id": sender, "receiver_id": receiver, "content": "ping"},
+                             headers=ctx.headers)
+
+
+def new_task(ctx: Context, rnd: random.Random) -> dict:
+    deadline = datetime.utcnow() + timedelta(hours=rnd.randint(1, 72))
+    return {"priority": rnd.randint(1, 5), "assigned_agent_id": rnd.choice(ctx.agent_ids),
+            "deadline": deadline.isoformat(), "status": "pending"}
+
+
+async def create_task(client, ctx: Context, rnd: random.Random) -> httpx.Response:
+    response = await client.post("/tasks", json=new_task(ctx, rnd), headers=ctx.headers)
+    if response.status_code == 200:
+        ctx.task_ids.append(response.json()["task_id"])
+    return response
+
+
+# (эндпоинт, вес в смеси, вызов)
+SCENARIO: List = [
+    ("POST /auth/login", 2, lambda client, ctx, rnd: login(client)),
+    ("POST /messages", 20, send_message),
+    ("GET /messages/{agent_id}", 20, lambda client, ctx, rnd: client.get(
+        f"/messages/{rnd.choice(ctx.agent_ids)}", params={"limit": 50}, headers=ctx.headers)),
+    ("POST /tasks", 10, create_task),
+    ("GET /tasks/{task_id}", 15, lambda client, ctx, rnd: client.get(
+        f"/tasks/{rnd.choice(ctx.task_ids)}", headers=ctx.headers)),
+    ("GET /agents/{agent_id}/status", 20, lambda client, ctx, rnd: client.get(
+        f"/agents/{rnd.choice(ctx.agent_ids)}/status", headers=ctx.headers)),
+    ("POST /agents/{agent_id}/metrics", 8, lambda client, ctx, rnd: client.post(
+        f"/agents/{rnd.choice(ctx.agent_ids)}/metrics",
+        json={"metrics": [{"metric_type": "CPU", "value": rnd.random() * 100}]}, headers=ctx.headers)),
+    ("GET /metrics", 5, lambda client, ctx, rnd: client.get("/metrics", headers=ctx.headers)),
+]
+
+
+async def bounded(calls: List[Callable], concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(call):
+        async with semaphore:
+            return await call()
+    return await asyncio.gather(*(run(call) for call in calls))
+
+
+async def seed(client: httpx.AsyncClient, args, rnd: random.Random) -> Context:
+    response = await login(client)
+    response.raise_for_status()
+    ctx = Context(response.json()["access_token"], [], [])
+    for start in range(0, args.agents, SEED_BATCH):
+        batch = [
+            {"agent_type": rnd.choice(("ML", "BDI", "Reactive")), "status": "active",
+             "priority_level": rnd.randint(1, 3), "configuration": {"model": "nn"}}
+            for _ in range(min(SEED_BATCH, args.agents - start))
+        ]
+        response = await client.post("/agents/batch", json={"agents": batch}, headers=ctx.headers)
+        response.raise_for_status()
+        ctx.agent_ids.extend(result["agent_id"] for result in response.json()["results"] if result["success"])
+    await bounded([lambda: send_message(client, ctx, rnd) for _ in range(args.messages)], args.concurrency)
+    await bounded([lambda: create_task(client, ctx, rnd) for _ in range(args.tasks)], args.concurrency)
+    return ctx
+
+
+async def drive(client: httpx.AsyncClient, ctx: Context, args) -> Dict[str, dict]:
+    names = [name for name, _, _ in SCENARIO]
+    weights = [weight for _, weight, _ in SCENARIO]
+    calls = {name: call for name, _, call in SCENARIO}
+    samples: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, int] = {name: 0 for name in names}
+    remaining = args.warmup + args.requests
+
+    async def worker(number: int):
+        nonlocal remaining
+        rnd = random.Random(args.seed * 1000 + number)
+        while remaining > 0:
+            remaining -= 1
+            record = remaining < args.requests
+            name = rnd.choices(names, weights)[0]
+            started = time.perf_counter()
+            response = await calls[name](client, ctx, rnd)
+            elapsed = time.perf_counter() - started
+            # Внутри процесса запрос может пройти целиком без переключения задач; отдаём цикл остальным
+            await asyncio.sleep(0)
+            if record:
+                samples[name].append(elapsed)
+                if response.status_code >= 400:
+                    errors[name] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(args.concurrency)))
+    wall = time.perf_counter() - started
+    results = {name: summarize(samples[name], errors[name], wall) for name in names if samples[name]}
+    results["total"] = summarize([s for name in names for s in samples[name]], sum(errors.values()), wall)
+    return results
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(samples: List[float], errors: int, wall: float) -> dict:
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        # Доля эндпоинта в общей пропускной способности при заданной смеси
+        "rps": round(len(ordered) / wall, 1),
+    }
+
+
+async def run_inprocess(args) -> Dict[str, dict]:
+    import main
+    await main.storage.add_user({"username": USERNAME, "password": PASSWORD, "role": "admin"})
+    for handler in main.app.router.on_startup:
+        await handler()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            ctx = await seed(client, args, random.Random(args.seed))
+            return await drive(client, ctx, args)
+    finally:
+        for handler in main.app.router.on_shutdown:
+            await handler()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_uvicorn(args) -> Dict[str, dict]:
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port)], cwd=SRC)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+            for _ in range(200):
+                try:
+                    if (await client.get("/openapi.json")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn exited during startup")
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not start in 20 seconds")
+            ctx = await seed(client, args, random.Random(args.seed))
+            return await drive(client, ctx, args)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def serve(port: int):
+    """Процесс сервера для режима uvicorn: приложение с пользователем бенчмарка."""
+    import uvicorn
+    import main
+
+    @main.app.on_event("startup")
+    async def add_bench_user():
+        if await main.storage.get_user(USERNAME) is None:
+            await main.storage.add_user({"username": USERNAME, "password": PASSWORD, "role": "admin"})
+
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def report(mode: str, results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Печатает таблицу результатов и возвращает описания регрессий относительно baseline."""
+    regressions = []
+    print(f"\n[{mode}]")
+    print(f"{'endpoint':<34}{'count':>7}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rps':>9}  vs baseline")
+    for name, row in results.items():
+        base = baseline.get(name)
+        comparison = ""
+        if base:
+            p95_change = row["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+            rps_change = row["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+            comparison = f"p95 {p95_change:+.0%}, rps {rps_change:+.0%}"
+            if p95_change > tolerance or rps_change < -tolerance:
+                comparison += "  REGRESSION"
+                regressions.append(f"{mode} {name}: {comparison.strip()}")
+        print(f"{name:<34}{row['count']:>7}{row['errors']:>5}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+              f"{row['p99_ms']:>9.2f}{row['rps']:>9.1f}  {comparison}")
+    return regressions
+
+
+def run_params(args) -> dict:
+    """Параметры, от которых зависят результаты: с другими сравнение с базовой линией бессмысленно."""
+    params = {key: getattr(args, key) for key in ("agents", "messages", "tasks", "requests", "concurrency", "seed")}
+    # Стоимость входа задаётся окружением сервера (см. описание модуля)
+    params["scrypt_n"] = int(os.getenv("SCRYPT_N", str(2 ** 14)))
+    return params
+
+
+def comparable(mode: str, baseline: dict, params: dict) -> bool:
+    """Проверяет, что базовая линия режима снята с теми же параметрами; иначе предупреждает."""
+    recorded = baseline.get("params")
+    if recorded is None:
+        return True
+    differences = [f"{key}={recorded.get(key)} (now {value})" for key, value in params.items()
+                   if recorded.get(key) != value]
+    if differences:
+        print(f"\nWARNING: {mode} baseline was recorded with " + ", ".join(differences)
+              + "; comparison skipped", file=sys.stderr)
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=("inprocess", "uvicorn"), default=["inprocess"])
+    parser.add_argument("--agents", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Допустимое ухудшение (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve)
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    runners = {"inprocess": run_inprocess, "uvicorn": run_uvicorn}
+    params = run_params(args)
+    regressions, measured = [], {}
+    for mode in args.modes:
+        measured[mode] = asyncio.run(runners[mode](args))
+        base = baseline.get(mode, {})
+        regressions += report(mode, measured[mode], base if comparable(mode, base, params) else {}, args.tolerance)
+
+    if args.save_baseline:
+        for mode, results in measured.items():
+            baseline[mode] = {"params": params, **results}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Микробенчмарк аутентифицированных запросов с кэшем токенов и без него.
+
+Измеряет пропускную способность зависимости get_current_user и полного
+запроса GET /roles, выполняемого в процессе через ASGI-транспорт httpx.
+
+Запуск: python benchmarks/bench_auth.py --requests 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+
+
+async def dependency_rate(token: str, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        await main.get_current_user(token)
+    return count / (time.perf_counter() - start)
+
+
+async def request_rate(token: str, count: int) -> float:
+    transport = httpx.ASGITransport(app=main.app)
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        for _ in range(count):
+            response = await client.get("/roles", headers=headers)
+            assert response.status_code == 200
+        return count / (time.perf_counter() - start)
+
+
+async def run(count: int):
+    main.storage.clear()
+    await main.storage.add_user({"username": "bench", "password": "bench", "role": "admin"})
+    token = main.create_access_token({"sub": "bench"}, timedelta(minutes=30))
+    print(f"{'mode':>10} {'get_current_user/s':>20} {'GET /roles req/s':>18}")
+    for mode, size in (("no cache", 0), ("cache", 10000)):
+        main.token_cache.clear()
+        main.token_cache.max_size = size
+        dependency = await dependency_rate(token, count * 4)
+        requests = await request_rate(token, count)
+        print(f"{mode:>10} {dependency:>20.0f} {requests:>18.0f}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,96 @@
+"""Память, занимаемая агентами и сообщениями в хранилище в памяти.
+
+Каждый вариант заполняется в отдельном процессе; печатается прирост RSS,
+пересчитанный на миллион агентов и на десять миллионов сообщений:
+  * dict   — строки-словари с datetime, как хранились до records.py;
+  * record — AgentRecord / MessageRecord в словаре id -> запись;
+  * store  — AgentStore / MessageStore целиком, вместе с индексами.
+
+Запуск: python benchmarks/bench_memory.py --agents 1000000 --messages 10000000
+(10M сообщений в варианте dict требуют нескольких ГБ памяти).
+"""
+import argparse
+import gc
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from agent_store import AgentRecord, AgentStore  # noqa: E402
+from message_store import MessageRecord, MessageStore  # noqa: E402
+
+LAYOUTS = ("dict", "record", "store")
+SCALE = {"agents": 1_000_000, "messages": 10_000_000}
+AGENT_TYPES = ("ML", "BDI", "Reactive")
+
+
+def rss() -> int:
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def agent_rows(count: int):
+    now = datetime(2024, 1, 1)
+    for i in range(count):
+        # Как после разбора JSON: каждая строка запроса — новый объект
+        yield i + 1, {"agent_type": AGENT_TYPES[i % 3].encode().decode(), "status": "active",
+                      "priority_level": 1 + i % 3, "configuration": {"model": "nn"},
+                      "last_heartbeat": now + timedelta(microseconds=i), "config_version": 1}
+
+
+def message_rows(count: int, agents: int):
+    now = datetime(2024, 1, 1)
+    for i in range(count):
+        yield i + 1, {"sender_id": 1 + i % agents, "receiver_id": 1 + (i * 7919) % agents,
+                      "content": f"ping {i % 100}", "timestamp": now + timedelta(microseconds=i)}
+
+
+def measure(kind: str, layout: str, count: int, agents: int) -> int:
+    """Прирост RSS в байтах после заполнения одного варианта."""
+    rows = agent_rows(count) if kind == "agents" else message_rows(count, agents)
+    record_type = AgentRecord if kind == "agents" else MessageRecord
+    gc.collect()
+    before = rss()
+    if layout == "store":
+        container = AgentStore() if kind == "agents" else MessageStore()
+    else:
+        container = {}
+    for record_id, row in rows:
+        container[record_id] = record_type(row) if layout == "record" else row
+    gc.collect()
+    return rss() - before
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=1_000_000)
+    parser.add_argument("--messages", type=int, default=2_000_000,
+                        help="Сообщений в замере (результат пересчитывается на 10M)")
+    parser.add_argument("--measure", nargs=3, metavar=("KIND", "LAYOUT", "COUNT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        kind, layout, count = args.measure
+        print(measure(kind, layout, int(count), args.agents))
+        return
+
+    print(f"{'':>10} {'layout':>8} {'bytes/record':>13} {'RSS per scale':>16}")
+    for kind, count in (("agents", args.agents), ("messages", args.messages)):
+        baseline = None
+        for layout in LAYOUTS:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--agents", str(args.agents),
+                 "--measure", kind, layout, str(count)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            grown = int(output)
+            per_record = grown / count
+            baseline = baseline or per_record
+            print(f"{kind:>10} {layout:>8} {per_record:>13.0f} "
+                  f"{per_record * SCALE[kind] / 1024 ** 3:>12.2f} GB  ({per_record / baseline:.0%} of dict)",
+                  flush=True)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,72 @@
+"""Бенчмарк выборки сообщений агента из MessageStore.
+
+Заполняет хранилище N сообщениями фоновых агентов и фиксированным числом
+сообщений целевого агента, затем измеряет время получения его переписки.
+С индексами время не зависит от N; полный перебор (--scan) растёт линейно.
+
+Запуск: python benchmarks/bench_messages.py --sizes 10000 100000 1000000 10000000
+(10M сообщений требуют нескольких ГБ памяти).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from message_store import MessageStore  # noqa: E402
+
+TARGET_AGENT = 0
+
+
+def fill(store: MessageStore, size: int, mailbox: int, agents: int):
+    rnd = random.Random(size)
+    now = datetime.utcnow()
+    every = max(size // mailbox, 1)
+    for message_id in range(1, size + 1):
+        if message_id % every == 0:
+            sender, receiver = TARGET_AGENT, rnd.randint(1, agents)
+        else:
+            sender, receiver = rnd.randint(1, agents), rnd.randint(1, agents)
+        store[message_id] = {"sender_id": sender, "receiver_id": receiver, "content": "x", "timestamp": now}
+
+
+def measure(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--mailbox", type=int, default=100, help="сообщений у целевого агента")
+    parser.add_argument("--agents", type=int, default=10_000, help="число фоновых агентов")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--scan", action="store_true", help="также измерить полный перебор")
+    args = parser.parse_args()
+
+    print(f"{'messages':>12} {'mailbox':>8} {'index, us':>12}" + (f" {'scan, us':>12}" if args.scan else ""))
+    for size in args.sizes:
+        store = MessageStore()
+        fill(store, size, args.mailbox, args.agents)
+        indexed = measure(lambda: [store[mid] for mid in store.for_agent(TARGET_AGENT)], args.repeat)
+        found = sum(1 for _ in store.for_agent(TARGET_AGENT))
+        line = f"{size:>12} {found:>8} {indexed:>12.1f}"
+        if args.scan:
+            scan = measure(lambda: [
+                msg for msg in store.values()
+                if msg["sender_id"] == TARGET_AGENT or msg["receiver_id"] == TARGET_AGENT
+            ], max(args.repeat // 50, 3))
+            line += f" {scan:>12.1f}"
+        print(line, flush=True)
+
+
+if __name__ == "__main__":
+    main()
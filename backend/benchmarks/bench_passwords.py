@@ -0,0 +1,110 @@
+"""Бенчмарк входа с хэшированием паролей и его влияния на остальные запросы.
+
+В течение --duration секунд --logins клиентов непрерывно выполняют
+POST /auth/login, а --readers клиентов — GET /agents/{id}/status.
+Печатает пропускную способность входа и p50/p99 задержки чтения статуса
+для режима inline (хэш считается прямо в цикле событий) и для пулов
+потоков PasswordHasher разного размера (как в приложении). Запросы
+выполняются в процессе через ASGI-транспорт httpx.
+
+Запуск: python benchmarks/bench_passwords.py --duration 5 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from credentials import PasswordHasher  # noqa: E402
+
+USERNAME, PASSWORD = "bench", "bench-password"
+
+
+class InlineHasher(PasswordHasher):
+    """Хэширование в цикле событий — то, от чего защищает пул."""
+
+    async def hash(self, password: str) -> str:
+        return self.hash_sync(password)
+
+    async def verify(self, password: str, stored: Optional[str]) -> Tuple[bool, bool]:
+        return self.verify_sync(password, stored)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else float("nan")
+
+
+async def run(hasher: PasswordHasher, args) -> dict:
+    main.storage.clear()
+    main.token_cache.clear()
+    main.password_hasher = hasher
+    await main.storage.add_user({"username": USERNAME, "password": hasher.hash_sync(PASSWORD), "role": "admin"})
+    agent_ids = await main.storage.add_agents([
+        {"agent_type": "ML", "status": "active", "priority_level": 1, "configuration": {},
+         "last_heartbeat": datetime.utcnow()}
+        for _ in range(100)
+    ])
+    token = main.create_access_token(data={"sub": USERNAME}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    logins, reads = [], []
+    deadline = time.perf_counter() + args.duration
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        async def login_loop():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await client.post("/auth/login", data={"username": USERNAME, "password": PASSWORD})
+                assert response.status_code == 200, response.text
+                logins.append(time.perf_counter() - started)
+
+        async def read_loop(number: int):
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                # Без реального ввода-вывода запрос проходит без переключения задач, поэтому
+                # в задержку входит ожидание своей очереди в цикле событий — его и удлиняет хэширование
+                await asyncio.sleep(0)
+                response = await client.get(f"/agents/{agent_ids[number % len(agent_ids)]}/status", headers=headers)
+                assert response.status_code == 200, response.text
+                reads.append(time.perf_counter() - started)
+                number += 1
+
+        await asyncio.gather(*(login_loop() for _ in range(args.logins)),
+                             *(read_loop(number) for number in range(args.readers)))
+    hasher.close()
+    return {
+        "logins/s": len(logins) / args.duration,
+        "login p50 ms": percentile(logins, 0.5) * 1000,
+        "reads/s": len(reads) / args.duration,
+        "read p50 ms": percentile(reads, 0.5) * 1000,
+        "read p99 ms": percentile(reads, 0.99) * 1000,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--logins", type=int, default=8, help="Одновременных клиентов входа")
+    parser.add_argument("--readers", type=int, default=16, help="Одновременных клиентов чтения статуса")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4], help="Размеры пула потоков")
+    parser.add_argument("--scheme", default="scrypt", choices=("scrypt", "pbkdf2_sha256"))
+    args = parser.parse_args()
+
+    modes = [("inline", InlineHasher(scheme=args.scheme))]
+    modes += [(f"pool x{workers}", PasswordHasher(scheme=args.scheme, max_workers=workers)) for workers in args.workers]
+    columns = ("logins/s", "login p50 ms", "reads/s", "read p50 ms", "read p99 ms")
+    print(f"{'mode':<10}" + "".join(f"{column:>14}" for column in columns))
+    for name, hasher in modes:
+        result = asyncio.run(run(hasher, args))
+        print(f"{name:<10}" + "".join(f"{result[column]:>14.1f}" for column in columns), flush=True)
+
+
+if __name__ == "__main__":
+    main_cli()
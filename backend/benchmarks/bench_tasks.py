@@ -0,0 +1,72 @@
+"""Бенчмарк выборок задач из TaskStore.
+
+Заполняет хранилище N задачами со случайными агентами, статусами,
+приоритетами и сроками, затем измеряет типичные запросы панелей:
+ожидающие задачи агента, задачи со сроком в ближайшие 5 минут и
+срочные задачи высокого приоритета (по 100 записей на страницу).
+
+Запуск: python benchmarks/bench_tasks.py --sizes 100000 500000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from task_store import TaskStore  # noqa: E402
+
+STATUSES = ("pending", "in_progress", "completed")
+PAGE = 100
+
+
+def fill(store: TaskStore, size: int, agents: int, now: datetime):
+    rnd = random.Random(size)
+    for task_id in range(1, size + 1):
+        store[task_id] = {
+            "priority": rnd.randint(1, 5),
+            "assigned_agent_id": rnd.randint(1, agents),
+            "deadline": now + timedelta(seconds=rnd.randint(-86400, 7 * 86400)),
+            "status": rnd.choice(STATUSES),
+        }
+
+
+def measure(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    parser.add_argument("--agents", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    now = datetime(2030, 1, 1)
+    queries = {
+        "agent pending": lambda store: store.select({"assigned_agent_id": 42, "status": "pending"}),
+        "due in 5 min": lambda store: store.select({}, now, now + timedelta(minutes=5)),
+        "due today, prio 5": lambda store: store.select({"priority": 5, "status": "pending"}, now, now + timedelta(days=1)),
+    }
+    print(f"{'tasks':>10} " + " ".join(f"{name + ', us':>20}" for name in queries))
+    for size in args.sizes:
+        store = TaskStore()
+        fill(store, size, args.agents, now)
+        timings = [
+            measure(lambda: [store[task_id] for task_id in islice(query(store), PAGE)], args.repeat)
+            for query in queries.values()
+        ]
+        print(f"{size:>10} " + " ".join(f"{timing:>20.1f}" for timing in timings), flush=True)
+
+
+if __name__ == "__main__":
+    main()
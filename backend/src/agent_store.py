@@ -0,0 +1,149 @@
+"""Хранилище агентов со вторичными индексами.
+
+Для полей agent_type, status и priority_level ведутся индексы
+значение -> множество agent_id. Они обновляются при каждой записи агента,
+поэтому подсчёт агентов по статусу стоит O(1), а выборка с фильтрами —
+O(размера наименьшего подходящего индекса), а не O(всех агентов).
+Отсортированный список id позволяет отдать страницу без фильтров срезом.
+
+Агенты хранятся как AgentRecord (records.py): статус — код, тип —
+интернированная строка, last_heartbeat — микросекунды от эпохи.
+"""
+from bisect import bisect_left, insort
+from collections.abc import MutableMapping
+from enum import Enum
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from message_store import from_micros, to_micros
+from records import INTERNED, Codes, Record
+
+INDEXED_FIELDS = ("agent_type", "status", "priority_level")
+
+
+def _index_key(value: Any) -> Any:
+    # AgentStatus хэшируется по имени члена, а не по строковому значению
+    return value.value if isinstance(value, Enum) else value
+
+
+AGENT_STATUSES = Codes(("active", "stopped", "paused"))
+
+
+class AgentRecord(Record):
+    __slots__ = ("agent_type", "status", "priority_level", "configuration", "last_heartbeat", "config_version")
+    CODECS = {
+        "agent_type": INTERNED,
+        "status": AGENT_STATUSES.codec,
+        "last_heartbeat": (to_micros, from_micros),
+    }
+
+
+class AgentStore(MutableMapping):
+    """Словарь agent_id -> агент с индексами по INDEXED_FIELDS."""
+
+    def __init__(self):
+        self._agents: Dict[int, AgentRecord] = {}
+        self._index: Dict[str, Dict[Any, Set[int]]] = {field: {} for field in INDEXED_FIELDS}
+        self._ids: List[int] = []
+
+    def __getitem__(self, agent_id: int) -> dict:
+        return self._agents[agent_id].to_row()
+
+    def __setitem__(self, agent_id: int, agent: dict):
+        if agent_id in self._agents:
+            self._unindex(agent_id, self._agents[agent_id])
+        else:
+            insort(self._ids, agent_id)
+        self._agents[agent_id] = AgentRecord(agent)
+        for field in INDEXED_FIELDS:
+            self._index[field].setdefault(_index_key(agent[field]), set()).add(agent_id)
+
+    def __delitem__(self, agent_id: int):
+        self._unindex(agent_id, self._agents.pop(agent_id))
+        del self._ids[bisect_left(self._ids, agent_id)]
+
+    def record(self, agent_id: int) -> AgentRecord:
+        """Запись агента в закодированном виде (для снимков); её нельзя изменять."""
+        return self._agents[agent_id]
+
+    def load(self, items: Iterable[Tuple[int, AgentRecord]]):
+        """Заполняет пустое хранилище готовыми записями, строя индексы за один проход."""
+        agents, index = self._agents, self._index
+        for agent_id, record in items:
+            agents[agent_id] = record
+            for field in INDEXED_FIELDS:
+                index[field].setdefault(_index_key(record.get(field)), set()).add(agent_id)
+        self._ids[:] = sorted(agents)
+
+    def delete_many(self, agent_ids: Iterable[int]):
+        """Удаляет агентов пачкой, перестраивая список id один раз, а не сдвигая его на каждом удалении."""
+        for agent_id in agent_ids:
+            self._unindex(agent_id, self._agents.pop(agent_id))
+        self._ids[:] = [agent_id for agent_id in self._ids if agent_id in self._agents]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._agents)
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def __contains__(self, agent_id) -> bool:
+        # Проверка наличия без декодирования записи в словарь
+        return agent_id in self._agents
+
+    def _unindex(self, agent_id: int, agent: AgentRecord):
+        for field in INDEXED_FIELDS:
+            self._discard(field, agent.get(field), agent_id)
+
+    def _discard(self, field: str, value: Any, agent_id: int):
+        values = self._index[field]
+        key = _index_key(value)
+        ids = values.get(key)
+        if ids is not None:
+            ids.discard(agent_id)
+            if not ids:
+                del values[key]
+
+    def update_fields(self, agent_id: int, fields: dict):
+        """Изменяет поля агента, перестраивая индексы только изменившихся полей."""
+        agent = self._agents[agent_id]
+        for field in INDEXED_FIELDS:
+            if field in fields and _index_key(fields[field]) != _index_key(agent.get(field)):
+                self._discard(field, agent.get(field), agent_id)
+                self._index[field].setdefault(_index_key(fields[field]), set()).add(agent_id)
+        agent.update(fields)
+
+    def value(self, agent_id: int, field: str) -> Any:
+        """Значение одного поля агента без построения всей строки."""
+        return self._agents[agent_id].get(field)
+
+    def matches(self, agent_id: int, filters: dict) -> bool:
+        """Совпадают ли все поля из filters у агента agent_id."""
+        agent = self._agents[agent_id]
+        return all(_index_key(agent.get(field)) == _index_key(value) for field, value in filters.items())
+
+    def select(self, filters: Optional[dict] = None) -> List[int]:
+        """id агентов, у которых все поля из filters равны заданным значениям (поля — из INDEXED_FIELDS)."""
+        if not filters:
+            return list(self._ids)
+        candidates = sorted(
+            (self._index[field].get(_index_key(value), set()) for field, value in filters.items()),
+            key=len
+        )
+        smallest, rest = candidates[0], candidates[1:]
+        return [agent_id for agent_id in smallest if all(agent_id in ids for ids in rest)]
+
+    @property
+    def sorted_ids(self) -> List[int]:
+        """Упорядоченный список id (не копия: вызывающий код его не изменяет)."""
+        return self._ids
+
+    def page(self, offset: int, limit: int, descending: bool = False) -> List[int]:
+        """id агентов по возрастанию (или убыванию), начиная с позиции offset."""
+        if not descending:
+            return self._ids[offset:offset + limit]
+        stop = len(self._ids) - offset
+        return self._ids[max(stop - limit, 0):max(stop, 0)][::-1]
+
+    def counts(self, field: str) -> Dict[Any, int]:
+        """Число агентов для каждого значения индексированного поля."""
+        return {value: len(ids) for value, ids in self._index[field].items()}
@@ -0,0 +1,79 @@
+"""Кэш проверенных JWT-токенов.
+
+Повторная проверка подписи и поиск пользователя выполняются только при
+промахе. Ключ — SHA-256 от токена, сам токен в памяти не хранится.
+Запись живёт до exp токена (но не дольше max_ttl) и удаляется при
+изменении пользователя.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+class TokenCache:
+    """Ограниченный LRU-кэш token digest -> данные пользователя с истечением по exp."""
+
+    def __init__(self, max_size: int = 10000, max_ttl: float = 300.0):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[bytes, Tuple[float, dict]]" = OrderedDict()
+        self._by_user: Dict[int, Set[bytes]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str) -> Optional[dict]:
+        """Возвращает закэшированного пользователя или None, если записи нет или она истекла."""
+        digest = token_digest(token)
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if time.time() >= expires_at:
+            self._remove(digest)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return user
+
+    def put(self, token: str, user: dict, exp: Optional[float]):
+        """Сохраняет пользователя (с ключом user_id) до момента exp (секунды от эпохи)."""
+        if self.max_size <= 0:
+            return
+        now = time.time()
+        expires_at = now + self.max_ttl if exp is None else min(exp, now + self.max_ttl)
+        if expires_at <= now:
+            return
+        digest = token_digest(token)
+        if digest in self._entries:
+            self._remove(digest)
+        self._entries[digest] = (expires_at, user)
+        self._by_user.setdefault(user["user_id"], set()).add(digest)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        """Удаляет все токены пользователя (смена роли, пароля, удаление)."""
+        for digest in self._by_user.pop(user_id, ()):
+            self._entries.pop(digest, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_user.clear()
+
+    def _remove(self, digest: bytes):
+        _, user = self._entries.pop(digest)
+        digests = self._by_user.get(user["user_id"])
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_user[user["user_id"]]
@@ -0,0 +1,221 @@
+"""Версии конфигураций агентов и частичные обновления.
+
+Конфигурация никогда не изменяется на месте: JSON Merge Patch (RFC 7396)
+и JSON Patch (RFC 6902) копируют только контейнеры на пути к изменённым
+значениям, а остальные поддеревья новая версия разделяет с предыдущей.
+Поэтому хранение истории версий стоит памяти лишь под изменённые пути, а
+diff двух версий пропускает общие поддеревья по идентичности объектов и
+проходит только по изменённым ветвям.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MERGE_PATCH_TYPE = "application/merge-patch+json"
+JSON_PATCH_TYPE = "application/json-patch+json"
+
+
+class PatchError(ValueError):
+    """Патч некорректен или не применим к документу."""
+
+
+def merge_patch(target: Any, patch: Any) -> Any:
+    """Применяет JSON Merge Patch: null удаляет ключ, объекты сливаются рекурсивно."""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def _escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _pointer(path: Any) -> List[str]:
+    if not isinstance(path, str) or (path and not path.startswith("/")):
+        raise PatchError(f"Invalid JSON pointer: {path!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in path.split("/")[1:]]
+
+
+def _index(container: list, token: str, allow_end: bool) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+        raise PatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _resolve(document: Any, tokens: List[str]) -> Any:
+    for token in tokens:
+        if isinstance(document, dict):
+            if token not in document:
+                raise PatchError(f"Path not found: /{'/'.join(map(_escape, tokens))}")
+            document = document[token]
+        elif isinstance(document, list):
+            document = document[_index(document, token, allow_end=False)]
+        else:
+            raise PatchError(f"Path not found: /{'/'.join(map(_escape, tokens))}")
+    return document
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _json_equal(left: Any, right: Any) -> bool:
+    """Равенство значений JSON для операции test: числа равны по значению (1 == 1.0), но true не равно 1."""
+    if isinstance(left, dict) and isinstance(right, dict):
+        return left.keys() == right.keys() and all(_json_equal(value, right[key]) for key, value in left.items())
+    if isinstance(left, list) and isinstance(right, list):
+        return len(left) == len(right) and all(map(_json_equal, left, right))
+    if _is_number(left) and _is_number(right):
+        return left == right
+    return type(left) is type(right) and left == right
+
+
+def _update(document: Any, tokens: List[str], change: Callable[[Any, str], None]) -> Any:
+    """Копия document, где к копии родителя последнего токена применена change; остальное разделяется."""
+    if isinstance(document, dict):
+        copy = dict(document)
+    elif isinstance(document, list):
+        copy = list(document)
+    else:
+        raise PatchError("Cannot address into a scalar value")
+    head, rest = tokens[0], tokens[1:]
+    if not rest:
+        change(copy, head)
+        return copy
+    if isinstance(copy, dict):
+        if head not in copy:
+            raise PatchError(f"Path not found: {head!r}")
+        copy[head] = _update(copy[head], rest, change)
+    else:
+        index = _index(copy, head, allow_end=False)
+        copy[index] = _update(copy[index], rest, change)
+    return copy
+
+
+def _add(document: Any, tokens: List[str], value: Any) -> Any:
+    if not tokens:
+        return value
+
+    def change(container, token):
+        if isinstance(container, dict):
+            container[token] = value
+        else:
+            container.insert(_index(container, token, allow_end=True), value)
+    return _update(document, tokens, change)
+
+
+def _remove(document: Any, tokens: List[str]) -> Any:
+    if not tokens:
+        raise PatchError("Cannot remove the whole document")
+
+    def change(container, token):
+        if isinstance(container, dict):
+            if token not in container:
+                raise PatchError(f"Path not found: {token!r}")
+            del container[token]
+        else:
+            del container[_index(container, token, allow_end=False)]
+    return _update(document, tokens, change)
+
+
+def _replace(document: Any, tokens: List[str], value: Any) -> Any:
+    if not tokens:
+        return value
+
+    def change(container, token):
+        if isinstance(container, dict):
+            if token not in container:
+                raise PatchError(f"Path not found: {token!r}")
+            container[token] = value
+        else:
+            container[_index(container, token, allow_end=False)] = value
+    return _update(document, tokens, change)
+
+
+def json_patch(document: Any, operations: Any) -> Any:
+    """Применяет JSON Patch; при ошибке в любой операции документ не меняется (PatchError)."""
+    if not isinstance(operations, list):
+        raise PatchError("JSON Patch must be an array of operations")
+    for operation in operations:
+        if not isinstance(operation, dict) or "op" not in operation or "path" not in operation:
+            raise PatchError(f"Invalid operation: {operation!r}")
+        op, tokens = operation["op"], _pointer(operation["path"])
+        if op in ("add", "replace", "test") and "value" not in operation:
+            raise PatchError(f"Operation {op!r} requires a value")
+        if op == "add":
+            document = _add(document, tokens, operation["value"])
+        elif op == "remove":
+            document = _remove(document, tokens)
+        elif op == "replace":
+            document = _replace(document, tokens, operation["value"])
+        elif op in ("move", "copy"):
+            source = _pointer(operation.get("from"))
+            value = _resolve(document, source)
+            if op == "move":
+                if tokens[:len(source)] == source and tokens != source:
+                    raise PatchError("Cannot move a value into its own child")
+                document = _remove(document, source)
+            document = _add(document, tokens, value)
+        elif op == "test":
+            actual = _resolve(document, tokens)
+            if not _json_equal(actual, operation["value"]):
+                raise PatchError(f"Test failed at {operation['path']}")
+        else:
+            raise PatchError(f"Unknown operation: {op!r}")
+    return document
+
+
+def diff(old: Any, new: Any, path: str = "") -> List[dict]:
+    """Операции JSON Patch, переводящие old в new. Общие поддеревья пропускаются по идентичности."""
+    if old is new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        operations = [{"op": "remove", "path": f"{path}/{_escape(key)}"} for key in old if key not in new]
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key in old:
+                operations.extend(diff(old[key], value, child))
+            else:
+                operations.append({"op": "add", "path": child, "value": value})
+        return operations
+    if type(old) is type(new) and old == new:
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+class ConfigHistory:
+    """Последние max_versions версий конфигурации каждого агента (версии разделяют поддеревья)."""
+
+    def __init__(self, max_versions: int = 32):
+        self.max_versions = max_versions
+        self.clear()
+
+    def clear(self):
+        self._versions: Dict[int, Dict[int, dict]] = {}
+
+    def record(self, agent_id: int, version: int, configuration: dict):
+        versions = self._versions.setdefault(agent_id, {})
+        if version in versions:
+            return
+        versions[version] = configuration
+        # Версии могут прийти не по порядку (из хранилища), вытесняем самую старую
+        while len(versions) > self.max_versions:
+            del versions[min(versions)]
+
+    def get(self, agent_id: int, version: int) -> Optional[dict]:
+        return self._versions.get(agent_id, {}).get(version)
+
+    def versions(self, agent_id: int) -> List[Tuple[int, dict]]:
+        return sorted(self._versions.get(agent_id, {}).items())
+
+    def forget(self, agent_id: int):
+        self._versions.pop(agent_id, None)
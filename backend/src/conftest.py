@@ -0,0 +1,65 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Заглушка внешней системы: поведение задаётся путём запроса.
+
+    /ok — 200 с JSON, /fail — 500, /flaky/<n> — первые n запросов 503, /slow/<секунды> — ответ с задержкой.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент не дождался ответа (тайм-аут)
+            pass
+
+    def _handle(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length)) if length else None
+        path = self.path.split("?")[0]
+        with server.lock:
+            server.requests.append((self.command, self.path, self.headers.get("Authorization")))
+            server.connections.add(self.client_address)
+            hits = server.hits[path] = server.hits.get(path, 0) + 1
+        if path == "/fail":
+            return self._reply(500, {"error": "boom"})
+        if path.startswith("/flaky/") and hits <= int(path.rsplit("/", 1)[1]):
+            return self._reply(503, {"error": "unavailable"})
+        if path.startswith("/slow/"):
+            time.sleep(float(path.rsplit("/", 1)[1]))
+        self._reply(200, {"method": self.command, "path": self.path, "body": payload})
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.connections = set()
+    server.hits = {}
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,99 @@
+"""Рассылка действий координации агентам и сбор подтверждений.
+
+Сессия координации и состояние каждого участника хранятся в хранилище.
+Действие рассылается сообщениями агентам: участники делятся на
+порции, каждая порция записывается одним пакетным добавлением сообщений,
+а порции отправляются параллельно (asyncio.gather) с ограничением
+одновременных пакетов и тайм-аутом на пакет. Сохранённые сообщения
+передаются в publish_messages (в приложении — событием шины, по которому
+каждый воркер раскладывает их по почтовым ящикам). Участники из порций, не
+уложившихся в тайм-аут, помечаются failed; остальные — delivered, после
+чего агенты подтверждают получение через ack.
+
+Состояния участника: pending -> delivered | failed -> acknowledged | rejected.
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from storage import Storage
+
+PENDING = "pending"
+DELIVERED = "delivered"
+FAILED = "failed"
+ACKNOWLEDGED = "acknowledged"
+REJECTED = "rejected"
+
+# Из этих состояний участник ещё может ответить; доставка «failed» могла дойти частично
+OPEN_STATES = [PENDING, DELIVERED, FAILED]
+
+
+class CoordinationEngine:
+    """Запуск координаций, приём подтверждений и расчёт прогресса."""
+
+    def __init__(self, storage: Storage, publish_messages: Callable[[List[dict]], None], sender_id: int = 0,
+                 chunk_size: int = 500, max_concurrency: int = 8, delivery_timeout: float = 5.0):
+        self.storage = storage
+        self.publish_messages = publish_messages
+        self.sender_id = sender_id
+        self.chunk_size = chunk_size
+        self.max_concurrency = max_concurrency
+        self.delivery_timeout = delivery_timeout
+
+    async def start(self, action: str, agent_ids: List[int], ack_timeout: float) -> Tuple[int, List[int], List[int]]:
+        """Сохраняет сессию и рассылает действие. Возвращает (id, доставленные, недоставленные)."""
+        now = datetime.utcnow()
+        deadline = now + timedelta(seconds=ack_timeout)
+        coordination_id = await self.storage.add_coordination(
+            {"action": action, "created_at": now, "deadline": deadline}, agent_ids
+        )
+        content = json.dumps({"event": "coordination", "coordination_id": coordination_id, "action": action,
+                              "ack_deadline": deadline.isoformat()})
+        chunks = [agent_ids[i:i + self.chunk_size] for i in range(0, len(agent_ids), self.chunk_size)]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def deliver(chunk: List[int]):
+            async with semaphore:
+                await asyncio.wait_for(self._deliver(chunk, content), self.delivery_timeout)
+
+        results = await asyncio.gather(*(deliver(chunk) for chunk in chunks), return_exceptions=True)
+        delivered: List[int] = []
+        failed: List[int] = []
+        for chunk, result in zip(chunks, results):
+            (failed if isinstance(result, Exception) else delivered).extend(chunk)
+        await self.storage.set_participant_state(coordination_id, delivered, [PENDING], DELIVERED)
+        await self.storage.set_participant_state(coordination_id, failed, [PENDING], FAILED)
+        return coordination_id, delivered, failed
+
+    async def _deliver(self, agent_ids: List[int], content: str):
+        timestamp = datetime.utcnow()
+        rows = [
+            {"sender_id": self.sender_id, "receiver_id": agent_id, "content": content, "timestamp": timestamp}
+            for agent_id in agent_ids
+        ]
+        message_ids = await self.storage.add_messages(rows)
+        self.publish_messages([{"message_id": message_id, **row} for message_id, row in zip(message_ids, rows)])
+
+    async def acknowledge(self, coordination_id: int, agent_id: int, success: bool = True) -> bool:
+        """Записывает ответ участника; False, если агент не участник или уже ответил."""
+        state = ACKNOWLEDGED if success else REJECTED
+        return bool(await self.storage.set_participant_state(coordination_id, [agent_id], OPEN_STATES, state))
+
+    async def progress(self, coordination_id: int, with_participants: bool = False) -> Optional[dict]:
+        coordination = await self.storage.get_coordination(coordination_id)
+        if coordination is None:
+            return None
+        counts: Dict[str, int] = {state: 0 for state in (PENDING, DELIVERED, FAILED, ACKNOWLEDGED, REJECTED)}
+        counts.update(await self.storage.count_participants(coordination_id))
+        waiting = counts[PENDING] + counts[DELIVERED]
+        if waiting == 0:
+            status = "completed"
+        elif datetime.utcnow() > coordination["deadline"]:
+            status = "timed_out"
+        else:
+            status = "in_progress"
+        result = {**coordination, "status": status, "total": sum(counts.values()), "counts": counts}
+        if with_participants:
+            result["participants"] = await self.storage.list_participants(coordination_id)
+        return result
@@ -0,0 +1,107 @@
+"""Хэширование и проверка паролей вне цикла событий.
+
+Пароли хранятся в виде строки «схема$параметры$соль$хэш» (scrypt или
+PBKDF2-SHA256). Намеренно медленное вычисление выполняется в
+ограниченном пуле потоков: hashlib отпускает GIL на время scrypt и
+PBKDF2, поэтому цикл событий продолжает обслуживать другие запросы, а
+число одновременно считаемых хэшей не превышает max_workers.
+
+Строки без известной схемы считаются паролями, сохранёнными открытым
+текстом до появления хэширования; verify сообщает, что такую запись (как
+и хэш с устаревшими параметрами) нужно перехэшировать.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+SCRYPT = "scrypt"
+PBKDF2 = "pbkdf2_sha256"
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+class PasswordHasher:
+    """Хэширование паролей с настраиваемой стоимостью в пуле из max_workers потоков."""
+
+    def __init__(self, scheme: str = SCRYPT, scrypt_n: int = 2 ** 14, scrypt_r: int = 8, scrypt_p: int = 1,
+                 pbkdf2_iterations: int = 600_000, max_workers: int = 4):
+        if scheme not in (SCRYPT, PBKDF2):
+            raise ValueError(f"Unknown password hash scheme: {scheme}")
+        self.scheme = scheme
+        self.scrypt_n = scrypt_n
+        self.scrypt_r = scrypt_r
+        self.scrypt_p = scrypt_p
+        self.pbkdf2_iterations = pbkdf2_iterations
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._dummy: Optional[str] = None
+
+    @property
+    def parameters(self) -> str:
+        if self.scheme == SCRYPT:
+            return f"{self.scrypt_n}${self.scrypt_r}${self.scrypt_p}"
+        return str(self.pbkdf2_iterations)
+
+    def hash_sync(self, password: str, salt: Optional[bytes] = None) -> str:
+        salt = os.urandom(SALT_BYTES) if salt is None else salt
+        key = _derive(self.scheme, self.parameters.split("$"), password.encode(), salt)
+        return f"{self.scheme}${self.parameters}${_b64encode(salt)}${_b64encode(key)}"
+
+    def verify_sync(self, password: str, stored: Optional[str]) -> Tuple[bool, bool]:
+        """(пароль верен, запись нужно перехэшировать текущими параметрами)."""
+        if stored is None:
+            # Проверка для несуществующего пользователя стоит столько же, сколько для существующего
+            if self._dummy is None:
+                self._dummy = self.hash_sync(os.urandom(SALT_BYTES).hex())
+            self.verify_sync(password, self._dummy)
+            return False, False
+        scheme, _, rest = stored.partition("$")
+        if scheme not in (SCRYPT, PBKDF2):
+            # Запись открытым текстом
+            return hmac.compare_digest(password.encode(), stored.encode()), True
+        try:
+            *parameters, salt, expected = rest.split("$")
+            key = _derive(scheme, parameters, password.encode(), _b64decode(salt))
+            ok = hmac.compare_digest(key, _b64decode(expected))
+        except (ValueError, TypeError):
+            # Повреждённая запись
+            return False, False
+        return ok, ok and (scheme != self.scheme or "$".join(parameters) != self.parameters)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self._pool(), self.hash_sync, password)
+
+    async def verify(self, password: str, stored: Optional[str]) -> Tuple[bool, bool]:
+        return await asyncio.get_running_loop().run_in_executor(self._pool(), self.verify_sync, password, stored)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+def _derive(scheme: str, parameters: list, password: bytes, salt: bytes) -> bytes:
+    if scheme == SCRYPT:
+        n, r, p = (int(value) for value in parameters)
+        # maxmem с запасом: scrypt требует 128 * n * r байт
+        return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024,
+                              dklen=KEY_BYTES)
+    (iterations,) = parameters
+    return hashlib.pbkdf2_hmac("sha256", password, salt, int(iterations), dklen=KEY_BYTES)
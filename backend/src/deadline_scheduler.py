@@ -0,0 +1,95 @@
+"""Планировщик сроков выполнения задач.
+
+Сроки хранятся в куче (deadline, task_id): постановка и снятие стоят
+O(log n) и O(1), а фоновая корутина спит ровно до ближайшего срока и
+извлекает только наступившие. Если поставлен срок раньше текущего
+ближайшего, корутина пробуждается и пересчитывает время сна. Снятые
+(выполненные, удалённые) задачи удаляются из кучи лениво: их записи
+отбрасываются при извлечении.
+"""
+import asyncio
+import heapq
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Обработчик наступивших сроков: получает id задач
+DueCallback = Callable[[List[int]], Awaitable[None]]
+
+
+class DeadlineScheduler:
+    """Куча сроков задач и цикл, вызывающий обработчик по их наступлении."""
+
+    def __init__(self, batch_size: int = 1000, max_sleep: float = 60.0):
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self._wakeup: Optional[asyncio.Future] = None
+        self.clear()
+
+    def clear(self):
+        self._heap: List[Tuple[float, int]] = []
+        # task_id -> актуальный срок; записи кучи без пары здесь считаются снятыми
+        self._deadlines: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def schedule(self, task_id: int, deadline: float):
+        """Ставит (или переносит) срок задачи, в секундах от эпохи."""
+        self._deadlines[task_id] = deadline
+        heapq.heappush(self._heap, (deadline, task_id))
+        if self._heap[0] == (deadline, task_id):
+            self._wake()
+
+    def cancel(self, task_id: int):
+        self._deadlines.pop(task_id, None)
+
+    def next_deadline(self) -> Optional[float]:
+        self._drop_cancelled()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: Optional[float] = None, limit: Optional[int] = None) -> List[int]:
+        """Снимает и возвращает задачи, срок которых наступил (не больше limit за вызов)."""
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now and (limit is None or len(due) < limit):
+            deadline, task_id = heapq.heappop(self._heap)
+            if self._deadlines.get(task_id) == deadline:
+                del self._deadlines[task_id]
+                due.append(task_id)
+        return due
+
+    def _drop_cancelled(self):
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _wake(self):
+        future = self._wakeup
+        if future is not None and not future.done():
+            try:
+                future.get_loop().call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # Цикл событий планировщика уже закрыт
+                self._wakeup = None
+
+    async def run(self, on_due: DueCallback):
+        """Бесконечно ждёт ближайшего срока и передаёт наступившие задачи в on_due."""
+        loop = asyncio.get_running_loop()
+        while True:
+            due = self.pop_due(limit=self.batch_size)
+            if due:
+                await on_due(due)
+                continue
+            next_deadline = self.next_deadline()
+            delay = self.max_sleep if next_deadline is None else min(max(next_deadline - time.time(), 0), self.max_sleep)
+            self._wakeup = loop.create_future()
+            try:
+                await asyncio.wait_for(self._wakeup, delay)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._wakeup = None
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
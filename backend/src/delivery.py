@@ -0,0 +1,146 @@
+"""Доставка сообщений агентам без опроса истории.
+
+Для каждого подписанного агента ведётся ограниченный почтовый ящик.
+send_message кладёт туда сообщение и будит ожидающих получателей
+(long-poll или WebSocket). Доставка «как минимум один раз»: выданные
+сообщения хранятся до подтверждения (ack) и выдаются повторно, если
+получатель отключился. Сообщения хранятся в основном хранилище, поэтому
+при переполнении ящика самые старые сообщения отбрасываются, а получатель
+видит счётчик dropped и догружает пропущенное через GET /messages.
+
+Ящик читает один получатель за раз: иначе каждый возвращал бы в очередь
+доставки другого и они получали бы одни и те же сообщения.
+"""
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+
+class Mailbox:
+    """Очередь сообщений одного агента: ожидающие отправки и отправленные без подтверждения."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._next_seq = 1
+        self._pending: Deque[Tuple[int, dict]] = deque()
+        self._inflight: Deque[Tuple[int, dict]] = deque()
+        self._waiters: Set[asyncio.Future] = set()
+        self.dropped = 0
+        # Ящик занят long-poll запросом или WebSocket-соединением
+        self.claimed = False
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._inflight)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def claim(self) -> bool:
+        """Занимает ящик для получателя; False — если его уже читает другой."""
+        if self.claimed:
+            return False
+        self.claimed = True
+        return True
+
+    def release(self):
+        self.claimed = False
+
+    def put(self, message: dict):
+        self._pending.append((self._next_seq, message))
+        self._next_seq += 1
+        while len(self) > self.capacity and self._pending:
+            self._pending.popleft()
+            self.dropped += 1
+        self._notify()
+
+    def take(self, limit: int) -> List[Tuple[int, dict]]:
+        """Переносит до limit ожидающих сообщений в неподтверждённые и возвращает их."""
+        batch = []
+        while self._pending and len(batch) < limit:
+            item = self._pending.popleft()
+            self._inflight.append(item)
+            batch.append(item)
+        return batch
+
+    def ack(self, seq: int):
+        """Подтверждает получение всех сообщений с номером не больше seq."""
+        while self._inflight and self._inflight[0][0] <= seq:
+            self._inflight.popleft()
+        self._notify()
+
+    def requeue_inflight(self):
+        """Возвращает неподтверждённые сообщения в начало очереди для повторной выдачи."""
+        while self._inflight:
+            self._pending.appendleft(self._inflight.pop())
+
+    def pop_dropped(self) -> int:
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    async def wait(self, ready, timeout: Optional[float] = None) -> bool:
+        """Ждёт, пока ready() станет истинным; False — если истёк timeout."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while not ready():
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return False
+            future = loop.create_future()
+            self._waiters.add(future)
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                return ready()
+            finally:
+                self._waiters.discard(future)
+        return True
+
+    def _notify(self):
+        # Ожидающий может работать в другом цикле событий (например, в тестовом клиенте)
+        for future in list(self._waiters):
+            try:
+                future.get_loop().call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # Цикл событий ожидающего уже закрыт
+                self._waiters.discard(future)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class DeliveryHub:
+    """Почтовые ящики подписанных агентов."""
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self._mailboxes: Dict[int, Mailbox] = {}
+
+    def subscribe(self, agent_id: int) -> Mailbox:
+        """Возвращает ящик агента, создавая его; сообщения копятся только для подписанных агентов."""
+        mailbox = self._mailboxes.get(agent_id)
+        if mailbox is None:
+            mailbox = self._mailboxes[agent_id] = Mailbox(self.capacity)
+        return mailbox
+
+    def publish(self, agent_id: int, message: dict):
+        mailbox = self._mailboxes.get(agent_id)
+        if mailbox is not None:
+            mailbox.put(message)
+
+    def publish_many(self, messages: List[dict]):
+        """Раскладывает сообщения (с ключом receiver_id) по ящикам получателей."""
+        for message in messages:
+            self.publish(message["receiver_id"], message)
+
+    def drop_agent(self, agent_id: int):
+        self._mailboxes.pop(agent_id, None)
+
+    def clear(self):
+        self._mailboxes.clear()
@@ -0,0 +1,576 @@
+"""Хранилище в памяти с журналом упреждающей записи (WAL) и снимками.
+
+DurableMemoryStorage работает как MemoryStorage, но каждое изменение
+после применения в памяти дописывается в журнал, и вызов завершается
+только после записи журнала на диск. Записи журнала пишет отдельный
+поток: пока идёт fsync, новые записи копятся и затем сбрасываются
+одним write и одним fsync (group commit), поэтому число fsync растёт
+с числом пачек, а не запросов.
+
+Записи журнала — идемпотентные redo-операции с итоговыми значениями
+(положить запись, установить поля, удалить), поэтому их повторное
+применение к более новому состоянию даёт тот же результат. На этом
+построены снимки: журнал переключается на новый сегмент, затем
+состояние записывается в снимок порциями между обработкой других
+запросов (снимок «нечёткий» — может содержать изменения, сделанные уже
+после переключения). После записи снимка старые сегменты удаляются.
+При запуске загружается снимок и применяются сегменты, начиная с
+записанного в нём; оборванная запись в конце последнего сегмента
+(сбой посреди записи) отбрасывается.
+
+Формат: кадры [длина u32][crc32 u32][pickle]; Enum сохраняются своими
+значениями, чтобы файлы не зависели от классов приложения. Агенты, задачи
+и сообщения попадают в снимок по столбцам уже закодированных полей
+записей (records.py): время — int микросекунд, статусы — коды, таблицы
+кодов лежат в заголовке снимка. При загрузке записи создаются без
+повторного кодирования, а индексы хранилищ строятся одной сортировкой,
+а не вставкой каждой записи. Каталог данных блокируется (flock): с ним
+может работать только один процесс.
+"""
+import asyncio
+import fcntl
+import io
+import os
+import pickle
+import re
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from enum import Enum
+from itertools import chain
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from agent_store import AGENT_STATUSES, AgentRecord
+from message_store import MessageRecord
+from records import Codes, Record
+from storage import MemoryStorage
+from task_store import TASK_STATUSES, TaskRecord
+
+SNAPSHOT_NAME = "snapshot.bin"
+SNAPSHOT_MAGIC = b"AGSNAP2\n"
+# Снимок прежнего формата (строки-словари) загружается так же: его порции — пары (коллекция, строки)
+SNAPSHOT_MAGIC_ROWS = b"AGSNAP1\n"
+SEGMENT_NAME = re.compile(r"^wal-(\d{8})\.log$")
+# Коллекции снимка в порядке загрузки
+SNAPSHOT_COLLECTIONS = ("users", "agents", "tasks", "messages", "integrations", "coordinations")
+# Коллекции, которые снимок хранит по столбцам закодированных полей
+RECORD_CLASSES: Dict[str, type] = {"agents": AgentRecord, "tasks": TaskRecord, "messages": MessageRecord}
+# Таблицы кодов, значения которых сохраняются в заголовке снимка
+CODE_TABLES: Dict[Tuple[str, str], Codes] = {("agents", "status"): AGENT_STATUSES, ("tasks", "status"): TASK_STATUSES}
+
+PUT = "put"
+UPDATE = "update"
+DELETE = "delete"
+PARTICIPANTS = "participants"
+
+_FRAME = struct.Struct("<II")
+
+
+class _Pickler(pickle.Pickler):
+    def reducer_override(self, obj):
+        if isinstance(obj, Enum):
+            return type(obj.value), (obj.value,)
+        return NotImplemented
+
+
+def _dumps(obj: Any) -> bytes:
+    buffer = io.BytesIO()
+    _Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    return buffer.getvalue()
+
+
+def _frame(payload: bytes) -> bytes:
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_frames(file) -> Iterator[bytes]:
+    """Читает кадры до конца файла или до первого оборванного/повреждённого кадра."""
+    while True:
+        header = file.read(_FRAME.size)
+        if len(header) < _FRAME.size:
+            return
+        length, crc = _FRAME.unpack(header)
+        payload = file.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        yield payload
+
+
+def segment_path(directory: str, segment: int) -> str:
+    return os.path.join(directory, f"wal-{segment:08d}.log")
+
+
+def list_segments(directory: str) -> List[int]:
+    return sorted(int(match.group(1)) for match in map(SEGMENT_NAME.match, os.listdir(directory)) if match)
+
+
+def _fsync_directory(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """Журнал из сегментов; кадры пишет и синхронизирует с диском отдельный поток."""
+
+    def __init__(self, directory: str, segment: int, sync: bool = True):
+        self.directory = directory
+        self.segment = segment
+        self.sync = sync
+        self.records = 0
+        self.payload_bytes = 0
+        self.bytes_written = 0
+        self.fsyncs = 0
+        self._file = open(segment_path(directory, segment), "ab")
+        _fsync_directory(directory)
+        self._condition = threading.Condition()
+        # Кадры (bytes) и номера сегментов, на которые нужно переключиться (int)
+        self._pending: List[Any] = []
+        self._waiters: List[Future] = []
+        self._closing = False
+        # Ошибка записи, после которой журнал не принимает новых записей
+        self.failure: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="wal-writer", daemon=True)
+        self._thread.start()
+
+    def append(self, payload: bytes) -> Future:
+        """Ставит запись в очередь; future завершается, когда запись (и все предыдущие) на диске."""
+        self.records += 1
+        self.payload_bytes += len(payload)
+        return self._enqueue(_frame(payload))
+
+    def rotate(self) -> int:
+        """Переключает журнал на новый сегмент: следующие записи попадут в него. Возвращает его номер."""
+        self.segment += 1
+        self._enqueue(self.segment)
+        return self.segment
+
+    def flush(self) -> Future:
+        """Future, завершающийся после записи на диск всего, что поставлено в очередь раньше."""
+        return self._enqueue(None)
+
+    def close(self):
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+        self._thread.join()
+        self._file.close()
+
+    def _enqueue(self, item) -> Future:
+        future = Future()
+        with self._condition:
+            if self.failure is not None:
+                raise RuntimeError("Write-ahead log failed") from self.failure
+            if self._closing:
+                raise RuntimeError("Write-ahead log is closed")
+            if item is not None:
+                self._pending.append(item)
+            self._waiters.append(future)
+            self._condition.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._waiters and not self._closing:
+                    self._condition.wait()
+                if not self._waiters:
+                    return
+                pending, waiters = self._pending, self._waiters
+                self._pending, self._waiters = [], []
+            try:
+                self._write(pending)
+            except BaseException as exc:
+                self._fail(exc, waiters)
+                return
+            for future in waiters:
+                future.set_result(None)
+
+    def _fail(self, exc: BaseException, waiters: List[Future]):
+        # После неудачной записи в сегменте может остаться оборванный кадр, за которым восстановление
+        # ничего не прочитает, поэтому журнал останавливается: все ожидающие получают ошибку, а новые
+        # append / flush / rotate сразу бросают RuntimeError
+        with self._condition:
+            self.failure = exc
+            waiters = waiters + self._waiters
+            self._pending, self._waiters = [], []
+        for future in waiters:
+            future.set_exception(exc)
+
+    def _write(self, pending: List[Any]):
+        frames: List[bytes] = []
+        for item in pending:
+            if isinstance(item, bytes):
+                frames.append(item)
+                continue
+            self._write_frames(frames)
+            frames = []
+            self._file.close()
+            self._file = open(segment_path(self.directory, item), "ab")
+            _fsync_directory(self.directory)
+        self._write_frames(frames)
+
+    def _write_frames(self, frames: List[bytes]):
+        if not frames:
+            return
+        data = b"".join(frames)
+        self._file.write(data)
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+        self.bytes_written += len(data)
+
+
+class DurableMemoryStorage(MemoryStorage):
+    """MemoryStorage, изменения которого переживают перезапуск: журнал в directory и периодические снимки.
+
+    Снимок делается, когда с предыдущего журнал вырос на snapshot_wal_bytes (проверка раз в
+    snapshot_interval секунд; 0 отключает автоматические снимки). sync=False пропускает fsync:
+    изменения переживают падение процесса, но не отключение питания.
+
+    Изоляция — read uncommitted относительно диска: изменение применяется к данным в памяти
+    до записи в журнал, и вызвавший метод получает ответ только после fsync, но другие
+    запросы видят изменение уже во время ожидания. Если процесс упадёт в этом окне
+    (обычно одна группа fsync, единицы миллисекунд), изменение, которое кто-то успел
+    прочитать, при восстановлении пропадёт.
+    """
+
+    def __init__(self, directory: str, sync: bool = True, snapshot_interval: float = 60.0,
+                 snapshot_wal_bytes: int = 64 * 1024 * 1024, snapshot_batch: int = 10000):
+        super().__init__()
+        self.directory = directory
+        self.sync = sync
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_wal_bytes = snapshot_wal_bytes
+        self.snapshot_batch = snapshot_batch
+        self.wal: Optional[WriteAheadLog] = None
+        self.recovery: Dict[str, float] = {}
+        self.snapshot_bytes = 0
+        self.snapshots = 0
+        self._lock_fd: Optional[int] = None
+        self._snapshot_lock = asyncio.Lock()
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._wal_bytes_at_snapshot = 0
+
+    async def connect(self):
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(os.path.join(self.directory, "LOCK"), os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise RuntimeError(f"Data directory {self.directory} is used by another process")
+        self._lock_fd = fd
+        segment = self.recover()
+        self.wal = WriteAheadLog(self.directory, segment, self.sync)
+        if self.snapshot_interval > 0:
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+
+    async def close(self):
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+            self._snapshot_task = None
+        try:
+            if self.wal is not None:
+                if self.wal.failure is None:
+                    await asyncio.wrap_future(self.wal.flush())
+                self.wal.close()
+                self.wal = None
+        finally:
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    def stats(self) -> dict:
+        """Объём записанного: полезная нагрузка журнала, байты журнала и снимков, число fsync."""
+        wal = self.wal
+        return {
+            "wal_records": wal.records if wal else 0,
+            "payload_bytes": wal.payload_bytes if wal else 0,
+            "wal_bytes": wal.bytes_written if wal else 0,
+            "fsyncs": wal.fsyncs if wal else 0,
+            "snapshots": self.snapshots,
+            "snapshot_bytes": self.snapshot_bytes,
+        }
+
+    # Восстановление
+    def recover(self) -> int:
+        """Загружает снимок и применяет журнал. Возвращает сегмент, в который продолжать запись."""
+        started = time.perf_counter()
+        self.clear()
+        first_segment, snapshot_records = self._load_snapshot()
+        segments = [segment for segment in list_segments(self.directory) if segment >= first_segment]
+        wal_records = 0
+        for position, segment in enumerate(segments):
+            path = segment_path(self.directory, segment)
+            valid = 0
+            with open(path, "rb") as file:
+                for payload in _read_frames(file):
+                    self._apply(pickle.loads(payload))
+                    wal_records += 1
+                    valid += _FRAME.size + len(payload)
+                end = file.seek(0, os.SEEK_END)
+            if valid < end:
+                if position != len(segments) - 1:
+                    raise RuntimeError(f"Write-ahead log segment {path} is corrupted")
+                # Оборванная запись в конце журнала (сбой посреди записи): клиенту она не подтверждалась
+                with open(path, "r+b") as file:
+                    file.truncate(valid)
+        self.recovery = {"snapshot_records": snapshot_records, "wal_records": wal_records,
+                         "seconds": time.perf_counter() - started}
+        return segments[-1] if segments else first_segment
+
+    def _load_snapshot(self) -> Tuple[int, int]:
+        path = os.path.join(self.directory, SNAPSHOT_NAME)
+        if not os.path.exists(path):
+            return 1, 0
+        records = 0
+        # Порции записей по коллекциям: хранилище заполняется один раз, когда прочитаны все
+        loaded: Dict[str, List[Tuple[List[int], List[Record]]]] = {}
+        with open(path, "rb") as file:
+            if file.read(len(SNAPSHOT_MAGIC)) not in (SNAPSHOT_MAGIC, SNAPSHOT_MAGIC_ROWS):
+                raise RuntimeError(f"{path} is not a snapshot")
+            frames = _read_frames(file)
+            header = pickle.loads(next(frames))
+            complete = False
+            for payload in frames:
+                chunk = pickle.loads(payload)
+                if chunk is None:
+                    complete = True
+                    break
+                if len(chunk) == 3:
+                    collection, record_ids, columns = chunk
+                    loaded.setdefault(collection, []).append(
+                        (record_ids, RECORD_CLASSES[collection].load_columns(columns))
+                    )
+                    self._sequences[collection] = max(self._sequences.get(collection, 1), record_ids[-1] + 1)
+                    records += len(record_ids)
+                    continue
+                collection, batch = chunk
+                for record_id, row in batch:
+                    self._put(collection, record_id, row)
+                records += len(batch)
+        if not complete:
+            raise RuntimeError(f"Snapshot {path} is truncated or corrupted")
+        for (collection, field), table in CODE_TABLES.items():
+            # Коды в файле соответствуют таблице на момент записи снимка
+            values = header.get("codes", {}).get(f"{collection}.{field}")
+            if values is None:
+                continue
+            codes = [table.encode(value) for value in values]
+            if codes != list(range(len(codes))):
+                for _, batch in loaded.get(collection, ()):
+                    for record in batch:
+                        if hasattr(record, field):
+                            setattr(record, field, codes[getattr(record, field)])
+        for collection, batches in loaded.items():
+            getattr(self, collection).load(chain.from_iterable(zip(*batch) for batch in batches))
+        for collection, value in header["sequences"].items():
+            self._sequences[collection] = max(self._sequences.get(collection, 1), value)
+        return header["segment"], records
+
+    def _put(self, collection: str, record_id: int, row: Any):
+        if collection == "coordinations":
+            self.coordinations[record_id], self.participants[record_id] = row
+        else:
+            getattr(self, collection)[record_id] = row
+        self._sequences[collection] = max(self._sequences.get(collection, 1), record_id + 1)
+
+    def _apply(self, record: tuple):
+        op, collection, data = record
+        if op == PUT:
+            for record_id, row in data:
+                self._put(collection, record_id, row)
+        elif op == UPDATE:
+            record_ids, fields = data
+            records = getattr(self, collection)
+            for record_id in record_ids:
+                if record_id in records:
+                    records.update_fields(record_id, fields)
+        elif op == DELETE:
+            records = getattr(self, collection)
+            for record_id in data:
+                if records.pop(record_id, None) is not None and collection == "agents":
+                    self.messages.drop_agent(record_id)
+        elif op == PARTICIPANTS:
+            coordination_id, agent_ids, state, updated_at = data
+            participants = self.participants.get(coordination_id, {})
+            for agent_id in agent_ids:
+                participants[agent_id] = {"state": state, "updated_at": updated_at}
+
+    # Снимки
+    async def snapshot(self) -> int:
+        """Записывает снимок и удаляет покрытые им сегменты журнала. Возвращает размер снимка в байтах."""
+        async with self._snapshot_lock:
+            loop = asyncio.get_running_loop()
+            segment = self.wal.rotate()
+            header = {
+                "segment": segment,
+                "sequences": dict(self._sequences),
+                "codes": {f"{collection}.{field}": table.values for (collection, field), table in CODE_TABLES.items()},
+            }
+            path = os.path.join(self.directory, SNAPSHOT_NAME)
+            temporary = path + ".tmp"
+            written = 0
+            with open(temporary, "wb") as file:
+                chunk = SNAPSHOT_MAGIC + _frame(_dumps(header))
+                for collection in SNAPSHOT_COLLECTIONS:
+                    for record_ids in self._id_batches(collection, 0, self.snapshot_batch):
+                        batch = self._snapshot_chunk(collection, record_ids)
+                        if batch is None:
+                            continue
+                        # Порция сериализуется в цикле событий (состояние не меняется посреди неё),
+                        # а пишется в потоке, пока обрабатываются другие запросы
+                        await loop.run_in_executor(None, file.write, chunk)
+                        written += len(chunk)
+                        chunk = _frame(_dumps(batch))
+                chunk += _frame(_dumps(None))
+                await loop.run_in_executor(None, file.write, chunk)
+                written += len(chunk)
+                await loop.run_in_executor(None, self._sync_file, file)
+            os.replace(temporary, path)
+            _fsync_directory(self.directory)
+            for old in list_segments(self.directory):
+                if old < segment:
+                    os.remove(segment_path(self.directory, old))
+            self.snapshots += 1
+            self.snapshot_bytes += written
+            self._wal_bytes_at_snapshot = self.wal.bytes_written
+            return written
+
+    def _snapshot_chunk(self, collection: str, record_ids: List[int]) -> Optional[tuple]:
+        records = getattr(self, collection)
+        record_ids = [record_id for record_id in record_ids if record_id in records]
+        if not record_ids:
+            return None
+        if collection in RECORD_CLASSES:
+            record_class = RECORD_CLASSES[collection]
+            return collection, record_ids, record_class.dump_columns([records.record(record_id) for record_id in record_ids])
+        if collection == "coordinations":
+            return collection, [(cid, (records[cid], self.participants.get(cid, {}))) for cid in record_ids]
+        return collection, [(record_id, records[record_id]) for record_id in record_ids]
+
+    def _sync_file(self, file):
+        file.flush()
+        if self.sync:
+            os.fsync(file.fileno())
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            if self.wal.bytes_written - self._wal_bytes_at_snapshot >= self.snapshot_wal_bytes:
+                await self.snapshot()
+
+    # Журналирование изменений: запись делается сразу после изменения в памяти, без await между ними,
+    # поэтому порядок записей в журнале совпадает с порядком изменений
+    async def _log(self, op: str, collection: str, data: Any):
+        await asyncio.wrap_future(self.wal.append(_dumps((op, collection, data))))
+
+    async def add_agent(self, agent: dict) -> int:
+        agent_id = await super().add_agent(agent)
+        await self._log(PUT, "agents", [(agent_id, self.agents[agent_id])])
+        return agent_id
+
+    async def update_agent(self, agent_id: int, fields: dict) -> bool:
+        if not await super().update_agent(agent_id, fields):
+            return False
+        await self._log(UPDATE, "agents", ([agent_id], fields))
+        return True
+
+    async def update_config(self, agent_id: int, configuration: dict,
+                            expected_version: Optional[int] = None) -> Optional[int]:
+        version = await super().update_config(agent_id, configuration, expected_version)
+        if version is not None:
+            await self._log(UPDATE, "agents", ([agent_id], {"configuration": configuration, "config_version": version}))
+        return version
+
+    async def delete_agent(self, agent_id: int) -> bool:
+        if not await super().delete_agent(agent_id):
+            return False
+        await self._log(DELETE, "agents", [agent_id])
+        return True
+
+    async def add_agents(self, agents: List[dict]) -> List[int]:
+        agent_ids = await super().add_agents(agents)
+        if agent_ids:
+            await self._log(PUT, "agents", [(agent_id, self.agents[agent_id]) for agent_id in agent_ids])
+        return agent_ids
+
+    async def update_agents(self, fields: dict, agent_ids: Optional[List[int]] = None,
+                            selector: Optional[dict] = None) -> List[int]:
+        selected = await super().update_agents(fields, agent_ids, selector)
+        if selected:
+            await self._log(UPDATE, "agents", (selected, fields))
+        return selected
+
+    async def delete_agents(self, agent_ids: Optional[List[int]] = None,
+                            selector: Optional[dict] = None) -> List[int]:
+        selected = await super().delete_agents(agent_ids, selector)
+        if selected:
+            await self._log(DELETE, "agents", selected)
+        return selected
+
+    async def add_message(self, message: dict) -> int:
+        message_id = await super().add_message(message)
+        await self._log(PUT, "messages", [(message_id, self.messages[message_id])])
+        return message_id
+
+    async def add_messages(self, messages: List[dict]) -> List[int]:
+        message_ids = await super().add_messages(messages)
+        if message_ids:
+            await self._log(PUT, "messages", [(message_id, self.messages[message_id]) for message_id in message_ids])
+        return message_ids
+
+    async def add_task(self, task: dict) -> int:
+        task_id = await super().add_task(task)
+        await self._log(PUT, "tasks", [(task_id, self.tasks[task_id])])
+        return task_id
+
+    async def transition_task(self, task_id: int, from_status: str, to_status: str) -> bool:
+        if not await super().transition_task(task_id, from_status, to_status):
+            return False
+        await self._log(UPDATE, "tasks", ([task_id], {"status": to_status}))
+        return True
+
+    async def add_coordination(self, coordination: dict, agent_ids: List[int]) -> int:
+        coordination_id = await super().add_coordination(coordination, agent_ids)
+        await self._log(PUT, "coordinations", [
+            (coordination_id, (self.coordinations[coordination_id], self.participants[coordination_id]))
+        ])
+        return coordination_id
+
+    async def set_participant_state(self, coordination_id: int, agent_ids: List[int],
+                                    from_states: List[str], state: str) -> List[int]:
+        updated = await super().set_participant_state(coordination_id, agent_ids, from_states, state)
+        if updated:
+            updated_at = self.participants[coordination_id][updated[0]]["updated_at"]
+            await self._log(PARTICIPANTS, "coordinations", (coordination_id, updated, state, updated_at))
+        return updated
+
+    async def add_integration(self, integration: dict) -> int:
+        integration_id = await super().add_integration(integration)
+        await self._log(PUT, "integrations", [(integration_id, self.integrations[integration_id])])
+        return integration_id
+
+    async def add_user(self, user: dict) -> int:
+        user_id = await super().add_user(user)
+        await self._log(PUT, "users", [(user_id, self.users[user_id])])
+        return user_id
+
+    async def update_user(self, user_id: int, fields: dict) -> bool:
+        if not await super().update_user(user_id, fields):
+            return False
+        await self._log(UPDATE, "users", ([user_id], fields))
+        return True
+
+    async def delete_user(self, user_id: int) -> bool:
+        if not await super().delete_user(user_id):
+            return False
+        await self._log(DELETE, "users", [user_id])
+        return True
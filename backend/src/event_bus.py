@@ -0,0 +1,268 @@
+"""Внутренняя шина событий для согласования состояния воркеров.
+
+Хранилище общее (при DATABASE_URL), но очередь задач, сроки, живость
+агентов, история конфигураций, кэш токенов и почтовые ящики живут в
+памяти каждого воркера. Обработчики запросов не меняют это состояние
+напрямую, а публикуют событие (тема + JSON-совместимый словарь);
+подписчики темы обновляют состояние в каждом воркере.
+
+EventBus вызывает подписчиков синхронно внутри publish — этого
+достаточно для одного процесса. SocketEventBus дополнительно пересылает
+события другим воркерам на том же хосте через Unix-сокет: воркер,
+захвативший flock на файле path + ".lock", становится брокером и
+рассылает каждое событие всем подключённым воркерам, кроме отправителя.
+Если брокер завершился, воркеры переподключаются, один из них захватывает
+блокировку и становится новым брокером. События, опубликованные во время
+переподключения, другим воркерам не доходят, поэтому после
+переподключения локально публикуется RECONNECTED, и подписчики
+перечитывают своё состояние из хранилища.
+
+Воркер загружает состояние из хранилища только после wait_connected:
+иначе события, опубликованные до его первого подключения, были бы
+потеряны. Если подключения не дождались, RECONNECTED публикуется и при
+первом подключении.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import struct
+from typing import Callable, Dict, List, Optional, Set
+
+Handler = Callable[[dict], None]
+ErrorHandler = Callable[[str, Exception], None]
+
+# Публикуется только локально после восстановления связи с другими воркерами
+RECONNECTED = "bus.reconnected"
+
+_HEADER = struct.Struct("!I")
+
+
+class EventBus:
+    """Шина внутри процесса: publish вызывает подписчиков темы по порядку подписки."""
+
+    def __init__(self, on_error: Optional[ErrorHandler] = None):
+        self.on_error = on_error
+        self._handlers: Dict[str, List[Handler]] = {}
+        self.published = 0
+        self.received = 0
+
+    def subscribe(self, topic: str, handler: Handler):
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic: str, payload: dict):
+        """Применяет событие в этом воркере.
+
+        Ошибка подписчика не мешает вызвать остальных; первое исключение затем передаётся вызывающему.
+        """
+        self.published += 1
+        error: Optional[Exception] = None
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(payload)
+            except Exception as exc:
+                error = error or exc
+        if error is not None:
+            raise error
+
+    def _dispatch_remote(self, topic: str, payload: dict):
+        # Ошибка подписчика на чужое событие не должна останавливать приём следующих
+        self.received += 1
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(payload)
+            except Exception as exc:
+                if self.on_error is not None:
+                    self.on_error(topic, exc)
+
+    async def start(self):
+        pass
+
+    async def wait_connected(self, timeout: Optional[float] = None):
+        pass
+
+    async def close(self):
+        pass
+
+
+class SocketEventBus(EventBus):
+    """Шина для нескольких воркеров одного хоста: брокер на Unix-сокете path."""
+
+    def __init__(self, path: str, retry_interval: float = 0.5, max_buffer: int = 16 * 1024 * 1024,
+                 on_error: Optional[ErrorHandler] = None):
+        super().__init__(on_error)
+        self.path = path
+        self.retry_interval = retry_interval
+        # Отставший получатель отключается (и затем пересинхронизируется), а не копит события без предела
+        self.max_buffer = max_buffer
+        self.is_broker = False
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Set[asyncio.StreamWriter] = set()
+        self._peer_tasks: Set[asyncio.Task] = set()
+        self._upstream: Optional[asyncio.StreamWriter] = None
+        self._connected = asyncio.Event()
+        # Пропущенные до подключения события требуют пересинхронизации
+        self._resync_on_connect = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def peers(self) -> int:
+        return len(self._peers)
+
+    def publish(self, topic: str, payload: dict):
+        # Сначала событие уходит другим воркерам: ошибка локального подписчика не должна их рассинхронизировать
+        frame = _encode(topic, payload)
+        if self.is_broker:
+            self._broadcast(frame, None)
+        elif self._upstream is not None:
+            self._send(self._upstream, frame)
+        super().publish(topic, payload)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def wait_connected(self, timeout: Optional[float] = None):
+        """Ждёт подключения к другим воркерам; по истечении timeout бросает asyncio.TimeoutError.
+
+        Если подключения не дождались, при первом подключении публикуется RECONNECTED.
+        """
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            self._resync_on_connect = True
+            raise
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._stop_broker()
+        if self._upstream is not None:
+            self._upstream.close()
+            self._upstream = None
+        self._connected.clear()
+
+    async def _run(self):
+        while True:
+            try:
+                if self._acquire_lock():
+                    await self._serve()
+                else:
+                    await self._follow()
+            except (OSError, ValueError):
+                # Брокер ещё не начал слушать сокет, уже завершился или прислал повреждённый кадр
+                pass
+            self._connected.clear()
+            await asyncio.sleep(self.retry_interval)
+
+    def _acquire_lock(self) -> bool:
+        fd = os.open(self.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _serve(self):
+        # Сокет, оставшийся от завершившегося брокера, удаляется при создании сервера
+        self._server = await asyncio.start_unix_server(self._serve_peer, path=self.path)
+        self.is_broker = True
+        self._on_connected()
+        try:
+            await asyncio.Future()
+        finally:
+            await self._stop_broker()
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._peers.add(writer)
+        self._peer_tasks.add(asyncio.current_task())
+        try:
+            while True:
+                body = await _read_body(reader)
+                if body is None:
+                    break
+                self._broadcast(_HEADER.pack(len(body)) + body, writer)
+                self._dispatch_remote(*_decode(body))
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._peers.discard(writer)
+            self._peer_tasks.discard(asyncio.current_task())
+            writer.close()
+
+    def _broadcast(self, frame: bytes, sender: Optional[asyncio.StreamWriter]):
+        for peer in list(self._peers):
+            if peer is not sender:
+                self._send(peer, frame)
+
+    def _send(self, writer: asyncio.StreamWriter, frame: bytes):
+        if writer.is_closing() or writer.transport.get_write_buffer_size() > self.max_buffer:
+            self._peers.discard(writer)
+            writer.close()
+            return
+        writer.write(frame)
+
+    async def _stop_broker(self):
+        self.is_broker = False
+        for peer in list(self._peers):
+            peer.close()
+        self._peers.clear()
+        # Обработчики соединений завершаются сами, получив конец потока
+        await asyncio.gather(*self._peer_tasks, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    async def _follow(self):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        self._upstream = writer
+        self._on_connected()
+        try:
+            while True:
+                body = await _read_body(reader)
+                if body is None:
+                    return
+                self._dispatch_remote(*_decode(body))
+        finally:
+            self._upstream = None
+            writer.close()
+
+    def _on_connected(self):
+        self._connected.set()
+        if self._resync_on_connect:
+            self._dispatch_remote(RECONNECTED, {})
+        self._resync_on_connect = True
+
+
+def _encode(topic: str, payload: dict) -> bytes:
+    body = json.dumps({"topic": topic, "payload": payload}, separators=(",", ":")).encode()
+    return _HEADER.pack(len(body)) + body
+
+
+def _decode(body: bytes):
+    event = json.loads(body)
+    return event["topic"], event["payload"]
+
+
+async def _read_body(reader: asyncio.StreamReader) -> Optional[bytes]:
+    try:
+        header = await reader.readexactly(_HEADER.size)
+        return await reader.readexactly(_HEADER.unpack(header)[0])
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def create_event_bus(socket_path: Optional[str] = None, on_error: Optional[ErrorHandler] = None) -> EventBus:
+    """Шина по EVENT_BUS_SOCKET: межпроцессная, если путь задан, иначе в пределах процесса."""
+    socket_path = socket_path if socket_path is not None else os.getenv("EVENT_BUS_SOCKET", "")
+    if not socket_path:
+        return EventBus(on_error)
+    return SocketEventBus(socket_path, on_error=on_error)
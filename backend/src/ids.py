@@ -0,0 +1,49 @@
+"""Выделение уникальных id записей по схеме hi/lo.
+
+Воркер резервирует в общем хранилище сразу блок id и раздаёт их локально,
+поэтому обращение к хранилищу нужно один раз на block_size вставок.
+Удаление записей не влияет на счётчик, и id никогда не используются повторно.
+"""
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List
+
+# reserve(collection, count) резервирует count id подряд и возвращает первый из них
+Reserve = Callable[[str, int], Awaitable[int]]
+
+
+class IdAllocator:
+    """Раздаёт id из зарезервированных блоков, запрашивая новый блок по мере исчерпания."""
+
+    def __init__(self, reserve: Reserve, block_size: int = 100):
+        if block_size < 1:
+            raise ValueError("block_size must be positive")
+        self._reserve = reserve
+        self.block_size = block_size
+        # Для каждой коллекции — очередь диапазонов [следующий id, конец диапазона)
+        self._ranges: Dict[str, Deque[List[int]]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def next_id(self, collection: str) -> int:
+        return (await self.next_ids(collection, 1))[0]
+
+    async def next_ids(self, collection: str, count: int) -> List[int]:
+        """Возвращает count новых уникальных id коллекции."""
+        ranges = self._ranges.setdefault(collection, deque())
+        ids: List[int] = []
+        while len(ids) < count:
+            if not ranges:
+                # Блок запрашивает одна корутина, остальные ждут его под той же блокировкой
+                async with self._locks.setdefault(collection, asyncio.Lock()):
+                    if not ranges:
+                        size = max(self.block_size, count - len(ids))
+                        first = await self._reserve(collection, size)
+                        ranges.append([first, first + size])
+                continue
+            current = ranges[0]
+            take = min(count - len(ids), current[1] - current[0])
+            ids.extend(range(current[0], current[0] + take))
+            current[0] += take
+            if current[0] == current[1]:
+                ranges.popleft()
+        return ids
@@ -0,0 +1,298 @@
+"""Исходящие вызовы во внешние системы, зарегистрированные как интеграции.
+
+На каждую интеграцию заводится свой httpx.AsyncClient с keep-alive пулом
+соединений к api_url, так что повторные вызовы не открывают новых TCP/TLS
+соединений. Число одновременных запросов к интеграции ограничено
+семафором. Сетевые ошибки и ответы 429/5xx повторяются с экспоненциальной
+задержкой и полным джиттером (только для идемпотентных методов, если не
+разрешено явно). Автомат (circuit breaker) после failure_threshold
+неудачных вызовов подряд на reset_timeout секунд отклоняет вызовы сразу,
+не нагружая упавшую систему, а затем пропускает один пробный вызов.
+
+Путь вызова — только относительный: абсолютный URL в httpx заменяет
+base_url, и запрос с заголовками авторизации интеграции ушёл бы на
+произвольный хост.
+"""
+import asyncio
+import random
+import time
+from array import array
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Автомат интеграции разомкнут, вызов не выполнялся."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"circuit open, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Размыкается после failure_threshold неудач подряд, через reset_timeout пропускает пробный вызов."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self, now: Optional[float] = None):
+        """Разрешает вызов или бросает CircuitOpenError."""
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN:
+            remaining = self._opened_at + self.reset_timeout - now
+            if remaining > 0:
+                raise CircuitOpenError(remaining)
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            # В полуоткрытом состоянии проверяем систему одним вызовом
+            if self._probe_in_flight:
+                raise CircuitOpenError(0.0)
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release(self):
+        """Вызов прерван без результата: пробный вызов можно повторить."""
+        self._probe_in_flight = False
+
+    def record_failure(self, now: Optional[float] = None):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self._opened_at = time.monotonic() if now is None else now
+
+
+class IntegrationStats:
+    """Счётчики вызовов и задержки последних window вызовов (для перцентилей)."""
+
+    __slots__ = ("calls", "successes", "failures", "retries", "rejected", "in_flight",
+                 "total_seconds", "max_seconds", "_window", "_next")
+
+    def __init__(self, window: int = 1024):
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._window = array("d", [0.0]) * window
+        self._next = 0
+
+    def observe(self, seconds: float, success: bool):
+        self.calls += 1
+        if success:
+            self.successes += 1
+        else:
+            self.failures += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self._window[self._next % len(self._window)] = seconds
+        self._next += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        count = min(self._next, len(self._window))
+        if not count:
+            return None
+        recent = sorted(self._window[:count])
+        return recent[min(int(q * count), count - 1)]
+
+    def to_dict(self) -> dict:
+        def ms(seconds: Optional[float]) -> Optional[float]:
+            return None if seconds is None else round(seconds * 1000, 3)
+        return {
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "in_flight": self.in_flight,
+            "latency_avg_ms": ms(self.total_seconds / self.calls) if self.calls else None,
+            "latency_p50_ms": ms(self.percentile(0.5)),
+            "latency_p95_ms": ms(self.percentile(0.95)),
+            "latency_p99_ms": ms(self.percentile(0.99)),
+            "latency_max_ms": ms(self.max_seconds) if self.calls else None,
+        }
+
+
+def _auth(auth_details: Dict) -> Dict[str, Any]:
+    """Параметры клиента из auth_details: token (Bearer), username/password (Basic), headers."""
+    headers = dict(auth_details.get("headers") or {})
+    if "token" in auth_details:
+        headers["Authorization"] = f"Bearer {auth_details['token']}"
+    options: Dict[str, Any] = {"headers": headers}
+    if "username" in auth_details:
+        options["auth"] = (auth_details["username"], auth_details.get("password", ""))
+    return options
+
+
+def check_path(path: str) -> str:
+    """Возвращает path, если он относительный; иначе бросает ValueError."""
+    parts = urlsplit(path)
+    if parts.scheme or parts.netloc or path.startswith("//"):
+        raise ValueError("path must be relative to the integration api_url")
+    return path
+
+
+class Connector:
+    """Клиент одной интеграции: пул соединений, лимит параллельности, повторы и автомат."""
+
+    def __init__(self, integration: dict, max_connections: int = 10, timeout: float = 10.0,
+                 retries: int = 2, backoff: float = 0.1, max_backoff: float = 2.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.integration_id = integration["integration_id"]
+        self.system_name = integration["system_name"]
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.stats = IntegrationStats()
+        self.max_connections = max_connections
+        self._client_options = dict(
+            base_url=integration["api_url"],
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+            transport=transport,
+            **_auth(integration.get("auth_details") or {})
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _http(self) -> httpx.AsyncClient:
+        # Соединения пула и семафор привязаны к циклу событий, в котором созданы
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._client is not None:
+                await self._close_stale(self._client)
+            self._client = httpx.AsyncClient(**self._client_options)
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+            self._loop = loop
+        return self._client
+
+    @staticmethod
+    async def _close_stale(client: httpx.AsyncClient):
+        try:
+            await client.aclose()
+        except RuntimeError:
+            # Соединения принадлежали уже закрытому циклу событий: сокеты закрыты вместе с ним
+            pass
+
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def request(self, method: str, path: str = "", retry: Optional[bool] = None, **kwargs) -> httpx.Response:
+        """Выполняет запрос к api_url + path; retry=None — повторять только идемпотентные методы.
+
+        Бросает ValueError для абсолютного path, CircuitOpenError без обращения к системе,
+        httpx.HTTPError при сетевой ошибке после всех попыток. Ответ 429/5xx после всех попыток
+        возвращается как есть.
+        """
+        check_path(path)
+        method = method.upper()
+        attempts = 1 + (self.retries if (method in IDEMPOTENT_METHODS if retry is None else retry) else 0)
+        # Клиент берётся до проверки автомата: ожидание закрытия старого не должно держать пробный вызов
+        client = await self._http()
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.stats.rejected += 1
+            raise
+        async with self._semaphore:
+            self.stats.in_flight += 1
+            started = time.perf_counter()
+            try:
+                for attempt in range(attempts):
+                    if attempt:
+                        self.stats.retries += 1
+                        await asyncio.sleep(self._delay(attempt - 1))
+                    try:
+                        response = await client.request(method, path, **kwargs)
+                    except httpx.TransportError:
+                        if attempt + 1 < attempts:
+                            continue
+                        raise
+                    if response.status_code not in RETRY_STATUSES or attempt + 1 == attempts:
+                        break
+                    await response.aclose()
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception:
+                self.stats.observe(time.perf_counter() - started, False)
+                self.breaker.record_failure()
+                raise
+            finally:
+                self.stats.in_flight -= 1
+        success = response.status_code < 500
+        self.stats.observe(time.perf_counter() - started, success)
+        if success:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        return response
+
+    def to_dict(self) -> dict:
+        return {"integration_id": self.integration_id, "system_name": self.system_name,
+                "circuit": self.breaker.state, **self.stats.to_dict()}
+
+    async def aclose(self):
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = self._loop = None
+
+
+class ConnectorPool:
+    """Коннекторы интеграций, создаваемые при первом вызове."""
+
+    def __init__(self, **connector_options):
+        self.connector_options = connector_options
+        self._connectors: Dict[int, Connector] = {}
+
+    def __len__(self) -> int:
+        return len(self._connectors)
+
+    def get(self, integration_id: int) -> Optional[Connector]:
+        return self._connectors.get(integration_id)
+
+    def connector(self, integration: dict) -> Connector:
+        connector = self._connectors.get(integration["integration_id"])
+        if connector is None:
+            connector = self._connectors[integration["integration_id"]] = Connector(integration, **self.connector_options)
+        return connector
+
+    def stats(self) -> List[dict]:
+        return [self._connectors[integration_id].to_dict() for integration_id in sorted(self._connectors)]
+
+    async def remove(self, integration_id: int):
+        connector = self._connectors.pop(integration_id, None)
+        if connector is not None:
+            await connector.aclose()
+
+    async def aclose(self):
+        connectors, self._connectors = list(self._connectors.values()), {}
+        await asyncio.gather(*(connector.aclose() for connector in connectors), return_exceptions=True)
+
+    def clear(self):
+        """Забывает коннекторы без закрытия (их циклы событий могут быть уже закрыты)."""
+        self._connectors.clear()
@@ -0,0 +1,75 @@
+"""Отслеживание живости агентов по heartbeat.
+
+Для каждого агента хранится время последнего heartbeat и не более одной
+записи в куче сроков (время последнего heartbeat + timeout). Heartbeat
+обновляет только время в словаре, поэтому стоит O(1). sweep извлекает из
+кучи лишь записи с наступившим сроком: если агент успел отправить heartbeat,
+запись возвращается в кучу с новым сроком, иначе агент помечается
+неживым. Проход не просматривает всех агентов на каждом шаге.
+"""
+import heapq
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class LivenessTracker:
+    """Времена последних heartbeat и куча сроков для поиска агентов без heartbeat."""
+
+    def __init__(self, timeout: float = 30.0):
+        self.timeout = timeout
+        self.clear()
+
+    def clear(self):
+        self._beats: Dict[int, float] = {}
+        self._heap: List[Tuple[float, int]] = []
+        # Агенты, у которых есть запись в куче
+        self._scheduled: Set[int] = set()
+        self._stale: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._beats)
+
+    @property
+    def stale(self) -> Set[int]:
+        """Агенты, помеченные неживыми при последних проходах sweep."""
+        return self._stale
+
+    def beat(self, agent_id: int, timestamp: Optional[float] = None):
+        """Регистрирует heartbeat агента (время в секундах от эпохи)."""
+        timestamp = time.time() if timestamp is None else timestamp
+        if timestamp <= self._beats.get(agent_id, float("-inf")):
+            return
+        self._beats[agent_id] = timestamp
+        self._stale.discard(agent_id)
+        if agent_id not in self._scheduled:
+            self._scheduled.add(agent_id)
+            heapq.heappush(self._heap, (timestamp + self.timeout, agent_id))
+
+    def forget(self, agent_id: int):
+        """Прекращает отслеживание агента (остановлен или удалён)."""
+        self._beats.pop(agent_id, None)
+        self._stale.discard(agent_id)
+
+    def last_beat(self, agent_id: int) -> Optional[float]:
+        return self._beats.get(agent_id)
+
+    def sweep(self, now: Optional[float] = None) -> List[int]:
+        """Помечает неживыми агентов без heartbeat дольше timeout и возвращает их id."""
+        now = time.time() if now is None else now
+        newly_stale = []
+        while self._heap and self._heap[0][0] <= now:
+            _, agent_id = heapq.heappop(self._heap)
+            last = self._beats.get(agent_id)
+            if last is None:
+                # Агента перестали отслеживать
+                self._scheduled.discard(agent_id)
+                continue
+            deadline = last + self.timeout
+            if deadline > now:
+                heapq.heappush(self._heap, (deadline, agent_id))
+            else:
+                # Следующий heartbeat снова поставит агента в кучу
+                self._scheduled.discard(agent_id)
+                self._stale.add(agent_id)
+                newly_stale.append(agent_id)
+        return newly_stale
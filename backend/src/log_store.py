@@ -0,0 +1,189 @@
+"""Структурированные логи приложения в кольцевом буфере.
+
+Последние capacity записей хранятся в памяти процесса. Запись стоит O(1):
+элемент кольца, добавление номера в индексы уровня и агента и, при
+заполнении, вытеснение самой старой записи из начала тех же индексов.
+Номера и время записей в каждом индексе возрастают, поэтому границы
+since/until находятся бинарным поиском, а выборка по агенту или уровню
+не просматривает чужие записи. При заданном файле записи дополнительно
+сбрасываются на диск в фоновом потоке с ротацией по размеру.
+"""
+import heapq
+import json
+import logging
+import logging.handlers
+import queue
+import time
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+LEVEL_NUMBERS = {name: number for number, name in enumerate(LEVELS)}
+
+
+class LogRecord:
+    __slots__ = ("seq", "timestamp", "level", "message", "agent_id", "task_id")
+
+    def __init__(self, seq: int, timestamp: float, level: int, message: str,
+                 agent_id: Optional[int], task_id: Optional[int]):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.level = level
+        self.message = message
+        self.agent_id = agent_id
+        self.task_id = task_id
+
+    def to_dict(self) -> dict:
+        return {
+            "timestamp": self.timestamp,
+            "level": LEVELS[self.level],
+            "message": self.message,
+            "agent_id": self.agent_id,
+            "task_id": self.task_id,
+        }
+
+
+class _Index:
+    """Возрастающие номера записей с их временем; начало списка отрезается при вытеснении."""
+
+    __slots__ = ("seqs", "times", "start")
+
+    def __init__(self):
+        self.seqs: List[int] = []
+        self.times: List[float] = []
+        self.start = 0
+
+    def __len__(self) -> int:
+        return len(self.seqs) - self.start
+
+    def append(self, seq: int, timestamp: float):
+        self.seqs.append(seq)
+        self.times.append(timestamp)
+
+    def pop_oldest(self):
+        self.start += 1
+        # Сжимаем списки, когда отрезанная часть становится больше живой
+        if self.start > 64 and self.start * 2 > len(self.seqs):
+            del self.seqs[:self.start]
+            del self.times[:self.start]
+            self.start = 0
+
+    def newest_first(self, since: Optional[float], until: Optional[float]) -> Iterator[int]:
+        """Номера записей с since <= время < until от новых к старым."""
+        lo = self.start if since is None else bisect_left(self.times, since, self.start)
+        hi = len(self.seqs) if until is None else bisect_left(self.times, until, lo)
+        seqs = self.seqs
+        for position in range(hi - 1, lo - 1, -1):
+            yield seqs[position]
+
+
+class LogStore:
+    """Кольцевой буфер записей с индексами по уровню и агенту."""
+
+    def __init__(self, capacity: int = 10000, spill: Optional["LogSpill"] = None):
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.spill = spill
+        self.clear()
+
+    def clear(self):
+        self._ring: List[Optional[LogRecord]] = [None] * self.capacity
+        self._next_seq = 0
+        self._last_timestamp = 0.0
+        self._by_level = [_Index() for _ in LEVELS]
+        self._by_agent: Dict[int, _Index] = {}
+
+    def __len__(self) -> int:
+        return min(self._next_seq, self.capacity)
+
+    def write(self, level: str, message: str, agent_id: Optional[int] = None, task_id: Optional[int] = None):
+        level_number = LEVEL_NUMBERS[level]
+        # Время не убывает, даже если системные часы перевели назад: на этом держится бинарный поиск
+        timestamp = max(time.time(), self._last_timestamp)
+        self._last_timestamp = timestamp
+        seq = self._next_seq
+        self._next_seq += 1
+        slot = seq % self.capacity
+        evicted = self._ring[slot]
+        if evicted is not None:
+            self._evict(evicted)
+        record = self._ring[slot] = LogRecord(seq, timestamp, level_number, message, agent_id, task_id)
+        self._by_level[level_number].append(seq, timestamp)
+        if agent_id is not None:
+            index = self._by_agent.get(agent_id)
+            if index is None:
+                index = self._by_agent[agent_id] = _Index()
+            index.append(seq, timestamp)
+        if self.spill is not None:
+            self.spill.put(record)
+
+    def _evict(self, record: LogRecord):
+        # Вытесняется самая старая запись, а она стоит первой в каждом своём индексе
+        self._by_level[record.level].pop_oldest()
+        if record.agent_id is not None:
+            index = self._by_agent[record.agent_id]
+            index.pop_oldest()
+            if not index:
+                del self._by_agent[record.agent_id]
+
+    def query(self, level: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+              agent_id: Optional[int] = None, limit: int = 100) -> List[dict]:
+        """Записи не ниже level (по агенту, в интервале [since, until)), от новых к старым, не больше limit."""
+        min_level = 0 if level is None else LEVEL_NUMBERS[level]
+        if agent_id is not None:
+            index = self._by_agent.get(agent_id)
+            candidates = iter(()) if index is None else index.newest_first(since, until)
+        else:
+            candidates = heapq.merge(
+                *(index.newest_first(since, until) for index in self._by_level[min_level:]),
+                reverse=True
+            )
+        result = []
+        for seq in candidates:
+            if len(result) >= limit:
+                break
+            record = self._ring[seq % self.capacity]
+            if record.level >= min_level:
+                result.append(record.to_dict())
+        return result
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = record.msg.to_dict()
+        entry["timestamp"] = datetime.utcfromtimestamp(entry["timestamp"]).isoformat()
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LogSpill:
+    """Фоновая запись логов в файл с ротацией по размеру (JSON Lines).
+
+    put только кладёт запись в очередь; файл пишет отдельный поток
+    logging.handlers.QueueListener.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+        self._queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        self.handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        self.handler.setFormatter(_JsonFormatter())
+        self._listener = logging.handlers.QueueListener(self._queue, self.handler)
+        self._started = False
+
+    def put(self, record: LogRecord):
+        self._queue.put_nowait(logging.makeLogRecord({"msg": record}))
+
+    def start(self):
+        if not self._started:
+            self._listener.start()
+            self._started = True
+
+    def stop(self):
+        """Дописывает накопленные записи и закрывает файл."""
+        if self._started:
+            self._listener.stop()
+            self._started = False
+        self.handler.close()
@@ -1,18 +1,53 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from fastapi.websockets import WebSocketState
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from typing import Any, List, Dict, Optional
 from datetime import datetime, timedelta
+import asyncio
+import json
+import os
+import time
+import httpx
 import jwt  # PyJWT для работы с токенами
 from enum import Enum
+from auth_cache import TokenCache
+from config_versions import JSON_PATCH_TYPE, MERGE_PATCH_TYPE, ConfigHistory, PatchError, diff, json_patch, merge_patch
+from coordination import CoordinationEngine
+from credentials import PasswordHasher
+from deadline_scheduler import DeadlineScheduler
+from delivery import DeliveryHub
+from event_bus import RECONNECTED, create_event_bus
+from integrations import CircuitOpenError, ConnectorPool, check_path
+from liveness import LivenessTracker
+from log_store import LogSpill, LogStore
+from message_store import SYSTEM_SENDER_ID, decode_cursor, encode_cursor, from_micros, to_micros
+from metrics_store import MetricsStore
+from storage import create_storage
+from task_queue import TaskQueue
+from telemetry import ProcessStats, RequestMetrics, metrics_route_class
 
 # Инициализация приложения FastAPI
 app = FastAPI(
     title="AI Agent Management System API",
-    description="API для управления ИИ-агентами: регистрация, жизненный цикл, мониторинг, задачи, коммуникация и интеграция.",
+    description=(
+        "API для управления ИИ-агентами: регистрация, жизненный цикл, мониторинг, задачи, коммуникация и интеграция.\n\n"
+        "При DATA_DIR (журнал с group commit) чтения видят изменения до их fsync (read uncommitted): "
+        "ответ на запись приходит после fsync, но параллельный запрос может прочитать запись, "
+        "которая пропадёт при сбое процесса до fsync."
+    ),
     version="1.0.0"
 )
 
+# Счётчики и гистограммы задержек запросов по маршрутам, метрики процесса
+request_metrics = RequestMetrics()
+process_stats = ProcessStats()
+# Учёт встроен в маршруты: класс назначается до объявления первого из них
+app.router.route_class = metrics_route_class(request_metrics)
+app.router.default = request_metrics.count_unmatched(app.router.default)
+
 # Конфигурация для JWT
 SECRET_KEY = "your-secret-key"  # Замените на безопасный ключ
 ALGORITHM = "HS256"
@@ -31,6 +66,40 @@ class TaskStatus(str, Enum):
     PENDING = "pending"
     IN_PROGRESS = "in_progress"
     COMPLETED = "completed"
+    EXPIRED = "expired"
+
+class Liveness(str, Enum):
+    ALIVE = "alive"
+    STALE = "stale"
+    UNKNOWN = "unknown"
+
+class LogLevel(str, Enum):
+    DEBUG = "DEBUG"
+    INFO = "INFO"
+    WARNING = "WARNING"
+    ERROR = "ERROR"
+    CRITICAL = "CRITICAL"
+
+class AgentAction(str, Enum):
+    START = "start"
+    STOP = "stop"
+    RESTART = "restart"
+    DELETE = "delete"
+
+class AgentSortField(str, Enum):
+    AGENT_ID = "agent_id"
+    AGENT_TYPE = "agent_type"
+    PRIORITY_LEVEL = "priority_level"
+    LAST_HEARTBEAT = "last_heartbeat"
+
+class SortOrder(str, Enum):
+    ASC = "asc"
+    DESC = "desc"
+
+class ExportCollection(str, Enum):
+    MESSAGES = "messages"
+    TASKS = "tasks"
+    AGENTS = "agents"
 
 # Модели данных (Pydantic)
 class AgentCreate(BaseModel):
@@ -53,19 +122,89 @@ class AgentResponse(BaseModel):
     agent_id: int
     message: str
 
+class AgentInfo(BaseModel):
+    agent_id: int
+    agent_type: str
+    status: AgentStatus
+    priority_level: int
+    last_heartbeat: datetime
+
+class AgentListResponse(BaseModel):
+    total: int = Field(..., description="Число агентов, подходящих под фильтры")
+    agents: List[AgentInfo]
+
+class AgentBatchCreate(BaseModel):
+    agents: List[Dict] = Field(..., description="Описания агентов в формате AgentCreate")
+
+class AgentSelector(BaseModel):
+    agent_type: Optional[str] = None
+    status: Optional[AgentStatus] = None
+    priority_level: Optional[int] = Field(None, ge=1, le=3)
+
+class AgentBulkAction(BaseModel):
+    action: AgentAction
+    agent_ids: Optional[List[int]] = Field(None, description="Явный список агентов")
+    selector: Optional[AgentSelector] = Field(None, description="Отбор агентов по полям вместо списка")
+
+class BatchItemResult(BaseModel):
+    index: int
+    agent_id: Optional[int] = None
+    success: bool
+    message: str
+
+class BatchResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BatchItemResult]
+
 class AgentStatusResponse(BaseModel):
     agent_id: int
     status: AgentStatus
     last_heartbeat: datetime
+    liveness: Liveness = Field(..., description="alive/stale по давности heartbeat; unknown для неактивных агентов")
+
+class HeartbeatBatch(BaseModel):
+    agent_ids: List[int] = Field(..., description="Агенты, от которых получен heartbeat")
+
+class HeartbeatResponse(BaseModel):
+    accepted: int
+    unknown: List[int] = Field(..., description="id, для которых агент не найден")
 
 class Metric(BaseModel):
     metric_type: str = Field(..., max_length=50, description="Тип метрики (например, CPU, Memory)")
     value: float
+    timestamp: Optional[datetime] = Field(None, description="Время измерения (по умолчанию — время приёма)")
 
 class AgentMetricsResponse(BaseModel):
     agent_id: int
     metrics: List[Metric]
 
+class MetricBatch(BaseModel):
+    metrics: List[Metric] = Field(..., description="Точки метрик; внутри одного типа время не должно убывать")
+
+class MetricIngestResponse(BaseModel):
+    agent_id: int
+    accepted: int
+    rejected: int = Field(..., description="Точки старше последней записанной или сверх лимита типов метрик")
+
+class MetricBucket(BaseModel):
+    timestamp: datetime = Field(..., description="Начало интервала")
+    min: float
+    max: float
+    avg: float
+    count: int
+
+class MetricSummary(BaseModel):
+    metric_type: str
+    buckets: List[MetricBucket]
+
+class AgentMetricsSummary(BaseModel):
+    agent_id: int
+    since: datetime
+    until: datetime
+    step: float
+    series: List[MetricSummary]
+
 class MessageCreate(BaseModel):
     sender_id: int
     receiver_id: int
@@ -75,9 +214,26 @@ class MessageResponse(BaseModel):
     message_id: int
     timestamp: datetime
 
+class MessageInfo(BaseModel):
+    message_id: int
+    sender_id: int
+    receiver_id: int
+    content: str
+    timestamp: datetime
+
 class MessageListResponse(BaseModel):
     agent_id: int
-    messages: List[Dict[str, str]]
+    messages: List[MessageInfo]
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы (нет, если страница последняя)")
+
+class Delivery(BaseModel):
+    seq: int = Field(..., description="Номер доставки в ящике агента; передаётся в ack")
+    message: MessageInfo
+
+class DeliveryBatch(BaseModel):
+    agent_id: int
+    deliveries: List[Delivery]
+    dropped: int = Field(0, description="Сколько сообщений отброшено при переполнении ящика (догрузить через GET /messages)")
 
 class TaskCreate(BaseModel):
     priority: int = Field(..., ge=1, le=5, description="Приоритет задачи (1-5)")
@@ -85,6 +241,14 @@ class TaskCreate(BaseModel):
     deadline: datetime
     status: TaskStatus
 
+    @field_validator("status")
+    @classmethod
+    def not_in_progress(cls, task_status):
+        # В работу задача попадает только через claim: без аренды её нельзя было бы ни завершить, ни вернуть в очередь
+        if task_status == TaskStatus.IN_PROGRESS:
+            raise ValueError("tasks enter in_progress only via /agents/{agent_id}/tasks/claim")
+        return task_status
+
 class TaskResponse(BaseModel):
     task_id: int
     message: str
@@ -96,17 +260,58 @@ class TaskInfo(BaseModel):
     deadline: datetime
     status: TaskStatus
 
+class TaskListResponse(BaseModel):
+    tasks: List[TaskInfo]
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы (нет, если страница последняя)")
+
+class TaskLease(TaskInfo):
+    lease_expires_at: datetime
+
 class CoordinationRequest(BaseModel):
     agents: List[int]
     action: str
+    ack_timeout: float = Field(60, gt=0, le=86400, description="Срок подтверждения действия агентами, секунд (не больше суток)")
 
 class CoordinationResponse(BaseModel):
     coordination_id: int
     message: str
+    delivered: int = 0
+    failed: int = 0
+
+class CoordinationAck(BaseModel):
+    agent_id: int
+    success: bool = True
+
+class CoordinationParticipant(BaseModel):
+    agent_id: int
+    state: str
+    updated_at: datetime
+
+class CoordinationStatus(BaseModel):
+    coordination_id: int
+    action: str
+    status: str = Field(..., description="in_progress, completed или timed_out")
+    created_at: datetime
+    deadline: datetime
+    total: int
+    counts: Dict[str, int]
+    participants: Optional[List[CoordinationParticipant]] = None
 
 class ConfigurationUpdate(BaseModel):
     configuration: Dict
 
+class AgentConfig(BaseModel):
+    agent_id: int
+    version: int
+    configuration: Optional[Dict] = Field(None, description="Полная конфигурация (если не запрошены только изменения)")
+    since_version: Optional[int] = None
+    patch: Optional[List[Dict]] = Field(None, description="Операции JSON Patch от since_version до version")
+
+class ConfigVersionResponse(BaseModel):
+    agent_id: int
+    version: int
+    message: str
+
 class IntegrationCreate(BaseModel):
     system_name: str
     api_url: str
@@ -121,6 +326,41 @@ class IntegrationInfo(BaseModel):
     system_name: str
     api_url: str
 
+class IntegrationCall(BaseModel):
+    method: str = "GET"
+    path: str = Field("", description="Путь относительно api_url интеграции (без схемы и хоста)")
+    params: Dict[str, str] = {}
+    body: Optional[Any] = Field(None, description="Тело запроса (JSON)")
+    retry: Optional[bool] = Field(None, description="Повторять при сбоях; по умолчанию только идемпотентные методы")
+
+    @field_validator("path")
+    @classmethod
+    def relative_path(cls, path: str) -> str:
+        # Абсолютный URL заменил бы api_url, и заголовки авторизации интеграции ушли бы на чужой хост
+        return check_path(path)
+
+class IntegrationCallResult(BaseModel):
+    integration_id: int
+    status_code: int
+    body: Any
+    elapsed_ms: float
+
+class IntegrationStats(BaseModel):
+    integration_id: int
+    system_name: str
+    circuit: str = Field(..., description="closed, open или half_open")
+    calls: int
+    successes: int
+    failures: int
+    retries: int
+    rejected: int = Field(..., description="Вызовы, отклонённые разомкнутым автоматом")
+    in_flight: int
+    latency_avg_ms: Optional[float]
+    latency_p50_ms: Optional[float]
+    latency_p95_ms: Optional[float]
+    latency_p99_ms: Optional[float]
+    latency_max_ms: Optional[float]
+
 class UserCreate(BaseModel):
     username: str
     password: str
@@ -135,6 +375,10 @@ class UserInfo(BaseModel):
     username: str
     role: str
 
+class UserListResponse(BaseModel):
+    total: int
+    users: List[UserInfo]
+
 class Role(BaseModel):
     role_id: int
     role_name: str
@@ -143,13 +387,165 @@ class LogEntry(BaseModel):
     timestamp: datetime
     level: str
     message: str
+    agent_id: Optional[int] = None
+    task_id: Optional[int] = None
 
 class SystemMetrics(BaseModel):
-    cpu_usage: float
-    memory_usage: float
+    cpu_usage: float = Field(..., description="Загрузка CPU процессом с предыдущего запроса, % одного ядра")
+    memory_usage: float = Field(..., description="Резидентная память процесса (RSS), МБ")
     active_agents: int
+    agents_by_status: Dict[str, int] = Field(default_factory=dict, description="Число агентов в каждом статусе")
+    stale_agents: int = Field(0, description="Агенты, помеченные неживыми фоновой проверкой heartbeat")
+
+# Хранилище данных: в памяти по умолчанию, PostgreSQL при заданном DATABASE_URL
+storage = create_storage()
+
+# Журнал событий приложения: последние LOG_BUFFER_SIZE записей в памяти, при заданном LOG_FILE — ещё и в файле
+log_store = LogStore(
+    capacity=int(os.getenv("LOG_BUFFER_SIZE", "10000")),
+    spill=LogSpill(
+        os.environ["LOG_FILE"],
+        max_bytes=int(os.getenv("LOG_FILE_MAX_BYTES", str(10 * 1024 * 1024))),
+        backup_count=int(os.getenv("LOG_FILE_BACKUPS", "5"))
+    ) if os.getenv("LOG_FILE") else None
+)
+
+# Почтовые ящики для доставки сообщений через long-poll и WebSocket
+delivery_hub = DeliveryHub(capacity=int(os.getenv("MAILBOX_CAPACITY", "1000")))
+
+# Шина событий, по которой воркеры согласуют очереди, индексы, кэши и почтовые ящики в памяти;
+# при заданном EVENT_BUS_SOCKET события доходят до всех воркеров хоста через Unix-сокет
+event_bus = create_event_bus(
+    on_error=lambda topic, exc: log_store.write("ERROR", f"Event handler for {topic} failed: {exc!r}")
+)
+
+def publish_messages(messages: List[dict]):
+    """Передаёт сохранённые сообщения в почтовые ящики получателей во всех воркерах."""
+    event_bus.publish("messages.sent", {
+        "messages": [{**message, "timestamp": message["timestamp"].isoformat()} for message in messages]
+    })
+
+# Метрики агентов в кольцевых буферах (METRICS_BUFFER_SIZE точек на каждый из METRICS_MAX_TYPES типов)
+metrics_store = MetricsStore(
+    capacity=int(os.getenv("METRICS_BUFFER_SIZE", "1024")),
+    max_types=int(os.getenv("METRICS_MAX_TYPES", "32"))
+)
+MAX_METRIC_BUCKETS = 1000
+
+# Очередь задач на исполнение; строится из хранилища при запуске
+task_queue = TaskQueue()
+DEFAULT_LEASE_SECONDS = 300
 
-fake_db = {"users": {}, "agents": {}, "tasks": {}, "messages": {}, "integrations": {}} # Пока нет бд и агентов выыглядит так
+# Сроки незавершённых задач; просроченные переводятся в expired
+deadline_scheduler = DeadlineScheduler()
+# Рассылка действий координации порциями по COORDINATION_CHUNK_SIZE агентов
+coordination_engine = CoordinationEngine(
+    storage, publish_messages, sender_id=SYSTEM_SENDER_ID,
+    chunk_size=int(os.getenv("COORDINATION_CHUNK_SIZE", "500")),
+    delivery_timeout=float(os.getenv("COORDINATION_DELIVERY_TIMEOUT", "5"))
+)
+MAX_COORDINATION_AGENTS = 100000
+
+# Хэширование паролей в пуле потоков; стоимость настраивается, старые записи перехэшируются при входе
+password_hasher = PasswordHasher(
+    scheme=os.getenv("PASSWORD_HASH_SCHEME", "scrypt"),
+    scrypt_n=int(os.getenv("SCRYPT_N", str(2 ** 14))),
+    scrypt_r=int(os.getenv("SCRYPT_R", "8")),
+    scrypt_p=int(os.getenv("SCRYPT_P", "1")),
+    pbkdf2_iterations=int(os.getenv("PBKDF2_ITERATIONS", "600000")),
+    # Больше потоков, чем ядер, не ускоряет вход, а отнимает процессор у остальных запросов
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+)
+
+# Последние версии конфигураций для ответов с since_version
+config_history = ConfigHistory(max_versions=int(os.getenv("CONFIG_HISTORY_SIZE", "32")))
+# Попытки применить PATCH, если конфигурацию параллельно изменили
+CONFIG_PATCH_ATTEMPTS = 5
+
+# Пулы соединений к внешним системам, по одному на интеграцию
+integration_pool = ConnectorPool(
+    max_connections=int(os.getenv("INTEGRATION_MAX_CONNECTIONS", "10")),
+    timeout=float(os.getenv("INTEGRATION_TIMEOUT", "10")),
+    retries=int(os.getenv("INTEGRATION_RETRIES", "2")),
+    failure_threshold=int(os.getenv("INTEGRATION_FAILURE_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("INTEGRATION_RESET_TIMEOUT", "30"))
+)
+
+# Живость агентов: агент без heartbeat дольше HEARTBEAT_TIMEOUT секунд считается неживым
+liveness_tracker = LivenessTracker(timeout=float(os.getenv("HEARTBEAT_TIMEOUT", "30")))
+HEARTBEAT_SWEEP_INTERVAL = float(os.getenv("HEARTBEAT_SWEEP_INTERVAL", "5"))
+# Как часто задачи с истёкшей арендой возвращаются в очередь без обращений к claim
+LEASE_SWEEP_INTERVAL = float(os.getenv("LEASE_SWEEP_INTERVAL", "1"))
+MAX_HEARTBEAT_BATCH = 10000
+
+background_tasks: List[asyncio.Task] = []
+EVENT_BUS_CONNECT_TIMEOUT = float(os.getenv("EVENT_BUS_CONNECT_TIMEOUT", "5"))
+
+@app.on_event("startup")
+async def connect_storage():
+    if log_store.spill is not None:
+        log_store.spill.start()
+    await storage.connect()
+    await event_bus.start()
+    # Состояние читается из хранилища после подписки на события других воркеров, иначе часть из них потерялась бы
+    try:
+        await event_bus.wait_connected(EVENT_BUS_CONNECT_TIMEOUT)
+    except asyncio.TimeoutError:
+        log_store.write("WARNING", "Event bus not connected, in-memory indexes will be reloaded once it connects")
+    await load_task_queue()
+    await load_liveness()
+    background_tasks.append(asyncio.create_task(liveness_sweeper()))
+    background_tasks.append(asyncio.create_task(lease_sweeper()))
+    background_tasks.append(asyncio.create_task(deadline_scheduler.run(expire_tasks)))
+
+async def load_task_queue():
+    """Заполняет очередь ожидающими задачами; задачи в работе получают новую аренду."""
+    lease_expires_at = time.time() + DEFAULT_LEASE_SECONDS
+    async for batch in storage.iter_records("tasks"):
+        for task_id, task in batch:
+            task = {"task_id": task_id, **task}
+            if task["status"] == TaskStatus.PENDING:
+                task_queue.push(task)
+            elif task["status"] == TaskStatus.IN_PROGRESS:
+                task_queue.restore_lease(task, lease_expires_at)
+            else:
+                continue
+            deadline_scheduler.schedule(task_id, _epoch(task["deadline"]))
+
+async def load_liveness():
+    """Начинает отслеживать активных агентов с их последнего heartbeat из хранилища."""
+    async for batch in storage.iter_records("agents"):
+        for agent_id, agent in batch:
+            if agent["status"] == AgentStatus.ACTIVE:
+                liveness_tracker.beat(agent_id, to_micros(agent["last_heartbeat"]) / 1_000_000)
+
+async def liveness_sweeper():
+    while True:
+        await asyncio.sleep(HEARTBEAT_SWEEP_INTERVAL)
+        for agent_id in liveness_tracker.sweep():
+            log_store.write("WARNING", "Agent missed heartbeats", agent_id=agent_id)
+
+async def lease_sweeper():
+    while True:
+        await asyncio.sleep(LEASE_SWEEP_INTERVAL)
+        try:
+            await requeue_expired_tasks()
+        except Exception as exc:
+            # Сбой хранилища не должен останавливать возврат задач в очередь
+            log_store.write("ERROR", f"Lease sweep failed: {exc!r}")
+
+@app.on_event("shutdown")
+async def close_storage():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await event_bus.close()
+    await integration_pool.aclose()
+    password_hasher.close()
+    await storage.close()
+    if log_store.spill is not None:
+        log_store.spill.stop()
 
 # Функция создания JWT-токена
 def create_access_token(data: dict, expires_delta: timedelta):
@@ -159,143 +555,577 @@ def create_access_token(data: dict, expires_delta: timedelta):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Кэш проверенных токенов (AUTH_CACHE_SIZE=0 отключает кэширование)
+token_cache = TokenCache(max_size=int(os.getenv("AUTH_CACHE_SIZE", "10000")))
+
 # Проверка токена и получение текущего пользователя
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username not in fake_db["users"]:
+        user = await storage.get_user(username)
+        if user is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        return {"username": username, "role": fake_db["users"][username]["role"]}
+        current_user = {"username": username, "role": user["role"], "user_id": user["user_id"]}
+        token_cache.put(token, current_user, payload.get("exp"))
+        return current_user
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# Обработчики событий шины. Каждый обновляет состояние в памяти своего воркера: опубликовавший
+# воркер применяет событие внутри publish, остальные — при получении. Полезная нагрузка — JSON
+def on_agents_active(event: dict):
+    for agent_id in event["agent_ids"]:
+        liveness_tracker.beat(agent_id, event["timestamp"])
+
+def on_agents_stopped(event: dict):
+    for agent_id in event["agent_ids"]:
+        liveness_tracker.forget(agent_id)
+
+def on_agents_deleted(event: dict):
+    for agent_id in event["agent_ids"]:
+        task_queue.drop_agent(agent_id)
+        delivery_hub.drop_agent(agent_id)
+        metrics_store.drop_agent(agent_id)
+        liveness_tracker.forget(agent_id)
+        config_history.forget(agent_id)
+
+def on_messages_sent(event: dict):
+    delivery_hub.publish_many(event["messages"])
+
+def task_event(task_id: int, agent_id: int, priority: int, deadline: datetime, status: str) -> dict:
+    return {"task_id": task_id, "assigned_agent_id": agent_id, "priority": priority,
+            "deadline": to_micros(deadline), "status": status}
+
+def _event_task(event: dict) -> dict:
+    return {**event["task"], "deadline": from_micros(event["task"]["deadline"])}
+
+def on_task_created(event: dict):
+    task = _event_task(event)
+    if task["status"] == TaskStatus.PENDING:
+        task_queue.push(task)
+    if task["status"] in (TaskStatus.PENDING, TaskStatus.IN_PROGRESS):
+        deadline_scheduler.schedule(task["task_id"], _epoch(task["deadline"]))
+
+def on_task_claimed(event: dict):
+    task_queue.track_lease(_event_task(event), event["expires_at"])
+
+def on_task_requeued(event: dict):
+    task = _event_task(event)
+    task_queue.discard(task["task_id"])
+    task_queue.push(task)
+
+def on_tasks_finished(event: dict):
+    for task_id in event["task_ids"]:
+        task_queue.discard(task_id)
+        deadline_scheduler.cancel(task_id)
+
+def on_configs_updated(event: dict):
+    for version, configuration in event["versions"]:
+        config_history.record(event["agent_id"], version, configuration)
+
+def on_user_changed(event: dict):
+    token_cache.invalidate_user(event["user_id"])
+
+def on_bus_reconnected(event: dict):
+    # Пока связи не было, события других воркеров могли быть пропущены: состояние перечитывается из хранилища
+    token_cache.clear()
+    background_tasks.append(asyncio.ensure_future(reload_indexes()))
+
+async def reload_indexes():
+    task_queue.clear()
+    deadline_scheduler.clear()
+    liveness_tracker.clear()
+    await load_task_queue()
+    await load_liveness()
+    log_store.write("WARNING", "Event bus reconnected, in-memory indexes reloaded from storage")
+
+for topic, handler in (
+    ("agents.active", on_agents_active),
+    ("agents.stopped", on_agents_stopped),
+    ("agents.deleted", on_agents_deleted),
+    ("messages.sent", on_messages_sent),
+    ("tasks.created", on_task_created),
+    ("tasks.claimed", on_task_claimed),
+    ("tasks.requeued", on_task_requeued),
+    ("tasks.finished", on_tasks_finished),
+    ("configs.updated", on_configs_updated),
+    ("users.changed", on_user_changed),
+    (RECONNECTED, on_bus_reconnected),
+):
+    event_bus.subscribe(topic, handler)
+
 # 1. Регистрация агентов
 @app.post("/agents", response_model=AgentResponse, summary="Регистрация нового агента")
 async def register_agent(agent: AgentCreate, current_user: dict = Depends(get_current_user)):
     """Регистрирует нового агента в системе."""
-    agent_id = len(fake_db["agents"]) + 1
-    fake_db["agents"][agent_id] = {
+    agent_id = await storage.add_agent({
         "agent_type": agent.agent_type,
         "status": agent.status,
         "priority_level": agent.priority_level,
         "configuration": agent.configuration,
         "last_heartbeat": datetime.utcnow()
-    }
+    })
+    if agent.status == AgentStatus.ACTIVE:
+        event_bus.publish("agents.active", {"agent_ids": [agent_id], "timestamp": time.time()})
+    log_store.write("INFO", "Agent registered", agent_id=agent_id)
     return {"agent_id": agent_id, "message": "Agent registered successfully"}
 
+@app.get("/agents", response_model=AgentListResponse, summary="Список агентов")
+async def list_agents(
+    agent_type: Optional[str] = Query(None, max_length=255),
+    status: Optional[AgentStatus] = None,
+    priority_level: Optional[int] = Query(None, ge=1, le=3),
+    sort_by: AgentSortField = AgentSortField.AGENT_ID,
+    order: SortOrder = SortOrder.ASC,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user)
+):
+    """Возвращает агентов, подходящих под фильтры, с сортировкой и постраничной выдачей."""
+    filters = {
+        field: value.value if isinstance(value, Enum) else value
+        for field, value in (("agent_type", agent_type), ("status", status), ("priority_level", priority_level))
+        if value is not None
+    }
+    total, agents = await storage.list_agents(
+        filters, sort_by=sort_by.value, descending=order == SortOrder.DESC, limit=limit, offset=offset
+    )
+    return {"total": total, "agents": agents}
+
 # 2. Управление жизненным циклом агентов
 @app.post("/agents/{agent_id}/start", response_model=AgentResponse, summary="Запуск агента")
 async def start_agent(agent_id: int, current_user: dict = Depends(get_current_user)):
     """Запускает указанного агента."""
-    if agent_id not in fake_db["agents"]:
+    if not await storage.update_agent(agent_id, {"status": AgentStatus.ACTIVE, "last_heartbeat": datetime.utcnow()}):
         raise HTTPException(status_code=404, detail="Agent not found")
-    fake_db["agents"][agent_id]["status"] = AgentStatus.ACTIVE
-    fake_db["agents"][agent_id]["last_heartbeat"] = datetime.utcnow()
+    event_bus.publish("agents.active", {"agent_ids": [agent_id], "timestamp": time.time()})
+    log_store.write("INFO", "Agent started", agent_id=agent_id)
     return {"agent_id": agent_id, "message": "Agent started successfully"}
 
 @app.post("/agents/{agent_id}/stop", response_model=AgentResponse, summary="Остановка агента")
 async def stop_agent(agent_id: int, current_user: dict = Depends(get_current_user)):
     """Останавливает указанного агента."""
-    if agent_id not in fake_db["agents"]:
+    if not await storage.update_agent(agent_id, {"status": AgentStatus.STOPPED}):
         raise HTTPException(status_code=404, detail="Agent not found")
-    fake_db["agents"][agent_id]["status"] = AgentStatus.STOPPED
+    event_bus.publish("agents.stopped", {"agent_ids": [agent_id]})
+    log_store.write("INFO", "Agent stopped", agent_id=agent_id)
     return {"agent_id": agent_id, "message": "Agent stopped successfully"}
 
 @app.post("/agents/{agent_id}/restart", response_model=AgentResponse, summary="Перезапуск агента")
 async def restart_agent(agent_id: int, current_user: dict = Depends(get_current_user)):
     """Перезапускает указанного агента."""
-    if agent_id not in fake_db["agents"]:
+    if not await storage.update_agent(agent_id, {"status": AgentStatus.ACTIVE, "last_heartbeat": datetime.utcnow()}):
         raise HTTPException(status_code=404, detail="Agent not found")
-    fake_db["agents"][agent_id]["status"] = AgentStatus.ACTIVE
-    fake_db["agents"][agent_id]["last_heartbeat"] = datetime.utcnow()
+    event_bus.publish("agents.active", {"agent_ids": [agent_id], "timestamp": time.time()})
+    log_store.write("INFO", "Agent restarted", agent_id=agent_id)
     return {"agent_id": agent_id, "message": "Agent restarted successfully"}
 
 @app.delete("/agents/{agent_id}", response_model=AgentResponse, summary="Удаление агента")
 async def delete_agent(agent_id: int, current_user: dict = Depends(get_current_user)):
-    """Удаляет указанного агента из системы."""
-    if agent_id not in fake_db["agents"]:
+    """Удаляет указанного агента из системы.
+
+    Вместе с агентом удаляются все сообщения, которые он отправил или получил, — в том числе
+    из истории его собеседников.
+    """
+    if not await storage.delete_agent(agent_id):
         raise HTTPException(status_code=404, detail="Agent not found")
-    del fake_db["agents"][agent_id]
+    event_bus.publish("agents.deleted", {"agent_ids": [agent_id]})
+    log_store.write("INFO", "Agent deleted", agent_id=agent_id)
     return {"agent_id": agent_id, "message": "Agent deleted successfully"}
 
+MAX_BATCH_SIZE = 1000
+
+BULK_ACTION_MESSAGES = {
+    AgentAction.START: "Agent started successfully",
+    AgentAction.STOP: "Agent stopped successfully",
+    AgentAction.RESTART: "Agent restarted successfully",
+    AgentAction.DELETE: "Agent deleted successfully",
+}
+
+def _batch_response(results: List[dict]) -> dict:
+    succeeded = sum(1 for r in results if r["success"])
+    return {"succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+
+@app.post("/agents/batch", response_model=BatchResponse, summary="Пакетная регистрация агентов")
+async def register_agents_batch(batch: AgentBatchCreate, current_user: dict = Depends(get_current_user)):
+    """Регистрирует несколько агентов одной транзакцией; некорректные элементы пропускаются с ошибкой."""
+    if len(batch.agents) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=422, detail=f"Batch size exceeds {MAX_BATCH_SIZE}")
+    results, rows = [], []
+    now = datetime.utcnow()
+    for index, item in enumerate(batch.agents):
+        try:
+            agent = AgentCreate(**item)
+        except ValidationError as exc:
+            results.append({"index": index, "success": False, "message": str(exc.errors()[0]["msg"])})
+            continue
+        results.append({"index": index, "success": True, "message": "Agent registered successfully"})
+        rows.append({
+            "agent_type": agent.agent_type,
+            "status": agent.status,
+            "priority_level": agent.priority_level,
+            "configuration": agent.configuration,
+            "last_heartbeat": now
+        })
+    agent_ids = iter(await storage.add_agents(rows))
+    active = []
+    for result, row in zip((r for r in results if r["success"]), rows):
+        result["agent_id"] = next(agent_ids)
+        if row["status"] == AgentStatus.ACTIVE:
+            active.append(result["agent_id"])
+    if active:
+        event_bus.publish("agents.active", {"agent_ids": active, "timestamp": time.time()})
+    log_store.write("INFO", f"Batch registration: {len(rows)} of {len(results)} agents registered")
+    return _batch_response(results)
+
+@app.post("/agents/bulk", response_model=BatchResponse, summary="Массовое управление жизненным циклом агентов")
+async def bulk_agent_action(bulk: AgentBulkAction, current_user: dict = Depends(get_current_user)):
+    """Запускает, останавливает, перезапускает или удаляет агентов по списку id или селектору одной транзакцией."""
+    if (bulk.agent_ids is None) == (bulk.selector is None):
+        raise HTTPException(status_code=422, detail="Specify either agent_ids or selector")
+    if bulk.agent_ids is not None and len(bulk.agent_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=422, detail=f"Batch size exceeds {MAX_BATCH_SIZE}")
+    selector = None
+    if bulk.selector is not None:
+        selector = {
+            field: getattr(bulk.selector, field)
+            for field in ("agent_type", "status", "priority_level")
+            if getattr(bulk.selector, field) is not None
+        }
+        if not selector:
+            raise HTTPException(status_code=422, detail="Selector must contain at least one field")
+    if bulk.action == AgentAction.DELETE:
+        affected = await storage.delete_agents(agent_ids=bulk.agent_ids, selector=selector)
+        topic, event = "agents.deleted", {}
+    elif bulk.action == AgentAction.STOP:
+        affected = await storage.update_agents({"status": AgentStatus.STOPPED}, agent_ids=bulk.agent_ids, selector=selector)
+        topic, event = "agents.stopped", {}
+    else:
+        affected = await storage.update_agents(
+            {"status": AgentStatus.ACTIVE, "last_heartbeat": datetime.utcnow()},
+            agent_ids=bulk.agent_ids, selector=selector
+        )
+        topic, event = "agents.active", {"timestamp": time.time()}
+    # Пустое событие лишь будило бы обработчики всех воркеров
+    if affected:
+        event_bus.publish(topic, {"agent_ids": affected, **event})
+    log_store.write("INFO", f"Bulk {bulk.action.value}: {len(affected)} agents")
+    done = BULK_ACTION_MESSAGES[bulk.action]
+    if bulk.agent_ids is None:
+        return _batch_response([
+            {"index": index, "agent_id": agent_id, "success": True, "message": done}
+            for index, agent_id in enumerate(affected)
+        ])
+    affected = set(affected)
+    return _batch_response([
+        {"index": index, "agent_id": agent_id, "success": agent_id in affected,
+         "message": done if agent_id in affected else "Agent not found"}
+        for index, agent_id in enumerate(bulk.agent_ids)
+    ])
+
 # 3. Мониторинг агентов
 @app.get("/agents/{agent_id}/status", response_model=AgentStatusResponse, summary="Получение статуса агента")
 async def get_agent_status(agent_id: int, current_user: dict = Depends(get_current_user)):
     """Возвращает текущий статус и время последнего обновления агента."""
-    if agent_id not in fake_db["agents"]:
+    agent = await storage.get_agent(agent_id)
+    if agent is None:
         raise HTTPException(status_code=404, detail="Agent not found")
-    agent = fake_db["agents"][agent_id]
     return {
         "agent_id": agent_id,
         "status": agent["status"],
-        "last_heartbeat": agent["last_heartbeat"]
+        "last_heartbeat": agent["last_heartbeat"],
+        "liveness": _liveness(agent)
+    }
+
+def _liveness(agent: dict) -> Liveness:
+    # Считается по времени из хранилища, поэтому heartbeat, принятый другим воркером, тоже учитывается
+    if agent["status"] != AgentStatus.ACTIVE:
+        return Liveness.UNKNOWN
+    if time.time() - _epoch(agent["last_heartbeat"]) > liveness_tracker.timeout:
+        return Liveness.STALE
+    return Liveness.ALIVE
+
+@app.post("/agents/heartbeats", response_model=HeartbeatResponse, summary="Пакетный приём heartbeat агентов")
+async def receive_heartbeats(batch: HeartbeatBatch, current_user: dict = Depends(get_current_user)):
+    """Обновляет время последнего heartbeat для агентов из списка одним обновлением хранилища."""
+    if len(batch.agent_ids) > MAX_HEARTBEAT_BATCH:
+        raise HTTPException(status_code=422, detail=f"Batch size exceeds {MAX_HEARTBEAT_BATCH}")
+    now = datetime.utcnow()
+    fields = {"last_heartbeat": now}
+    # Живость отслеживается только у активных агентов: heartbeat остановленных лишь записывается
+    active = await storage.update_agents(fields, agent_ids=batch.agent_ids, selector={"status": AgentStatus.ACTIVE.value})
+    active_set = set(active)
+    rest = [agent_id for agent_id in batch.agent_ids if agent_id not in active_set]
+    accepted = active + (await storage.update_agents(fields, agent_ids=rest) if rest else [])
+    if active:
+        event_bus.publish("agents.active", {"agent_ids": active, "timestamp": _epoch(now)})
+    accepted_set = set(accepted)
+    return {
+        "accepted": len(accepted),
+        "unknown": [agent_id for agent_id in dict.fromkeys(batch.agent_ids) if agent_id not in accepted_set]
     }
 
+def _epoch(moment: datetime) -> float:
+    return to_micros(moment) / 1_000_000
+
+def _from_epoch(seconds: float) -> datetime:
+    return from_micros(round(seconds * 1_000_000))
+
+@app.post("/agents/{agent_id}/metrics", response_model=MetricIngestResponse, summary="Передача метрик агента")
+async def ingest_agent_metrics(agent_id: int, batch: MetricBatch, current_user: dict = Depends(get_current_user)):
+    """Записывает пакет точек метрик агента в кольцевые буферы."""
+    if await storage.get_agent(agent_id) is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    now = time.time()
+    accepted = 0
+    for metric in batch.metrics:
+        timestamp = now if metric.timestamp is None else _epoch(metric.timestamp)
+        accepted += metrics_store.add(agent_id, metric.metric_type, timestamp, metric.value)
+    return {"agent_id": agent_id, "accepted": accepted, "rejected": len(batch.metrics) - accepted}
+
 @app.get("/agents/{agent_id}/metrics", response_model=AgentMetricsResponse, summary="Получение метрик агента")
 async def get_agent_metrics(agent_id: int, current_user: dict = Depends(get_current_user)):
-    """Возвращает метрики производительности агента."""
-    if agent_id not in fake_db["agents"]:
+    """Возвращает последние значения метрик производительности агента."""
+    if await storage.get_agent(agent_id) is None:
         raise HTTPException(status_code=404, detail="Agent not found")
     metrics = [
-        {"metric_type": "CPU", "value": 75.5},
-        {"metric_type": "Memory", "value": 512.0}
+        {"metric_type": metric_type, "value": value, "timestamp": _from_epoch(timestamp)}
+        for metric_type, timestamp, value in metrics_store.latest(agent_id)
     ]
     return {"agent_id": agent_id, "metrics": metrics}
 
+@app.get("/agents/{agent_id}/metrics/summary", response_model=AgentMetricsSummary, summary="Агрегированные метрики агента")
+async def get_agent_metrics_summary(
+    agent_id: int,
+    metric_type: Optional[str] = Query(None, description="Только указанный тип метрики"),
+    since: Optional[datetime] = Query(None, description="Начало окна (по умолчанию — window секунд назад)"),
+    until: Optional[datetime] = Query(None, description="Конец окна, не включительно (по умолчанию — сейчас)"),
+    window: float = Query(300, gt=0, description="Длина окна в секундах, если since не задан"),
+    step: float = Query(60, gt=0, description="Длина интервала агрегации в секундах"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Возвращает min/max/avg метрик агента по интервалам длины step внутри окна."""
+    if await storage.get_agent(agent_id) is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    end = time.time() if until is None else _epoch(until)
+    start = end - window if since is None else _epoch(since)
+    if start >= end:
+        raise HTTPException(status_code=422, detail="since must be earlier than until")
+    if (end - start) / step > MAX_METRIC_BUCKETS:
+        raise HTTPException(status_code=422, detail=f"Too many buckets (max {MAX_METRIC_BUCKETS})")
+    series = []
+    for name, values in metrics_store.series(agent_id).items():
+        if metric_type is not None and name != metric_type:
+            continue
+        buckets = [
+            {"timestamp": _from_epoch(bucket), "min": low, "max": high, "avg": avg, "count": count}
+            for bucket, low, high, avg, count in values.downsample(start, end, step)
+        ]
+        series.append({"metric_type": name, "buckets": buckets})
+    return {
+        "agent_id": agent_id,
+        "since": _from_epoch(start),
+        "until": _from_epoch(end),
+        "step": step,
+        "series": series
+    }
+
 # 4. Коммуникация между агентами
 @app.post("/messages", response_model=MessageResponse, summary="Отправка сообщения между агентами")
 async def send_message(message: MessageCreate, current_user: dict = Depends(get_current_user)):
     """Отправляет сообщение от одного агента другому."""
-    if message.sender_id not in fake_db["agents"] or message.receiver_id not in fake_db["agents"]:
+    if await storage.missing_agents([message.sender_id, message.receiver_id]):
         raise HTTPException(status_code=404, detail="Sender or receiver not found")
-    message_id = len(fake_db["messages"]) + 1
-    fake_db["messages"][message_id] = {
+    row = {
         "sender_id": message.sender_id,
         "receiver_id": message.receiver_id,
         "content": message.content,
         "timestamp": datetime.utcnow()
     }
-    return {"message_id": message_id, "timestamp": fake_db["messages"][message_id]["timestamp"]}
+    return await deliver_message(row)
+
+async def deliver_message(row: dict) -> dict:
+    """Сохраняет сообщение и передаёт его в почтовый ящик получателя."""
+    message_id = await storage.add_message(row)
+    publish_messages([{"message_id": message_id, **row}])
+    return {"message_id": message_id, "timestamp": row["timestamp"]}
 
 @app.get("/messages/{agent_id}", response_model=MessageListResponse, summary="Получение сообщений агента")
-async def get_messages(agent_id: int, current_user: dict = Depends(get_current_user)):
-    """Возвращает все сообщения, отправленные или полученные агентом."""
-    if agent_id not in fake_db["agents"]:
+async def get_messages(
+    agent_id: int,
+    limit: int = Query(100, ge=1, le=1000, description="Размер страницы"),
+    after: Optional[str] = Query(None, description="Курсор из next_cursor предыдущей страницы"),
+    since: Optional[datetime] = Query(None, description="Не раньше указанного времени"),
+    until: Optional[datetime] = Query(None, description="Не позже указанного времени"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Возвращает страницу сообщений, отправленных или полученных агентом, в порядке времени."""
+    if await storage.get_agent(agent_id) is None:
         raise HTTPException(status_code=404, detail="Agent not found")
-    messages = [
-        {
-            "message_id": mid,
-            "sender_id": msg["sender_id"],
-            "content": msg["content"],
-            "timestamp": msg["timestamp"].isoformat()
-        }
-        for mid, msg in fake_db["messages"].items()
-        if msg["receiver_id"] == agent_id or msg["sender_id"] == agent_id
-    ]
-    return {"agent_id": agent_id, "messages": messages}
+    try:
+        position = decode_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    messages = await storage.list_messages(agent_id, limit + 1, after=position, since=since, until=until)
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        last = messages[-1]
+        next_cursor = encode_cursor((to_micros(last["timestamp"]), last["message_id"]))
+    return {"agent_id": agent_id, "messages": messages, "next_cursor": next_cursor}
+
+def _deliveries(batch) -> List[dict]:
+    return [{"seq": seq, "message": message} for seq, message in batch]
+
+@app.get("/messages/{agent_id}/poll", response_model=DeliveryBatch, summary="Ожидание новых сообщений агента (long-poll)")
+async def poll_messages(
+    agent_id: int,
+    ack: Optional[int] = Query(None, description="seq последней обработанной доставки"),
+    timeout: float = Query(25.0, ge=0, le=60, description="Сколько секунд ждать новых сообщений"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    """Возвращает новые сообщения агента, ожидая их до timeout секунд.
+
+    Доставки без подтверждения через ack выдаются повторно при следующем запросе.
+    Пока ящик агента читает другой запрос или WebSocket, возвращается 409.
+    """
+    if await storage.get_agent(agent_id) is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    mailbox = delivery_hub.subscribe(agent_id)
+    if not mailbox.claim():
+        raise HTTPException(status_code=409, detail="Messages of this agent are already being received")
+    try:
+        if ack is not None:
+            mailbox.ack(ack)
+        mailbox.requeue_inflight()
+        await mailbox.wait(lambda: mailbox.pending > 0, timeout)
+        dropped = mailbox.pop_dropped()
+        return {"agent_id": agent_id, "deliveries": _deliveries(mailbox.take(limit)), "dropped": dropped}
+    finally:
+        mailbox.release()
+
+@app.websocket("/ws/messages/{agent_id}")
+async def message_stream(
+    websocket: WebSocket,
+    agent_id: int,
+    token: str = Query(..., description="JWT-токен (браузеры не передают заголовки при подключении)"),
+    window: int = Query(100, ge=1, le=1000, description="Максимум доставок без подтверждения")
+):
+    """Передаёт сообщения агенту по мере поступления.
+
+    Сервер шлёт {"deliveries": [...], "dropped": n}, клиент отвечает {"ack": seq}.
+    Пока без подтверждения window доставок, новые не отправляются.
+    """
+    try:
+        await get_current_user(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    if await storage.get_agent(agent_id) is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    mailbox = delivery_hub.subscribe(agent_id)
+    if not mailbox.claim():
+        # Ящик уже читает другой получатель
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+    await websocket.accept()
+
+    async def send_loop():
+        while True:
+            await mailbox.wait(lambda: mailbox.pending > 0 and mailbox.inflight < window)
+            dropped = mailbox.pop_dropped()
+            batch = mailbox.take(window - mailbox.inflight)
+            await websocket.send_json(jsonable_encoder({"deliveries": _deliveries(batch), "dropped": dropped}))
+
+    async def receive_loop():
+        while True:
+            data = await websocket.receive_json()
+            mailbox.ack(int(data["ack"]))
+
+    sender = asyncio.ensure_future(send_loop())
+    receiver = asyncio.ensure_future(receive_loop())
+    try:
+        # Оба цикла бесконечны: первый завершившийся закончился ошибкой или отключением клиента
+        done, _ = await asyncio.wait([sender, receiver], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        sender.cancel()
+        receiver.cancel()
+        # До первого await: при отмене самого обработчика ожидание ниже тоже прерывается
+        mailbox.requeue_inflight()
+        mailbox.release()
+        await asyncio.wait([sender, receiver])
+    error = (receiver if receiver in done else sender).exception()
+    if isinstance(error, WebSocketDisconnect):
+        return
+    if receiver in done and isinstance(error, (KeyError, ValueError, TypeError)):
+        # Клиент прислал некорректное подтверждение
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+        return
+    log_store.write("ERROR", f"Message stream failed: {error!r}", agent_id=agent_id)
+    if websocket.application_state == WebSocketState.CONNECTED and websocket.client_state == WebSocketState.CONNECTED:
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
 
 # 5. Назначение задач
 @app.post("/tasks", response_model=TaskResponse, summary="Создание новой задачи")
 async def create_task(task: TaskCreate, current_user: dict = Depends(get_current_user)):
     """Создает новую задачу и назначает её агенту."""
-    if task.assigned_agent_id not in fake_db["agents"]:
+    if await storage.get_agent(task.assigned_agent_id) is None:
         raise HTTPException(status_code=404, detail="Agent not found")
-    task_id = len(fake_db["tasks"]) + 1
-    fake_db["tasks"][task_id] = {
+    row = {
         "priority": task.priority,
         "assigned_agent_id": task.assigned_agent_id,
         "deadline": task.deadline,
         "status": task.status
     }
+    task_id = await storage.add_task(row)
+    event_bus.publish("tasks.created", {
+        "task": task_event(task_id, task.assigned_agent_id, task.priority, task.deadline, task.status.value)
+    })
+    log_store.write("INFO", "Task created", agent_id=task.assigned_agent_id, task_id=task_id)
     return {"task_id": task_id, "message": "Task created successfully"}
 
+@app.get("/tasks", response_model=TaskListResponse, summary="Список задач")
+async def list_tasks(
+    assigned_agent_id: Optional[int] = None,
+    status: Optional[TaskStatus] = None,
+    priority: Optional[int] = Query(None, ge=1, le=5),
+    deadline_from: Optional[datetime] = Query(None, description="Срок не раньше указанного времени"),
+    deadline_to: Optional[datetime] = Query(None, description="Срок не позже указанного времени"),
+    limit: int = Query(100, ge=1, le=1000, description="Размер страницы"),
+    after: Optional[str] = Query(None, description="Курсор из next_cursor предыдущей страницы"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Возвращает задачи, подходящие под фильтры, в порядке срока выполнения."""
+    try:
+        position = decode_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    filters = {
+        field: value.value if isinstance(value, Enum) else value
+        for field, value in (("assigned_agent_id", assigned_agent_id), ("status", status), ("priority", priority))
+        if value is not None
+    }
+    tasks = await storage.list_tasks(filters, limit + 1, deadline_from=deadline_from, deadline_to=deadline_to,
+                                     after=position)
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        last = tasks[-1]
+        next_cursor = encode_cursor((to_micros(last["deadline"]), last["task_id"]))
+    return {"tasks": tasks, "next_cursor": next_cursor}
+
 @app.get("/tasks/{task_id}", response_model=TaskInfo, summary="Получение информации о задаче")
 async def get_task(task_id: int, current_user: dict = Depends(get_current_user)):
     """Возвращает информацию о задаче по её ID."""
-    if task_id not in fake_db["tasks"]:
+    task = await storage.get_task(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    task = fake_db["tasks"][task_id]
     return {
         "task_id": task_id,
         "priority": task["priority"],
@@ -304,53 +1134,292 @@ async def get_task(task_id: int, current_user: dict = Depends(get_current_user))
         "status": task["status"]
     }
 
+async def requeue_expired_tasks():
+    """Возвращает в очередь задачи, аренда которых истекла."""
+    for lease in task_queue.expire_leases():
+        # Задачу могли успеть завершить; тогда статус в хранилище уже не in_progress
+        if await storage.transition_task(lease.task_id, TaskStatus.IN_PROGRESS, TaskStatus.PENDING):
+            priority, deadline, _ = lease.key
+            event_bus.publish("tasks.requeued", {
+                "task": task_event(lease.task_id, lease.agent_id, -priority, from_micros(deadline), TaskStatus.PENDING.value)
+            })
+            log_store.write("WARNING", "Task lease expired, task requeued", agent_id=lease.agent_id, task_id=lease.task_id)
+
+@app.post("/agents/{agent_id}/tasks/claim", response_model=TaskLease, summary="Получение следующей задачи агентом",
+          responses={204: {"description": "Нет ожидающих задач"}})
+async def claim_task(
+    agent_id: int,
+    lease_seconds: int = Query(DEFAULT_LEASE_SECONDS, ge=1, le=3600, description="Срок аренды задачи в секундах"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Выдаёт агенту самую приоритетную ожидающую задачу и переводит её в статус in_progress."""
+    if await storage.get_agent(agent_id) is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    await requeue_expired_tasks()
+    while True:
+        lease = task_queue.lease(agent_id, lease_seconds)
+        if lease is None:
+            return Response(status_code=status.HTTP_204_NO_CONTENT)
+        if await storage.transition_task(lease.task_id, TaskStatus.PENDING, TaskStatus.IN_PROGRESS):
+            task = await storage.get_task(lease.task_id)
+            if task is None:
+                # Задачу удалили сразу после перехода
+                task_queue.release(lease.task_id)
+                continue
+            # Другие воркеры убирают задачу из своих очередей и запоминают аренду, чтобы принять complete
+            event_bus.publish("tasks.claimed", {
+                "task": task_event(lease.task_id, agent_id, task["priority"], task["deadline"], TaskStatus.IN_PROGRESS.value),
+                "expires_at": lease.expires_at
+            })
+            log_store.write("INFO", "Task claimed", agent_id=agent_id, task_id=lease.task_id)
+            return {**task, "lease_expires_at": datetime.utcfromtimestamp(lease.expires_at)}
+        # Задачу уже взял другой воркер или её статус изменили вручную; аренду, о которой
+        # другой воркер успел сообщить через шину, не снимаем
+        if task_queue.get_lease(lease.task_id) is lease:
+            task_queue.release(lease.task_id)
+
+@app.post("/agents/{agent_id}/tasks/{task_id}/complete", response_model=TaskResponse, summary="Завершение задачи агентом")
+async def complete_task(agent_id: int, task_id: int, current_user: dict = Depends(get_current_user)):
+    """Отмечает арендованную агентом задачу выполненной."""
+    lease = task_queue.get_lease(task_id)
+    if lease is None or lease.agent_id != agent_id:
+        raise HTTPException(status_code=409, detail="Task is not leased by this agent")
+    if not await storage.transition_task(task_id, TaskStatus.IN_PROGRESS, TaskStatus.COMPLETED):
+        raise HTTPException(status_code=409, detail="Task is not in progress")
+    event_bus.publish("tasks.finished", {"task_ids": [task_id]})
+    log_store.write("INFO", "Task completed", agent_id=agent_id, task_id=task_id)
+    return {"task_id": task_id, "message": "Task completed"}
+
+async def expire_tasks(task_ids: List[int]):
+    """Переводит просроченные задачи в expired и уведомляет назначенных агентов."""
+    for task_id in task_ids:
+        # Задачу могли завершить или взять в работу после постановки срока
+        for from_status in (TaskStatus.PENDING, TaskStatus.IN_PROGRESS):
+            if await storage.transition_task(task_id, from_status, TaskStatus.EXPIRED):
+                break
+        else:
+            continue
+        event_bus.publish("tasks.finished", {"task_ids": [task_id]})
+        task = await storage.get_task(task_id)
+        if task is None:
+            # Задачу удалили сразу после перехода: уведомлять не о чем
+            continue
+        agent_id = task["assigned_agent_id"]
+        log_store.write("WARNING", f"Task deadline passed while {from_status.value}, task expired",
+                        agent_id=agent_id, task_id=task_id)
+        if await storage.get_agent(agent_id) is not None:
+            await deliver_message({
+                "sender_id": SYSTEM_SENDER_ID,
+                "receiver_id": agent_id,
+                "content": json.dumps({"event": "task_expired", "task_id": task_id, "previous_status": from_status.value,
+                                       "deadline": task["deadline"].isoformat()}),
+                "timestamp": datetime.utcnow()
+            })
+
+async def expire_overdue_tasks(now: Optional[float] = None):
+    """Обрабатывает все наступившие сроки (фоновая корутина делает то же по мере их наступления)."""
+    while True:
+        due = deadline_scheduler.pop_due(now, limit=deadline_scheduler.batch_size)
+        if not due:
+            return
+        await expire_tasks(due)
+
 # 6. Координация агентов
 @app.post("/coordination", response_model=CoordinationResponse, summary="Инициирование координации агентов")
 async def coordinate_agents(coord: CoordinationRequest, current_user: dict = Depends(get_current_user)):
-    """Инициирует координацию между указанными агентами."""
-    for agent_id in coord.agents:
-        if agent_id not in fake_db["agents"]:
-            raise HTTPException(status_code=404, detail=f"Agent {agent_id} not found")
-    coordination_id = len(fake_db.get("coordinations", {})) + 1
-    # Логика координации (заглушка)
-    return {"coordination_id": coordination_id, "message": "Coordination initiated"}
+    """Сохраняет сессию координации и рассылает действие всем указанным агентам."""
+    agent_ids = list(dict.fromkeys(coord.agents))
+    if len(agent_ids) > MAX_COORDINATION_AGENTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_COORDINATION_AGENTS} agents per coordination")
+    missing = await storage.missing_agents(agent_ids)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Agent {missing[0]} not found")
+    coordination_id, delivered, failed = await coordination_engine.start(coord.action, agent_ids, coord.ack_timeout)
+    log_store.write("WARNING" if failed else "INFO",
+                    f"Coordination {coordination_id} '{coord.action}': {len(delivered)} delivered, {len(failed)} failed")
+    return {"coordination_id": coordination_id, "message": "Coordination initiated",
+            "delivered": len(delivered), "failed": len(failed)}
+
+@app.post("/coordination/{coordination_id}/ack", summary="Подтверждение действия координации агентом")
+async def acknowledge_coordination(coordination_id: int, ack: CoordinationAck, current_user: dict = Depends(get_current_user)):
+    """Записывает ответ агента: success=false означает отказ выполнить действие."""
+    if not await coordination_engine.acknowledge(coordination_id, ack.agent_id, ack.success):
+        if await storage.get_coordination(coordination_id) is None:
+            raise HTTPException(status_code=404, detail="Coordination not found")
+        raise HTTPException(status_code=409, detail="Agent is not a participant or has already responded")
+    return {"coordination_id": coordination_id, "agent_id": ack.agent_id, "message": "Acknowledgement recorded"}
+
+@app.get("/coordination/{coordination_id}", response_model=CoordinationStatus, summary="Ход координации")
+async def get_coordination(coordination_id: int, details: bool = False, current_user: dict = Depends(get_current_user)):
+    """Счётчики участников по состояниям; со списком участников при details=true."""
+    progress = await coordination_engine.progress(coordination_id, with_participants=details)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Coordination not found")
+    return progress
 
 # 7. Конфигурирование агентов
+def config_etag(version: int) -> str:
+    return f'"{version}"'
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if header is None:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    # Слабое сравнение: W/"v" совпадает с "v"
+    return "*" in tags or any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags)
+
 @app.put("/agents/{agent_id}/config", response_model=AgentResponse, summary="Обновление конфигурации агента")
-async def update_config(agent_id: int, config: ConfigurationUpdate, current_user: dict = Depends(get_current_user)):
-    """Обновляет конфигурацию указанного агента."""
-    if agent_id not in fake_db["agents"]:
+async def update_config(agent_id: int, config: ConfigurationUpdate, response: Response,
+                        current_user: dict = Depends(get_current_user)):
+    """Заменяет конфигурацию указанного агента целиком."""
+    version = await storage.update_config(agent_id, config.configuration)
+    if version is None:
         raise HTTPException(status_code=404, detail="Agent not found")
-    fake_db["agents"][agent_id]["configuration"] = config.configuration
+    event_bus.publish("configs.updated", {"agent_id": agent_id, "versions": [[version, config.configuration]]})
+    response.headers["ETag"] = config_etag(version)
     return {"agent_id": agent_id, "message": "Configuration updated"}
 
+@app.patch("/agents/{agent_id}/config", response_model=ConfigVersionResponse, summary="Частичное обновление конфигурации")
+async def patch_config(agent_id: int, request: Request, response: Response,
+                       current_user: dict = Depends(get_current_user)):
+    """Применяет JSON Merge Patch (объект) или JSON Patch (массив операций) к конфигурации агента.
+
+    Тип патча определяется по Content-Type, для application/json — по телу. If-Match задаёт
+    ожидаемую версию: если конфигурацию успели изменить, возвращается 412.
+    """
+    try:
+        patch = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body must be JSON")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    apply = json_patch if content_type == JSON_PATCH_TYPE or (content_type != MERGE_PATCH_TYPE and isinstance(patch, list)) \
+        else merge_patch
+    if_match = request.headers.get("if-match")
+    for _ in range(CONFIG_PATCH_ATTEMPTS):
+        agent = await storage.get_agent(agent_id)
+        if agent is None:
+            raise HTTPException(status_code=404, detail="Agent not found")
+        base_version = agent["config_version"]
+        if if_match is not None and not etag_matches(if_match, config_etag(base_version)):
+            raise HTTPException(status_code=412, detail="Configuration version does not match If-Match")
+        try:
+            configuration = apply(agent["configuration"], patch)
+        except PatchError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if not isinstance(configuration, dict):
+            raise HTTPException(status_code=422, detail="Configuration must remain a JSON object")
+        # Новая версия записывается, только если за время применения патча конфигурацию не изменили
+        version = await storage.update_config(agent_id, configuration, expected_version=base_version)
+        if version is not None:
+            break
+        if if_match is not None:
+            raise HTTPException(status_code=412, detail="Configuration version does not match If-Match")
+    else:
+        raise HTTPException(status_code=409, detail="Configuration is being modified concurrently, retry")
+    event_bus.publish("configs.updated", {
+        "agent_id": agent_id, "versions": [[base_version, agent["configuration"]], [version, configuration]]
+    })
+    response.headers["ETag"] = config_etag(version)
+    return {"agent_id": agent_id, "version": version, "message": "Configuration updated"}
+
+@app.get("/agents/{agent_id}/config", response_model=AgentConfig, summary="Получение конфигурации агента")
+async def get_config(agent_id: int, request: Request, response: Response,
+                     since_version: Optional[int] = Query(None, ge=1, description="Вернуть только изменения после этой версии"),
+                     current_user: dict = Depends(get_current_user)):
+    """Конфигурация агента; с If-None-Match текущей версии — 304 без тела.
+
+    С since_version возвращается JSON Patch от этой версии до текущей, если версия ещё хранится
+    в истории; иначе — полная конфигурация.
+    """
+    agent = await storage.get_agent(agent_id)
+    if agent is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    version, configuration = agent["config_version"], agent["configuration"]
+    etag = config_etag(version)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    config_history.record(agent_id, version, configuration)
+    if since_version is not None and since_version <= version:
+        base = config_history.get(agent_id, since_version)
+        if base is not None:
+            return {"agent_id": agent_id, "version": version, "since_version": since_version,
+                    "patch": diff(base, configuration)}
+    return {"agent_id": agent_id, "version": version, "configuration": configuration}
+
 # 8. Интеграция внешних систем
 @app.post("/integrations", response_model=IntegrationResponse, summary="Добавление новой интеграции")
 async def add_integration(integration: IntegrationCreate, current_user: dict = Depends(get_current_user)):
     """Добавляет новую интеграцию с внешней системой."""
-    integration_id = len(fake_db["integrations"]) + 1
-    fake_db["integrations"][integration_id] = {
+    integration_id = await storage.add_integration({
         "system_name": integration.system_name,
         "api_url": integration.api_url,
         "auth_details": integration.auth_details
-    }
+    })
     return {"integration_id": integration_id, "message": "Integration added"}
 
 @app.get("/integrations", response_model=List[IntegrationInfo], summary="Получение списка интеграций")
 async def get_integrations(current_user: dict = Depends(get_current_user)):
     """Возвращает список всех интеграций."""
     return [
-        {"integration_id": iid, "system_name": i["system_name"], "api_url": i["api_url"]}
-        for iid, i in fake_db["integrations"].items()
+        {"integration_id": i["integration_id"], "system_name": i["system_name"], "api_url": i["api_url"]}
+        for i in await storage.list_integrations()
     ]
 
+async def get_connector(integration_id: int):
+    connector = integration_pool.get(integration_id)
+    if connector is None:
+        integration = await storage.get_integration(integration_id)
+        if integration is None:
+            raise HTTPException(status_code=404, detail="Integration not found")
+        connector = integration_pool.connector(integration)
+    return connector
+
+@app.get("/integrations/stats", response_model=List[IntegrationStats], summary="Статистика вызовов интеграций")
+async def get_integrations_stats(current_user: dict = Depends(get_current_user)):
+    """Задержки, ошибки и состояние автомата для интеграций, к которым были вызовы."""
+    return integration_pool.stats()
+
+@app.get("/integrations/{integration_id}/stats", response_model=IntegrationStats, summary="Статистика вызовов интеграции")
+async def get_integration_stats(integration_id: int, current_user: dict = Depends(get_current_user)):
+    connector = await get_connector(integration_id)
+    return connector.to_dict()
+
+@app.post("/integrations/{integration_id}/call", response_model=IntegrationCallResult, summary="Вызов внешней системы")
+async def call_integration(integration_id: int, call: IntegrationCall, current_user: dict = Depends(get_current_user)):
+    """Выполняет запрос к api_url интеграции через её пул соединений."""
+    connector = await get_connector(integration_id)
+    started = time.perf_counter()
+    try:
+        response = await connector.request(call.method, call.path, retry=call.retry, params=call.params,
+                                           json=call.body)
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Integration unavailable: {e}",
+                            headers={"Retry-After": str(max(1, round(e.retry_after)))})
+    except httpx.TimeoutException:
+        log_store.write("WARNING", f"Integration {integration_id} call timed out")
+        raise HTTPException(status_code=504, detail="Integration timed out")
+    except httpx.HTTPError as e:
+        log_store.write("WARNING", f"Integration {integration_id} call failed: {e!r}")
+        raise HTTPException(status_code=502, detail="Integration request failed")
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+    return {"integration_id": integration_id, "status_code": response.status_code, "body": body,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)}
+
 # 9. Аутентификация и авторизация
 @app.post("/auth/login", summary="Аутентификация пользователя")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """Аутентифицирует пользователя и возвращает JWT-токен."""
-    user = fake_db["users"].get(form_data.username)
-    if not user or user["password"] != form_data.password:  # В реальном проекте используйте хэширование
+    user = await storage.get_user(form_data.username)
+    valid, rehash = await password_hasher.verify(form_data.password, user["password"] if user else None)
+    if not valid:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
+    if rehash:
+        # Пароль открытым текстом или хэш с устаревшими параметрами
+        await storage.update_user(user["user_id"], {"password": await password_hasher.hash(form_data.password)})
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(data={"sub": form_data.username}, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
@@ -358,11 +1427,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 @app.get("/users/me", response_model=UserInfo, summary="Получение информации о текущем пользователе")
 async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     """Возвращает информацию о текущем аутентифицированном пользователе."""
-    return {
-        "user_id": fake_db["users"][current_user["username"]]["user_id"],
-        "username": current_user["username"],
-        "role": current_user["role"]
-    }
+    return current_user
 
 # 10. Управление пользователями и ролями
 @app.post("/users", response_model=UserResponse, summary="Создание нового пользователя")
@@ -370,30 +1435,58 @@ async def create_user(user: UserCreate, current_user: dict = Depends(get_current
     """Создает нового пользователя (доступно только администраторам)."""
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
-    if user.username in fake_db["users"]:
+    if await storage.get_user(user.username) is not None:
+        raise HTTPException(status_code=409, detail="Username already exists")
+    try:
+        user_id = await storage.add_user({
+            "username": user.username,
+            "password": await password_hasher.hash(user.password),
+            "role": "user" if user.role_id == 1 else "admin"
+        })
+    except ValueError:
+        # Имя заняли, пока считался хэш пароля
         raise HTTPException(status_code=409, detail="Username already exists")
-    user_id = len(fake_db["users"]) + 1
-    fake_db["users"][user.username] = {
-        "user_id": user_id,
-        "password": user.password,  # В реальном проекте хэшируйте пароль
-        "role": "user" if user.role_id == 1 else "admin"
-    }
     return {"user_id": user_id, "message": "User created"}
 
 @app.put("/users/{user_id}", response_model=UserResponse, summary="Обновление информации о пользователе")
 async def update_user(user_id: int, user: UserCreate, current_user: dict = Depends(get_current_user)):
-    """Обновляет информацию о пользователе (доступно только администраторам)."""
+    """Обновляет информацию о пользователе, в том числе имя (доступно только администраторам)."""
     if current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
-    for username, data in fake_db["users"].items():
-        if data["user_id"] == user_id:
-            fake_db["users"][username] = {
-                "user_id": user_id,
-                "password": user.password,
-                "role": "user" if user.role_id == 1 else "admin"
-            }
-            return {"user_id": user_id, "message": "User updated"}
-    raise HTTPException(status_code=404, detail="User not found")
+    try:
+        updated = await storage.update_user(user_id, {
+            "username": user.username,
+            "password": await password_hasher.hash(user.password),
+            "role": "user" if user.role_id == 1 else "admin"
+        })
+    except ValueError:
+        raise HTTPException(status_code=409, detail="Username already exists")
+    if not updated:
+        raise HTTPException(status_code=404, detail="User not found")
+    # Имя, роль и пароль изменились: ранее выданные токены должны пройти проверку заново во всех воркерах
+    event_bus.publish("users.changed", {"user_id": user_id})
+    return {"user_id": user_id, "message": "User updated"}
+
+@app.get("/users", response_model=UserListResponse, summary="Список пользователей")
+async def list_users(limit: int = Query(100, ge=1, le=1000), offset: int = Query(0, ge=0),
+                     current_user: dict = Depends(get_current_user)):
+    """Возвращает пользователей по возрастанию id постранично (доступно только администраторам)."""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    total, users = await storage.list_users(limit, offset)
+    return {"total": total, "users": users}
+
+@app.delete("/users/{user_id}", response_model=UserResponse, summary="Удаление пользователя")
+async def delete_user(user_id: int, current_user: dict = Depends(get_current_user)):
+    """Удаляет пользователя (доступно только администраторам); удалить самого себя нельзя."""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if user_id == current_user["user_id"]:
+        raise HTTPException(status_code=409, detail="Cannot delete the current user")
+    if not await storage.delete_user(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    event_bus.publish("users.changed", {"user_id": user_id})
+    return {"user_id": user_id, "message": "User deleted"}
 
 @app.get("/roles", response_model=List[Role], summary="Получение списка ролей")
 async def get_roles(current_user: dict = Depends(get_current_user)):
@@ -405,26 +1498,83 @@ async def get_roles(current_user: dict = Depends(get_current_user)):
 
 # 11. Логирование и мониторинг системы
 @app.get("/logs", response_model=List[LogEntry], summary="Получение системных логов")
-async def get_logs(current_user: dict = Depends(get_current_user)):
-    """Возвращает системные логи (с фильтрацией по дате и уровню в реальном проекте)."""
-    # Пример логов (в реальном проекте из ELK или базы)
-    logs = [
-        {"timestamp": datetime.utcnow(), "level": "INFO", "message": "Agent started"},
-        {"timestamp": datetime.utcnow(), "level": "ERROR", "message": "Task failed"}
-    ]
-    return logs
+async def get_logs(
+    level: Optional[LogLevel] = Query(None, description="Минимальный уровень"),
+    since: Optional[datetime] = Query(None, description="Не раньше этого момента"),
+    until: Optional[datetime] = Query(None, description="Раньше этого момента"),
+    agent_id: Optional[int] = Query(None, description="Только записи об агенте"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    """Возвращает системные логи с фильтрацией по дате, уровню и агенту, от новых к старым."""
+    records = log_store.query(
+        level=None if level is None else level.value,
+        since=None if since is None else _epoch(since),
+        until=None if until is None else _epoch(until),
+        agent_id=agent_id,
+        limit=limit
+    )
+    for record in records:
+        record["timestamp"] = _from_epoch(record["timestamp"])
+    return records
 
 @app.get("/metrics", response_model=SystemMetrics, summary="Получение системных метрик")
 async def get_system_metrics(current_user: dict = Depends(get_current_user)):
     """Возвращает метрики производительности системы."""
-    # Пример метрик (в реальном проекте из Prometheus)
+    agents_by_status = await storage.count_agents_by_status()
     return {
-        "cpu_usage": 45.5,
-        "memory_usage": 2048.0,
-        "active_agents": len(fake_db["agents"])
+        "cpu_usage": process_stats.cpu_percent(),
+        "memory_usage": process_stats.rss_bytes() / (1024 * 1024),
+        "active_agents": agents_by_status.get(AgentStatus.ACTIVE.value, 0),
+        "agents_by_status": agents_by_status,
+        "stale_agents": len(liveness_tracker.stale)
     }
 
+@app.get("/metrics/prometheus", summary="Метрики в текстовом формате Prometheus",
+         response_class=Response, responses={200: {"content": {"text/plain": {}}}})
+async def get_prometheus_metrics(current_user: dict = Depends(get_current_user)):
+    """Возвращает метрики процесса и HTTP-запросов по маршрутам для сбора Prometheus."""
+    lines = [
+        "# HELP process_cpu_seconds_total Total user and system CPU time spent in seconds.",
+        "# TYPE process_cpu_seconds_total counter",
+        f"process_cpu_seconds_total {process_stats.cpu_seconds()}",
+        "# HELP process_resident_memory_bytes Resident memory size in bytes.",
+        "# TYPE process_resident_memory_bytes gauge",
+        f"process_resident_memory_bytes {process_stats.rss_bytes()}",
+        "# HELP agents Registered agents by status.",
+        "# TYPE agents gauge",
+        *(f'agents{{status="{agent_status}"}} {count}'
+          for agent_status, count in sorted((await storage.count_agents_by_status()).items())),
+        "# HELP agents_stale Agents marked stale by the heartbeat sweeper.",
+        "# TYPE agents_stale gauge",
+        f"agents_stale {len(liveness_tracker.stale)}",
+        *request_metrics.exposition(),
+    ]
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# 12. Выгрузка данных
+EXPORT_CHUNK_SIZE = 500
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+async def export_records(collection: ExportCollection, after_id: int):
+    """Генерирует NDJSON по записям коллекции в порядке возрастания id, порциями по EXPORT_CHUNK_SIZE."""
+    async for batch in storage.iter_records(collection.value, after_id, EXPORT_CHUNK_SIZE):
+        yield "".join(json.dumps({"id": record_id, **record}, default=_json_default) + "\n" for record_id, record in batch)
+
+@app.get("/export/{collection}", summary="Потоковая выгрузка коллекции в формате NDJSON")
+async def export_collection(
+    collection: ExportCollection,
+    after_id: int = Query(0, ge=0, description="id последней полученной записи для продолжения выгрузки"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Выгружает сообщения, задачи или агентов построчно, не собирая ответ в памяти."""
+    return StreamingResponse(export_records(collection, after_id), media_type="application/x-ndjson")
+
 # Запуск приложения
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
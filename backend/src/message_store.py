@@ -0,0 +1,177 @@
+"""Хранилище сообщений с индексами по отправителю и получателю.
+
+Позволяет получать переписку агента за O(количество сообщений агента),
+а не за O(всех сообщений в системе). Индексы упорядочены по времени,
+поэтому выборка страницы по курсору или интервалу дат начинается
+с бинарного поиска и не просматривает предыдущие страницы.
+
+Сообщения хранятся как MessageRecord (records.py) с временем в
+микросекундах от эпохи; ключи индексов ссылаются на тот же int.
+
+Системные уведомления (отправитель SYSTEM_SENDER_ID) попадают только в
+индекс получателя: список отправленных у системы рос бы без ограничения.
+"""
+import base64
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta, timezone
+from heapq import merge
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from records import Record
+
+# Ключ сортировки сообщения: (время в микросекундах от эпохи, message_id)
+MessageKey = Tuple[int, int]
+
+# Отправитель системных уведомлений; id агентов начинаются с 1
+SYSTEM_SENDER_ID = 0
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_micros(moment: datetime) -> int:
+    """Переводит datetime (наивное время считается UTC) в микросекунды от эпохи."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = moment - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def from_micros(micros: int) -> datetime:
+    """Обратное преобразование к to_micros: наивное UTC-время."""
+    # Позиционные аргументы заметно быстрее именованных: функция вызывается на каждое чтение записи
+    return _EPOCH + timedelta(0, 0, micros)
+
+
+def encode_cursor(key: MessageKey) -> str:
+    """Кодирует позицию в непрозрачный курсор."""
+    return base64.urlsafe_b64encode(f"{key[0]}:{key[1]}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> MessageKey:
+    """Разбирает курсор, созданный encode_cursor. Бросает ValueError для некорректных значений."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        micros, message_id = raw.split(":")
+        return int(micros), int(message_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+class MessageRecord(Record):
+    __slots__ = ("sender_id", "receiver_id", "content", "timestamp")
+    CODECS = {"timestamp": (to_micros, from_micros)}
+
+
+class MessageStore(MutableMapping):
+    """Словарь message_id -> сообщение, поддерживающий индексы sender_id / receiver_id."""
+
+    def __init__(self):
+        self._messages: Dict[int, MessageRecord] = {}
+        self._sent: Dict[int, List[MessageKey]] = {}
+        self._received: Dict[int, List[MessageKey]] = {}
+
+    def __getitem__(self, message_id: int) -> dict:
+        return self._messages[message_id].to_row()
+
+    def __setitem__(self, message_id: int, message: dict):
+        if message_id in self._messages:
+            self._unindex(message_id, self._messages[message_id])
+        record = self._messages[message_id] = MessageRecord(message)
+        key = (record.timestamp, message_id)
+        # Новые сообщения почти всегда позже существующих, и insort сводится к append
+        if record.sender_id != SYSTEM_SENDER_ID:
+            insort(self._sent.setdefault(record.sender_id, []), key)
+        insort(self._received.setdefault(record.receiver_id, []), key)
+
+    def __delitem__(self, message_id: int):
+        message = self._messages.pop(message_id)
+        self._unindex(message_id, message)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._messages)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __contains__(self, message_id) -> bool:
+        # Проверка наличия без декодирования записи в словарь
+        return message_id in self._messages
+
+    def record(self, message_id: int) -> MessageRecord:
+        """Запись сообщения в закодированном виде (для снимков); её нельзя изменять."""
+        return self._messages[message_id]
+
+    def load(self, items: Iterable[Tuple[int, MessageRecord]]):
+        """Заполняет пустое хранилище готовыми записями: ключи дописываются, каждый индекс сортируется один раз."""
+        messages, sent, received = self._messages, self._sent, self._received
+        for message_id, record in items:
+            messages[message_id] = record
+            key = (record.timestamp, message_id)
+            if record.sender_id != SYSTEM_SENDER_ID:
+                keys = sent.get(record.sender_id)
+                if keys is None:
+                    keys = sent[record.sender_id] = []
+                keys.append(key)
+            keys = received.get(record.receiver_id)
+            if keys is None:
+                keys = received[record.receiver_id] = []
+            keys.append(key)
+        # Сообщения идут по возрастанию id и почти всегда времени: сортировка уже упорядоченных списков линейна
+        for keys in chain(sent.values(), received.values()):
+            keys.sort()
+
+    def key(self, message_id: int) -> MessageKey:
+        """Возвращает позицию сообщения в упорядоченных по времени индексах."""
+        return self._messages[message_id].timestamp, message_id
+
+    def _unindex(self, message_id: int, message: MessageRecord):
+        key = (message.timestamp, message_id)
+        for index, agent_id in ((self._sent, message.sender_id), (self._received, message.receiver_id)):
+            keys = index.get(agent_id)
+            if not keys:
+                continue
+            position = bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                del keys[position]
+
+    @staticmethod
+    def _range(keys: List[MessageKey], after: Optional[MessageKey],
+               since: Optional[datetime], until: Optional[datetime]) -> Iterator[MessageKey]:
+        start, stop = 0, len(keys)
+        if after is not None:
+            start = bisect_right(keys, after)
+        if since is not None:
+            start = max(start, bisect_left(keys, (to_micros(since),)))
+        if until is not None:
+            stop = bisect_left(keys, (to_micros(until) + 1,))
+        return (keys[i] for i in range(start, stop))
+
+    def for_agent(self, agent_id: int, after: Optional[MessageKey] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None) -> Iterator[int]:
+        """Возвращает id сообщений, отправленных или полученных агентом, в порядке времени.
+
+        after — позиция (исключительно), с которой продолжить выдачу;
+        since / until — границы интервала времени (включительно).
+        """
+        last = None
+        for key in merge(self._range(self._sent.get(agent_id, []), after, since, until),
+                         self._range(self._received.get(agent_id, []), after, since, until)):
+            # Сообщение самому себе присутствует в обоих индексах
+            if key != last:
+                yield key[1]
+                last = key
+
+    def indexed_agents(self) -> List[int]:
+        """Агенты, у которых есть отправленные или полученные сообщения в индексах."""
+        return list(self._sent.keys() | self._received.keys())
+
+    def drop_agent(self, agent_id: int):
+        """Удаляет сообщения, отправленные или полученные агентом, и его индексы."""
+        keys = self._sent.pop(agent_id, []) + self._received.pop(agent_id, [])
+        for _, message_id in keys:
+            message = self._messages.pop(message_id, None)
+            if message is not None:
+                # Собственные индексы агента уже удалены, остаётся ключ у второй стороны
+                self._unindex(message_id, message)
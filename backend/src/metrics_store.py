@@ -0,0 +1,132 @@
+"""Хранилище метрик агентов в кольцевых буферах.
+
+Для каждой пары (агент, тип метрики) ведётся кольцевой буфер фиксированной
+ёмкости из двух массивов array('d'): время (секунды от эпохи) и значение.
+Память на агента ограничена capacity * max_types точками, при заполнении
+буфера перезаписываются самые старые точки. Точки в буфере упорядочены по
+времени, поэтому начало окна находится двоичным поиском, а агрегаты
+min/max/avg считаются проходом по окну без копирования буфера.
+"""
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# (время, min, max, avg, count) — агрегат одного интервала
+Bucket = Tuple[float, float, float, float, int]
+
+
+class MetricSeries:
+    """Кольцевой буфер точек одной метрики."""
+
+    __slots__ = ("capacity", "_times", "_values", "_start", "_size")
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._times = array("d", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _pos(self, index: int) -> int:
+        return (self._start + index) % self.capacity
+
+    def append(self, timestamp: float, value: float) -> bool:
+        """Добавляет точку; точки старше последней отклоняются (False)."""
+        if self._size and timestamp < self._times[self._pos(self._size - 1)]:
+            return False
+        if self._size < self.capacity:
+            pos = self._pos(self._size)
+            self._size += 1
+        else:
+            pos = self._start
+            self._start = (self._start + 1) % self.capacity
+        self._times[pos] = timestamp
+        self._values[pos] = value
+        return True
+
+    def latest(self) -> Optional[Tuple[float, float]]:
+        if not self._size:
+            return None
+        pos = self._pos(self._size - 1)
+        return self._times[pos], self._values[pos]
+
+    def _bisect(self, timestamp: float) -> int:
+        """Логический индекс первой точки со временем не меньше timestamp."""
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._times[self._pos(mid)] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def points(self, since: float, until: float) -> Iterator[Tuple[float, float]]:
+        """Точки с since <= время < until в порядке времени."""
+        times, values = self._times, self._values
+        for index in range(self._bisect(since), self._size):
+            pos = self._pos(index)
+            if times[pos] >= until:
+                break
+            yield times[pos], values[pos]
+
+    def downsample(self, since: float, until: float, step: float) -> List[Bucket]:
+        """Агрегирует точки окна [since, until) по интервалам длины step; пустые интервалы пропускаются."""
+        buckets: List[Bucket] = []
+        current = None
+        low = high = total = 0.0
+        count = 0
+        for timestamp, value in self.points(since, until):
+            bucket = since + (timestamp - since) // step * step
+            if bucket != current:
+                if count:
+                    buckets.append((current, low, high, total / count, count))
+                current, low, high, total, count = bucket, value, value, 0.0, 0
+            low = min(low, value)
+            high = max(high, value)
+            total += value
+            count += 1
+        if count:
+            buckets.append((current, low, high, total / count, count))
+        return buckets
+
+
+class MetricsStore:
+    """Метрики агентов: агент -> тип метрики -> кольцевой буфер."""
+
+    def __init__(self, capacity: int = 1024, max_types: int = 32):
+        self.capacity = capacity
+        self.max_types = max_types
+        self._agents: Dict[int, Dict[str, MetricSeries]] = {}
+
+    def add(self, agent_id: int, metric_type: str, timestamp: float, value: float) -> bool:
+        """Записывает точку. False, если точка старше последней или у агента уже max_types метрик."""
+        series_by_type = self._agents.setdefault(agent_id, {})
+        series = series_by_type.get(metric_type)
+        if series is None:
+            if len(series_by_type) >= self.max_types:
+                return False
+            series = series_by_type[metric_type] = MetricSeries(self.capacity)
+        return series.append(timestamp, value)
+
+    def series(self, agent_id: int) -> Dict[str, MetricSeries]:
+        return self._agents.get(agent_id, {})
+
+    def latest(self, agent_id: int) -> List[Tuple[str, float, float]]:
+        """Последние значения метрик агента: (тип, время, значение)."""
+        result = []
+        for metric_type, series in self.series(agent_id).items():
+            point = series.latest()
+            if point is not None:
+                result.append((metric_type, *point))
+        return result
+
+    def drop_agent(self, agent_id: int):
+        self._agents.pop(agent_id, None)
+
+    def clear(self):
+        self._agents.clear()
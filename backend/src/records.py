@@ -0,0 +1,131 @@
+"""Компактные записи для хранилищ в памяти.
+
+Строка-словарь с datetime стоит сотни байт: сам словарь, ключи и объект
+datetime на каждое поле времени. Record хранит поля в __slots__, а
+значения — в закодированном виде: время как int микросекунд от эпохи,
+статусы как небольшие коды (int до 256 в CPython не создаются заново),
+повторяющиеся строки интернированы. Хранилища принимают и отдают прежние
+словари (from_row / to_row), поэтому остальной код формата записей не видит.
+Поля, не объявленные в __slots__, сохраняются в словаре extra.
+
+Снимки хранилища сохраняют записи по столбцам уже закодированных значений
+(dump_columns / load_columns), без промежуточных словарей и datetime.
+"""
+import sys
+from collections import deque
+from enum import Enum
+from itertools import repeat
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+Codec = Tuple[Callable[[Any], Any], Callable[[Any], Any]]
+
+_MISSING = object()
+
+
+class Codes:
+    """Таблица значение <-> код для полей с небольшим числом значений (статусы)."""
+
+    def __init__(self, values: Iterable[str] = ()):
+        self._values: List[Any] = []
+        self._codes: Dict[Any, int] = {}
+        for value in values:
+            self.encode(value)
+
+    def encode(self, value: Any) -> int:
+        # Строковые перечисления кодируются по значению, как и обычные строки
+        value = value.value if isinstance(value, Enum) else value
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._values)
+            self._values.append(value)
+        return code
+
+    def decode(self, code: int) -> Any:
+        return self._values[code]
+
+    @property
+    def values(self) -> List[Any]:
+        """Значения в порядке кодов."""
+        return list(self._values)
+
+    @property
+    def codec(self) -> Codec:
+        # Декодирование — обычная индексация списка, без вызова метода на Python
+        return self.encode, self._values.__getitem__
+
+
+def intern_text(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+INTERNED: Codec = (intern_text, lambda value: value)
+
+
+class Record:
+    """Запись с полями в __slots__ подкласса; CODECS — поле -> (кодирование, декодирование)."""
+
+    __slots__ = ("extra",)
+    CODECS: Dict[str, Codec] = {}
+    FIELDS: frozenset = frozenset()
+    _DECODERS: Tuple[Tuple[str, Optional[Callable[[Any], Any]]], ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELDS = frozenset(cls.__slots__)
+        cls._DECODERS = tuple((name, cls.CODECS[name][1] if name in cls.CODECS else None) for name in cls.__slots__)
+
+    def __init__(self, row: dict):
+        self.extra: Optional[dict] = None
+        self.update(row)
+
+    def update(self, fields: dict):
+        for name, value in fields.items():
+            if name in self.FIELDS:
+                codec = self.CODECS.get(name)
+                setattr(self, name, value if codec is None or value is None else codec[0](value))
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[name] = value
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """Исходное (декодированное) значение поля."""
+        if name not in self.FIELDS:
+            return default if self.extra is None else self.extra.get(name, default)
+        value = getattr(self, name, _MISSING)
+        if value is _MISSING:
+            return default
+        codec = self.CODECS.get(name)
+        return value if codec is None or value is None else codec[1](value)
+
+    @classmethod
+    def dump_columns(cls, records: List["Record"]) -> tuple:
+        """Закодированные значения записей: список на каждое поле __slots__ (Ellipsis — поле не задано) и extra."""
+        return tuple([getattr(record, name, ...) for record in records] for name in cls.__slots__ + ("extra",))
+
+    @classmethod
+    def load_columns(cls, columns: tuple) -> List["Record"]:
+        """Записи из столбцов dump_columns, без повторного кодирования значений."""
+        records = list(map(cls.__new__, repeat(cls, len(columns[0]))))
+        for name, column in zip(cls.__slots__ + ("extra",), columns):
+            # Дескриптор слота присваивает значения столбца в map, без цикла на Python
+            assign = getattr(cls, name).__set__
+            if ... in column:
+                for record, value in zip(records, column):
+                    if value is not ...:
+                        assign(record, value)
+            else:
+                deque(map(assign, records, column), maxlen=0)
+        return records
+
+    def to_row(self) -> dict:
+        row = {}
+        for name, decode in self._DECODERS:
+            try:
+                value = getattr(self, name)
+            except AttributeError:
+                continue
+            row[name] = value if decode is None or value is None else decode(value)
+        if self.extra:
+            row.update(self.extra)
+        return row
@@ -0,0 +1,445 @@
+"""SQL-хранилище на асинхронном SQLAlchemy (PostgreSQL через asyncpg, SQLite через aiosqlite).
+
+Соединения берутся из пула движка, поэтому несколько воркеров uvicorn
+работают с общей базой. Индексы покрывают выборки API: сообщения по
+отправителю/получателю и времени, задачи по агенту, статусу и сроку.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import (JSON, BigInteger, Column, DateTime, Index, Integer, MetaData, String, Table, Text,
+                        and_, case, delete, func, insert, or_, select, true, tuple_, union, update)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from message_store import MessageKey, from_micros
+from storage import Storage
+from task_store import TaskKey
+
+metadata = MetaData()
+
+agents = Table(
+    "agents", metadata,
+    Column("agent_id", Integer, primary_key=True, autoincrement=False),
+    Column("agent_type", String(255), nullable=False, index=True),
+    Column("status", String(20), nullable=False, index=True),
+    Column("priority_level", Integer, nullable=False, index=True),
+    Column("configuration", JSON, nullable=False),
+    Column("config_version", Integer, nullable=False, default=1),
+    Column("last_heartbeat", DateTime, nullable=False),
+)
+
+messages = Table(
+    "messages", metadata,
+    Column("message_id", Integer, primary_key=True, autoincrement=False),
+    Column("sender_id", Integer, nullable=False),
+    Column("receiver_id", Integer, nullable=False),
+    Column("content", Text, nullable=False),
+    Column("timestamp", DateTime, nullable=False),
+    Index("ix_messages_sender_id", "sender_id", "timestamp", "message_id"),
+    Index("ix_messages_receiver_id", "receiver_id", "timestamp", "message_id"),
+)
+
+tasks = Table(
+    "tasks", metadata,
+    Column("task_id", Integer, primary_key=True, autoincrement=False),
+    Column("priority", Integer, nullable=False),
+    Column("assigned_agent_id", Integer, nullable=False),
+    Column("deadline", DateTime, nullable=False, index=True),
+    Column("status", String(20), nullable=False, index=True),
+    Index("ix_tasks_assigned_agent_id", "assigned_agent_id", "status", "deadline"),
+)
+
+integrations = Table(
+    "integrations", metadata,
+    Column("integration_id", Integer, primary_key=True, autoincrement=False),
+    Column("system_name", String(255), nullable=False),
+    Column("api_url", String(2048), nullable=False),
+    Column("auth_details", JSON, nullable=False),
+)
+
+users = Table(
+    "users", metadata,
+    Column("user_id", Integer, primary_key=True, autoincrement=False),
+    Column("username", String(255), nullable=False, unique=True),
+    Column("password", String(255), nullable=False),
+    Column("role", String(20), nullable=False),
+)
+
+coordinations = Table(
+    "coordinations", metadata,
+    Column("coordination_id", Integer, primary_key=True, autoincrement=False),
+    Column("action", String(255), nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("deadline", DateTime, nullable=False),
+)
+
+coordination_participants = Table(
+    "coordination_participants", metadata,
+    Column("coordination_id", Integer, primary_key=True),
+    Column("agent_id", Integer, primary_key=True),
+    Column("state", String(20), nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+    Index("ix_coordination_participants_state", "coordination_id", "state"),
+)
+
+# Счётчики id по схеме hi/lo: воркеры резервируют из них блоки
+id_sequences = Table(
+    "id_sequences", metadata,
+    Column("name", String(50), primary_key=True),
+    Column("next_id", BigInteger, nullable=False),
+)
+
+TABLES = {"agents": agents, "messages": messages, "tasks": tasks, "integrations": integrations, "users": users,
+          "coordinations": coordinations}
+
+
+def _primary_key(table: Table) -> Column:
+    return list(table.primary_key.columns)[0]
+
+
+def _utc(value):
+    # Колонки DateTime без часового пояса: время с поясом приводится к наивному UTC, как to_micros в памяти
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _utc_row(row: dict) -> dict:
+    return {field: _utc(value) for field, value in row.items()}
+
+
+def _row(row) -> Optional[dict]:
+    return None if row is None else dict(row._mapping)
+
+
+class SQLStorage(Storage):
+    """Хранилище в реляционной базе с пулом соединений."""
+
+    def __init__(self, database_url: str, pool_size: int = 10, max_overflow: int = 20, id_block_size: int = 100):
+        super().__init__(id_block_size)
+        options = {"pool_pre_ping": True}
+        if not database_url.startswith("sqlite"):
+            options.update(pool_size=pool_size, max_overflow=max_overflow)
+        self.engine = create_async_engine(database_url, **options)
+
+    async def connect(self):
+        async with self.engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+        for name, table in TABLES.items():
+            # Счётчик продолжает существующие данные; несколько воркеров могут создавать его одновременно
+            try:
+                async with self.engine.begin() as conn:
+                    exists = (await conn.execute(select(id_sequences.c.name).where(id_sequences.c.name == name))).first()
+                    if exists is None:
+                        last_id = (await conn.execute(select(func.max(_primary_key(table))))).scalar() or 0
+                        await conn.execute(insert(id_sequences).values(name=name, next_id=last_id + 1))
+            except IntegrityError:
+                pass
+
+    async def reserve_ids(self, collection: str, count: int) -> int:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                update(id_sequences).where(id_sequences.c.name == collection)
+                .values(next_id=id_sequences.c.next_id + count).returning(id_sequences.c.next_id)
+            )
+            return result.scalar_one() - count
+
+    async def close(self):
+        await self.engine.dispose()
+
+    async def _insert(self, table: Table, values: dict) -> int:
+        key = _primary_key(table)
+        record_id = await self.ids.next_id(table.name)
+        async with self.engine.begin() as conn:
+            await conn.execute(insert(table).values(**_utc_row(values), **{key.name: record_id}))
+        return record_id
+
+    async def _get(self, table: Table, record_id: int) -> Optional[dict]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(select(table).where(_primary_key(table) == record_id))
+            return _row(result.first())
+
+    async def _update(self, table: Table, record_id: int, fields: dict) -> bool:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(update(table).where(_primary_key(table) == record_id).values(**_utc_row(fields)))
+            return result.rowcount > 0
+
+    # Агенты
+    async def add_agent(self, agent: dict) -> int:
+        return await self._insert(agents, agent)
+
+    async def get_agent(self, agent_id: int) -> Optional[dict]:
+        return await self._get(agents, agent_id)
+
+    async def update_agent(self, agent_id: int, fields: dict) -> bool:
+        return await self._update(agents, agent_id, fields)
+
+    async def update_config(self, agent_id: int, configuration: dict,
+                            expected_version: Optional[int] = None) -> Optional[int]:
+        condition = agents.c.agent_id == agent_id
+        if expected_version is not None:
+            condition = and_(condition, agents.c.config_version == expected_version)
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                update(agents).where(condition)
+                .values(configuration=configuration, config_version=agents.c.config_version + 1)
+                .returning(agents.c.config_version)
+            )
+            return result.scalar()
+
+    async def delete_agent(self, agent_id: int) -> bool:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(delete(agents).where(agents.c.agent_id == agent_id))
+            if result.rowcount == 0:
+                return False
+            await self._delete_messages(conn, [agent_id])
+            return True
+
+    @staticmethod
+    async def _delete_messages(conn, agent_ids: List[int], chunk: int = 500):
+        # Сообщения удалённых агентов удаляются в той же транзакции, как и в хранилище в памяти
+        for first in range(0, len(agent_ids), chunk):
+            ids = agent_ids[first:first + chunk]
+            await conn.execute(delete(messages).where(or_(messages.c.sender_id.in_(ids), messages.c.receiver_id.in_(ids))))
+
+    async def missing_agents(self, agent_ids: List[int]) -> List[int]:
+        if not agent_ids:
+            return []
+        async with self.engine.connect() as conn:
+            result = await conn.execute(select(agents.c.agent_id).where(agents.c.agent_id.in_(set(agent_ids))))
+            found = set(result.scalars())
+        return [agent_id for agent_id in agent_ids if agent_id not in found]
+
+    async def add_agents(self, rows: List[dict]) -> List[int]:
+        if not rows:
+            return []
+        agent_ids = await self.ids.next_ids("agents", len(rows))
+        async with self.engine.begin() as conn:
+            await conn.execute(insert(agents), [{**_utc_row(row), "agent_id": agent_id} for agent_id, row in zip(agent_ids, rows)])
+        return agent_ids
+
+    @staticmethod
+    def _agent_filter(agent_ids: Optional[List[int]], selector: Optional[dict]):
+        conditions = [agents.c[field] == value for field, value in (selector or {}).items()]
+        if agent_ids is not None:
+            conditions.append(agents.c.agent_id.in_(set(agent_ids)))
+        return and_(true(), *conditions)
+
+    async def update_agents(self, fields: dict, agent_ids: Optional[List[int]] = None,
+                            selector: Optional[dict] = None) -> List[int]:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                update(agents).where(self._agent_filter(agent_ids, selector)).values(**_utc_row(fields))
+                .returning(agents.c.agent_id)
+            )
+            return list(result.scalars())
+
+    async def delete_agents(self, agent_ids: Optional[List[int]] = None,
+                            selector: Optional[dict] = None) -> List[int]:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                delete(agents).where(self._agent_filter(agent_ids, selector)).returning(agents.c.agent_id)
+            )
+            deleted = list(result.scalars())
+            await self._delete_messages(conn, deleted)
+            return deleted
+
+    async def count_agents(self) -> int:
+        async with self.engine.connect() as conn:
+            return (await conn.execute(select(func.count()).select_from(agents))).scalar_one()
+
+    async def count_agents_by_status(self) -> Dict[str, int]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(select(agents.c.status, func.count()).group_by(agents.c.status))
+            return {status: count for status, count in result}
+
+    async def list_agents(self, filters: dict, sort_by: str = "agent_id", descending: bool = False,
+                          limit: int = 100, offset: int = 0) -> Tuple[int, List[dict]]:
+        condition = and_(true(), *(agents.c[field] == value for field, value in filters.items()))
+        order = [agents.c[sort_by], agents.c.agent_id] if sort_by != "agent_id" else [agents.c.agent_id]
+        if descending:
+            order = [column.desc() for column in order]
+        async with self.engine.connect() as conn:
+            total = (await conn.execute(select(func.count()).select_from(agents).where(condition))).scalar_one()
+            result = await conn.execute(select(agents).where(condition).order_by(*order).limit(limit).offset(offset))
+            return total, [_row(row) for row in result]
+
+    # Сообщения
+    async def add_message(self, message: dict) -> int:
+        return await self._insert(messages, message)
+
+    async def add_messages(self, rows: List[dict]) -> List[int]:
+        if not rows:
+            return []
+        message_ids = await self.ids.next_ids("messages", len(rows))
+        async with self.engine.begin() as conn:
+            await conn.execute(insert(messages), [{**_utc_row(row), "message_id": message_id} for message_id, row in zip(message_ids, rows)])
+        return message_ids
+
+    async def list_messages(self, agent_id: int, limit: int, after: Optional[MessageKey] = None,
+                            since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[dict]:
+        def side(column):
+            # Каждая половина объединения читается по своему индексу (agent, timestamp, message_id)
+            conditions = [column == agent_id]
+            if after is not None:
+                conditions.append(tuple_(messages.c.timestamp, messages.c.message_id) > tuple_(from_micros(after[0]), after[1]))
+            if since is not None:
+                conditions.append(messages.c.timestamp >= _utc(since))
+            if until is not None:
+                conditions.append(messages.c.timestamp <= _utc(until))
+            return (select(messages).where(and_(*conditions))
+                    .order_by(messages.c.timestamp, messages.c.message_id).limit(limit))
+
+        # UNION убирает дубликат сообщения самому себе
+        both = union(*(select(side(column).subquery()) for column in (messages.c.sender_id, messages.c.receiver_id))).subquery()
+        query = select(both).order_by(both.c.timestamp, both.c.message_id).limit(limit)
+        async with self.engine.connect() as conn:
+            return [dict(row._mapping) for row in await conn.execute(query)]
+
+    # Задачи
+    async def add_task(self, task: dict) -> int:
+        return await self._insert(tasks, task)
+
+    async def get_task(self, task_id: int) -> Optional[dict]:
+        return await self._get(tasks, task_id)
+
+    async def transition_task(self, task_id: int, from_status: str, to_status: str) -> bool:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                update(tasks).where(tasks.c.task_id == task_id, tasks.c.status == from_status)
+                .values(status=to_status)
+            )
+            return result.rowcount > 0
+
+    async def list_tasks(self, filters: dict, limit: int, deadline_from: Optional[datetime] = None,
+                         deadline_to: Optional[datetime] = None, after: Optional[TaskKey] = None) -> List[dict]:
+        conditions = [tasks.c[field] == value for field, value in filters.items()]
+        if after is not None:
+            conditions.append(tuple_(tasks.c.deadline, tasks.c.task_id) > tuple_(from_micros(after[0]), after[1]))
+        if deadline_from is not None:
+            conditions.append(tasks.c.deadline >= _utc(deadline_from))
+        if deadline_to is not None:
+            conditions.append(tasks.c.deadline <= _utc(deadline_to))
+        query = select(tasks).where(and_(true(), *conditions)).order_by(tasks.c.deadline, tasks.c.task_id).limit(limit)
+        async with self.engine.connect() as conn:
+            return [dict(row._mapping) for row in await conn.execute(query)]
+
+    # Координации
+    async def add_coordination(self, coordination: dict, agent_ids: List[int]) -> int:
+        coordination_id = await self.ids.next_id("coordinations")
+        async with self.engine.begin() as conn:
+            await conn.execute(insert(coordinations).values(**_utc_row(coordination), coordination_id=coordination_id))
+            if agent_ids:
+                await conn.execute(insert(coordination_participants), [
+                    {"coordination_id": coordination_id, "agent_id": agent_id, "state": "pending",
+                     "updated_at": _utc(coordination["created_at"])}
+                    for agent_id in agent_ids
+                ])
+        return coordination_id
+
+    async def get_coordination(self, coordination_id: int) -> Optional[dict]:
+        return await self._get(coordinations, coordination_id)
+
+    async def list_participants(self, coordination_id: int) -> List[dict]:
+        query = (select(coordination_participants.c.agent_id, coordination_participants.c.state,
+                        coordination_participants.c.updated_at)
+                 .where(coordination_participants.c.coordination_id == coordination_id)
+                 .order_by(coordination_participants.c.agent_id))
+        async with self.engine.connect() as conn:
+            return [dict(row._mapping) for row in await conn.execute(query)]
+
+    async def count_participants(self, coordination_id: int) -> Dict[str, int]:
+        query = (select(coordination_participants.c.state, func.count())
+                 .where(coordination_participants.c.coordination_id == coordination_id)
+                 .group_by(coordination_participants.c.state))
+        async with self.engine.connect() as conn:
+            return {state: count for state, count in await conn.execute(query)}
+
+    async def set_participant_state(self, coordination_id: int, agent_ids: List[int],
+                                    from_states: List[str], state: str) -> List[int]:
+        if not agent_ids:
+            return []
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                update(coordination_participants)
+                .where(coordination_participants.c.coordination_id == coordination_id,
+                       coordination_participants.c.agent_id.in_(set(agent_ids)),
+                       coordination_participants.c.state.in_(from_states))
+                .values(state=state, updated_at=datetime.utcnow())
+                .returning(coordination_participants.c.agent_id)
+            )
+            return list(result.scalars())
+
+    # Интеграции
+    async def add_integration(self, integration: dict) -> int:
+        return await self._insert(integrations, integration)
+
+    async def get_integration(self, integration_id: int) -> Optional[dict]:
+        return await self._get(integrations, integration_id)
+
+    async def list_integrations(self) -> List[dict]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(select(integrations).order_by(integrations.c.integration_id))
+            return [dict(row._mapping) for row in result]
+
+    # Пользователи
+    async def add_user(self, user: dict) -> int:
+        try:
+            if "user_id" not in user:
+                return await self._insert(users, user)
+            # Явно заданный id (начальные данные) сдвигает счётчик, чтобы не выдать его повторно
+            async with self.engine.begin() as conn:
+                await conn.execute(insert(users).values(**user))
+                await conn.execute(
+                    update(id_sequences).where(id_sequences.c.name == "users")
+                    .values(next_id=case((id_sequences.c.next_id <= user["user_id"], user["user_id"] + 1),
+                                         else_=id_sequences.c.next_id))
+                )
+            return user["user_id"]
+        except IntegrityError:
+            raise ValueError(f"Username {user['username']!r} already exists")
+
+    async def get_user(self, username: str) -> Optional[dict]:
+        async with self.engine.connect() as conn:
+            return _row((await conn.execute(select(users).where(users.c.username == username))).first())
+
+    async def get_user_by_id(self, user_id: int) -> Optional[dict]:
+        return await self._get(users, user_id)
+
+    async def update_user(self, user_id: int, fields: dict) -> bool:
+        try:
+            return await self._update(users, user_id, fields)
+        except IntegrityError:
+            raise ValueError(f"Username {fields.get('username')!r} already exists")
+
+    async def delete_user(self, user_id: int) -> bool:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(delete(users).where(users.c.user_id == user_id))
+            return result.rowcount > 0
+
+    async def list_users(self, limit: int, offset: int = 0) -> Tuple[int, List[dict]]:
+        async with self.engine.connect() as conn:
+            total = (await conn.execute(select(func.count()).select_from(users))).scalar()
+            result = await conn.execute(select(users).order_by(users.c.user_id).limit(limit).offset(offset))
+            return total, [dict(row._mapping) for row in result]
+
+    # Выгрузка
+    async def iter_records(self, collection: str, after_id: int = 0, batch_size: int = 500):
+        table = TABLES[collection]
+        key = _primary_key(table)
+        async with self.engine.connect() as conn:
+            last_id = (await conn.execute(select(func.max(key)))).scalar() or 0
+        while True:
+            async with self.engine.connect() as conn:
+                result = await conn.execute(
+                    select(table).where(key > after_id, key <= last_id).order_by(key).limit(batch_size)
+                )
+                batch = []
+                for row in result:
+                    record = dict(row._mapping)
+                    batch.append((record.pop(key.name), record))
+            if not batch:
+                return
+            yield batch
+            after_id = batch[-1][0]
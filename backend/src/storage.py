@@ -0,0 +1,508 @@
+"""Слой хранения данных.
+
+Storage описывает операции, которые использует API. MemoryStorage хранит
+всё в памяти процесса (быстро, подходит для тестов и разработки),
+DurableMemoryStorage (durable_storage.py) — тоже в памяти, но с журналом
+и снимками на диске, SQLStorage (sql_storage.py) — в PostgreSQL через
+асинхронный SQLAlchemy.
+Записи передаются как словари с теми же полями, что и в моделях API;
+агенты, задачи и сообщения в памяти хранятся компактными записями
+(records.py) и преобразуются в словари при чтении.
+"""
+import heapq
+import os
+from bisect import bisect_right
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from agent_store import AgentStore
+from ids import IdAllocator
+from message_store import MessageKey, MessageStore
+from task_store import TaskKey, TaskStore
+from user_store import UserStore
+
+COLLECTIONS = ("users", "agents", "tasks", "messages", "integrations", "coordinations")
+
+# Поля, по которым можно сортировать список агентов (при равенстве — по agent_id)
+AGENT_SORT_FIELDS = ("agent_id", "agent_type", "priority_level", "last_heartbeat")
+
+
+class Storage:
+    """Интерфейс хранилища. Все методы асинхронные.
+
+    id новых записей выдаёт self.ids, резервируя блоки через reserve_ids.
+    """
+
+    def __init__(self, id_block_size: int = 100):
+        self.ids = IdAllocator(self.reserve_ids, id_block_size)
+
+    async def connect(self):
+        """Подготавливает хранилище к работе (соединения, схема)."""
+
+    async def close(self):
+        """Освобождает ресурсы хранилища."""
+
+    async def reserve_ids(self, collection: str, count: int) -> int:
+        """Атомарно резервирует count последовательных id коллекции и возвращает первый."""
+        raise NotImplementedError
+
+    # Агенты
+    async def add_agent(self, agent: dict) -> int:
+        raise NotImplementedError
+
+    async def get_agent(self, agent_id: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def update_agent(self, agent_id: int, fields: dict) -> bool:
+        raise NotImplementedError
+
+    async def update_config(self, agent_id: int, configuration: dict,
+                            expected_version: Optional[int] = None) -> Optional[int]:
+        """Записывает конфигурацию и увеличивает config_version; возвращает новую версию.
+
+        При заданном expected_version запись выполняется, только если текущая версия совпадает
+        (compare-and-set). None — агента нет или версия изменилась.
+        """
+        raise NotImplementedError
+
+    async def delete_agent(self, agent_id: int) -> bool:
+        """Удаляет агента вместе с сообщениями, которые он отправил или получил."""
+        raise NotImplementedError
+
+    async def missing_agents(self, agent_ids: List[int]) -> List[int]:
+        """Возвращает id из списка, для которых нет агента."""
+        raise NotImplementedError
+
+    async def add_agents(self, agents: List[dict]) -> List[int]:
+        """Добавляет агентов одной транзакцией и возвращает их id в том же порядке."""
+        raise NotImplementedError
+
+    async def update_agents(self, fields: dict, agent_ids: Optional[List[int]] = None,
+                            selector: Optional[dict] = None) -> List[int]:
+        """Обновляет агентов из списка agent_ids или совпадающих с selector одной транзакцией.
+
+        Если заданы оба, обновляются агенты из списка, совпадающие с selector.
+        Возвращает id обновлённых агентов.
+        """
+        raise NotImplementedError
+
+    async def delete_agents(self, agent_ids: Optional[List[int]] = None,
+                            selector: Optional[dict] = None) -> List[int]:
+        """Удаляет агентов из списка agent_ids или совпадающих с selector одной транзакцией.
+
+        Сообщения удалённых агентов удаляются в той же транзакции. Возвращает id удалённых агентов.
+        """
+        raise NotImplementedError
+
+    async def count_agents(self) -> int:
+        raise NotImplementedError
+
+    async def count_agents_by_status(self) -> Dict[str, int]:
+        """Число агентов в каждом статусе (статусы без агентов не включаются)."""
+        raise NotImplementedError
+
+    async def list_agents(self, filters: dict, sort_by: str = "agent_id", descending: bool = False,
+                          limit: int = 100, offset: int = 0) -> Tuple[int, List[dict]]:
+        """Возвращает число агентов, совпадающих с filters, и страницу из них в заданном порядке.
+
+        filters — равенства по полям agent_type, status, priority_level; sort_by — из AGENT_SORT_FIELDS.
+        """
+        raise NotImplementedError
+
+    # Сообщения
+    async def add_message(self, message: dict) -> int:
+        raise NotImplementedError
+
+    async def add_messages(self, messages: List[dict]) -> List[int]:
+        """Добавляет сообщения одной транзакцией и возвращает их id в том же порядке."""
+        raise NotImplementedError
+
+    async def list_messages(self, agent_id: int, limit: int, after: Optional[MessageKey] = None,
+                            since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[dict]:
+        """Возвращает до limit сообщений агента в порядке (timestamp, message_id)."""
+        raise NotImplementedError
+
+    # Задачи
+    async def add_task(self, task: dict) -> int:
+        raise NotImplementedError
+
+    async def get_task(self, task_id: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def transition_task(self, task_id: int, from_status: str, to_status: str) -> bool:
+        """Переводит задачу в to_status, только если её текущий статус from_status (compare-and-set)."""
+        raise NotImplementedError
+
+    async def list_tasks(self, filters: dict, limit: int, deadline_from: Optional[datetime] = None,
+                         deadline_to: Optional[datetime] = None, after: Optional[TaskKey] = None) -> List[dict]:
+        """Возвращает до limit задач в порядке (deadline, task_id).
+
+        filters — равенства по полям assigned_agent_id, status, priority; границы срока включительны.
+        """
+        raise NotImplementedError
+
+    # Координации
+    async def add_coordination(self, coordination: dict, agent_ids: List[int]) -> int:
+        """Сохраняет сессию координации {action, created_at, deadline} с участниками в состоянии pending."""
+        raise NotImplementedError
+
+    async def get_coordination(self, coordination_id: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def list_participants(self, coordination_id: int) -> List[dict]:
+        """Участники координации {agent_id, state, updated_at} в порядке agent_id."""
+        raise NotImplementedError
+
+    async def count_participants(self, coordination_id: int) -> Dict[str, int]:
+        """Число участников координации в каждом состоянии."""
+        raise NotImplementedError
+
+    async def set_participant_state(self, coordination_id: int, agent_ids: List[int],
+                                    from_states: List[str], state: str) -> List[int]:
+        """Переводит участников из from_states в state (compare-and-set) и возвращает id переведённых."""
+        raise NotImplementedError
+
+    # Интеграции
+    async def add_integration(self, integration: dict) -> int:
+        raise NotImplementedError
+
+    async def get_integration(self, integration_id: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def list_integrations(self) -> List[dict]:
+        raise NotImplementedError
+
+    # Пользователи
+    async def add_user(self, user: dict) -> int:
+        """Добавляет пользователя {username, password, role}; user_id назначается, если не передан.
+
+        Бросает ValueError, если имя уже занято.
+        """
+        raise NotImplementedError
+
+    async def get_user(self, username: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def get_user_by_id(self, user_id: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def update_user(self, user_id: int, fields: dict) -> bool:
+        """Изменяет поля пользователя, в том числе username. Бросает ValueError, если новое имя занято."""
+        raise NotImplementedError
+
+    async def delete_user(self, user_id: int) -> bool:
+        raise NotImplementedError
+
+    async def list_users(self, limit: int, offset: int = 0) -> Tuple[int, List[dict]]:
+        """(число пользователей, страница пользователей по возрастанию user_id)."""
+        raise NotImplementedError
+
+    # Выгрузка
+    def iter_records(self, collection: str, after_id: int = 0, batch_size: int = 500) -> AsyncIterator[List[Tuple[int, dict]]]:
+        """Асинхронно выдаёт записи коллекции с id > after_id порциями в порядке возрастания id."""
+        raise NotImplementedError
+
+
+class MemoryStorage(Storage):
+    """Хранилище в памяти процесса. Состояние теряется при перезапуске и не разделяется между процессами."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Удаляет все данные (используется в тестах)."""
+        # В пределах одного процесса резервировать блоки незачем
+        super().__init__(id_block_size=1)
+        self._sequences: Dict[str, int] = {}
+        self.users = UserStore()
+        self.agents = AgentStore()
+        self.tasks = TaskStore()
+        self.messages = MessageStore()
+        self.integrations: Dict[int, dict] = {}
+        self.coordinations: Dict[int, dict] = {}
+        # coordination_id -> agent_id -> {state, updated_at}
+        self.participants: Dict[int, Dict[int, dict]] = {}
+
+    async def reserve_ids(self, collection: str, count: int) -> int:
+        first = self._sequences.get(collection, 1)
+        self._sequences[collection] = first + count
+        return first
+
+    # Агенты
+    async def add_agent(self, agent: dict) -> int:
+        agent_id = await self.ids.next_id("agents")
+        self.agents[agent_id] = {"config_version": 1, **agent}
+        return agent_id
+
+    async def get_agent(self, agent_id: int) -> Optional[dict]:
+        agent = self.agents.get(agent_id)
+        return None if agent is None else {"agent_id": agent_id, **agent}
+
+    async def update_agent(self, agent_id: int, fields: dict) -> bool:
+        if agent_id not in self.agents:
+            return False
+        self.agents.update_fields(agent_id, fields)
+        return True
+
+    async def update_config(self, agent_id: int, configuration: dict,
+                            expected_version: Optional[int] = None) -> Optional[int]:
+        agent = self.agents.get(agent_id)
+        if agent is None or (expected_version is not None and agent["config_version"] != expected_version):
+            return None
+        version = agent["config_version"] + 1
+        self.agents.update_fields(agent_id, {"configuration": configuration, "config_version": version})
+        return version
+
+    async def delete_agent(self, agent_id: int) -> bool:
+        if self.agents.pop(agent_id, None) is None:
+            return False
+        self.messages.drop_agent(agent_id)
+        return True
+
+    async def missing_agents(self, agent_ids: List[int]) -> List[int]:
+        return [agent_id for agent_id in agent_ids if agent_id not in self.agents]
+
+    async def count_agents(self) -> int:
+        return len(self.agents)
+
+    async def count_agents_by_status(self) -> Dict[str, int]:
+        return self.agents.counts("status")
+
+    async def list_agents(self, filters: dict, sort_by: str = "agent_id", descending: bool = False,
+                          limit: int = 100, offset: int = 0) -> Tuple[int, List[dict]]:
+        if not filters and sort_by == "agent_id":
+            # Без фильтров страница — срез отсортированного списка id
+            page = [{"agent_id": agent_id, **self.agents[agent_id]}
+                    for agent_id in self.agents.page(offset, limit, descending)]
+            return len(self.agents), page
+        agent_ids = self.agents.select(filters)
+        if sort_by == "agent_id":
+            key = None
+        else:
+            key = lambda agent_id: (self.agents.value(agent_id, sort_by), agent_id)  # noqa: E731
+        wanted = offset + limit
+        if wanted < len(agent_ids):
+            # Нужна только начальная часть порядка: частичная сортировка кучей
+            select = heapq.nlargest if descending else heapq.nsmallest
+            ordered = select(wanted, agent_ids, key=key)
+        else:
+            ordered = sorted(agent_ids, key=key, reverse=descending)
+        page = [{"agent_id": agent_id, **self.agents[agent_id]} for agent_id in ordered[offset:wanted]]
+        return len(agent_ids), page
+
+    # Пакетные операции выполняются без await внутри, поэтому атомарны для цикла событий
+    async def add_agents(self, agents: List[dict]) -> List[int]:
+        agent_ids = await self.ids.next_ids("agents", len(agents)) if agents else []
+        for agent_id, agent in zip(agent_ids, agents):
+            self.agents[agent_id] = {"config_version": 1, **agent}
+        return agent_ids
+
+    def _select_agents(self, agent_ids: Optional[List[int]], selector: Optional[dict]) -> List[int]:
+        if agent_ids is not None:
+            return list(dict.fromkeys(
+                agent_id for agent_id in agent_ids
+                if agent_id in self.agents and (not selector or self.agents.matches(agent_id, selector))
+            ))
+        return sorted(self.agents.select(selector))
+
+    async def update_agents(self, fields: dict, agent_ids: Optional[List[int]] = None,
+                            selector: Optional[dict] = None) -> List[int]:
+        selected = self._select_agents(agent_ids, selector)
+        for agent_id in selected:
+            self.agents.update_fields(agent_id, fields)
+        return selected
+
+    async def delete_agents(self, agent_ids: Optional[List[int]] = None,
+                            selector: Optional[dict] = None) -> List[int]:
+        selected = self._select_agents(agent_ids, selector)
+        self.agents.delete_many(selected)
+        for agent_id in selected:
+            self.messages.drop_agent(agent_id)
+        return selected
+
+    # Сообщения
+    async def add_message(self, message: dict) -> int:
+        message_id = await self.ids.next_id("messages")
+        self.messages[message_id] = message
+        return message_id
+
+    async def add_messages(self, messages: List[dict]) -> List[int]:
+        message_ids = await self.ids.next_ids("messages", len(messages)) if messages else []
+        for message_id, message in zip(message_ids, messages):
+            self.messages[message_id] = message
+        return message_ids
+
+    async def list_messages(self, agent_id: int, limit: int, after: Optional[MessageKey] = None,
+                            since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[dict]:
+        result = []
+        for message_id in self.messages.for_agent(agent_id, after=after, since=since, until=until):
+            if len(result) >= limit:
+                break
+            result.append({"message_id": message_id, **self.messages[message_id]})
+        return result
+
+    # Задачи
+    async def add_task(self, task: dict) -> int:
+        task_id = await self.ids.next_id("tasks")
+        self.tasks[task_id] = task
+        return task_id
+
+    async def get_task(self, task_id: int) -> Optional[dict]:
+        task = self.tasks.get(task_id)
+        return None if task is None else {"task_id": task_id, **task}
+
+    async def transition_task(self, task_id: int, from_status: str, to_status: str) -> bool:
+        task = self.tasks.get(task_id)
+        if task is None or task["status"] != from_status:
+            return False
+        self.tasks.update_fields(task_id, {"status": to_status})
+        return True
+
+    async def list_tasks(self, filters: dict, limit: int, deadline_from: Optional[datetime] = None,
+                         deadline_to: Optional[datetime] = None, after: Optional[TaskKey] = None) -> List[dict]:
+        result = []
+        for task_id in self.tasks.select(filters, deadline_from, deadline_to, after):
+            if len(result) >= limit:
+                break
+            result.append({"task_id": task_id, **self.tasks[task_id]})
+        return result
+
+    # Координации
+    async def add_coordination(self, coordination: dict, agent_ids: List[int]) -> int:
+        coordination_id = await self.ids.next_id("coordinations")
+        self.coordinations[coordination_id] = dict(coordination)
+        self.participants[coordination_id] = {
+            agent_id: {"state": "pending", "updated_at": coordination["created_at"]} for agent_id in agent_ids
+        }
+        return coordination_id
+
+    async def get_coordination(self, coordination_id: int) -> Optional[dict]:
+        coordination = self.coordinations.get(coordination_id)
+        return None if coordination is None else {"coordination_id": coordination_id, **coordination}
+
+    async def list_participants(self, coordination_id: int) -> List[dict]:
+        participants = self.participants.get(coordination_id, {})
+        return [{"agent_id": agent_id, **participants[agent_id]} for agent_id in sorted(participants)]
+
+    async def count_participants(self, coordination_id: int) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for participant in self.participants.get(coordination_id, {}).values():
+            counts[participant["state"]] = counts.get(participant["state"], 0) + 1
+        return counts
+
+    async def set_participant_state(self, coordination_id: int, agent_ids: List[int],
+                                    from_states: List[str], state: str) -> List[int]:
+        participants = self.participants.get(coordination_id, {})
+        now = datetime.utcnow()
+        updated = []
+        for agent_id in dict.fromkeys(agent_ids):
+            participant = participants.get(agent_id)
+            if participant is not None and participant["state"] in from_states:
+                participant["state"] = state
+                participant["updated_at"] = now
+                updated.append(agent_id)
+        return updated
+
+    # Интеграции
+    async def add_integration(self, integration: dict) -> int:
+        integration_id = await self.ids.next_id("integrations")
+        self.integrations[integration_id] = dict(integration)
+        return integration_id
+
+    async def get_integration(self, integration_id: int) -> Optional[dict]:
+        integration = self.integrations.get(integration_id)
+        return None if integration is None else {"integration_id": integration_id, **integration}
+
+    async def list_integrations(self) -> List[dict]:
+        return [{"integration_id": iid, **i} for iid, i in self.integrations.items()]
+
+    # Пользователи
+    async def add_user(self, user: dict) -> int:
+        user = dict(user)
+        if self.users.id_for(user["username"]) is not None:
+            raise ValueError(f"Username {user['username']!r} already exists")
+        user_id = user.pop("user_id", None)
+        if user_id is not None:
+            # Явно заданный id (начальные данные) сдвигает счётчик, чтобы не выдать его повторно
+            self._sequences["users"] = max(self._sequences.get("users", 1), user_id + 1)
+        else:
+            user_id = await self.ids.next_id("users")
+        self.users[user_id] = user
+        return user_id
+
+    async def get_user(self, username: str) -> Optional[dict]:
+        user_id = self.users.id_for(username)
+        return None if user_id is None else {"user_id": user_id, **self.users[user_id]}
+
+    async def get_user_by_id(self, user_id: int) -> Optional[dict]:
+        user = self.users.get(user_id)
+        return None if user is None else {"user_id": user_id, **user}
+
+    async def update_user(self, user_id: int, fields: dict) -> bool:
+        if user_id not in self.users:
+            return False
+        self.users.update_fields(user_id, fields)
+        return True
+
+    async def delete_user(self, user_id: int) -> bool:
+        if user_id not in self.users:
+            return False
+        del self.users[user_id]
+        return True
+
+    async def list_users(self, limit: int, offset: int = 0) -> Tuple[int, List[dict]]:
+        return len(self.users), [{"user_id": user_id, **self.users[user_id]} for user_id in self.users.page(offset, limit)]
+
+    # Выгрузка
+    async def iter_records(self, collection: str, after_id: int = 0, batch_size: int = 500):
+        records = getattr(self, collection)
+        for chunk in self._id_batches(collection, after_id, batch_size):
+            batch = [(record_id, records[record_id]) for record_id in chunk if record_id in records]
+            if batch:
+                yield batch
+
+    def _id_batches(self, collection: str, after_id: int, batch_size: int) -> Iterator[List[int]]:
+        """Порции id коллекции больше after_id по возрастанию; удалённые между порциями id могут попасться."""
+        records = getattr(self, collection)
+        # Агенты и пользователи ведут упорядоченный список id; у остальных коллекций
+        # ключи добавляются по возрастанию, и сортировка снимка почти линейна
+        ids = getattr(records, "sorted_ids", None)
+        if ids is None:
+            ids = sorted(records)
+        # Верхняя граница фиксируется в начале выгрузки: записи, добавленные позже, попадут в следующую
+        last_id = ids[-1] if ids else 0
+        while after_id < last_id:
+            # Позиция ищется заново для каждой порции: между порциями список мог измениться
+            start = bisect_right(ids, after_id)
+            chunk = ids[start:start + batch_size]
+            chunk = chunk[:bisect_right(chunk, last_id)]
+            if not chunk:
+                break
+            after_id = chunk[-1]
+            yield chunk
+
+
+def create_storage(database_url: Optional[str] = None, data_dir: Optional[str] = None) -> Storage:
+    """Создаёт хранилище по DATABASE_URL: SQL, если адрес задан, иначе в памяти.
+
+    Хранилище в памяти сохраняет изменения в журнал и снимки, если задан каталог DATA_DIR.
+    """
+    database_url = database_url if database_url is not None else os.getenv("DATABASE_URL", "")
+    data_dir = data_dir if data_dir is not None else os.getenv("DATA_DIR", "")
+    if not database_url and data_dir:
+        from durable_storage import DurableMemoryStorage
+        return DurableMemoryStorage(
+            data_dir,
+            sync=os.getenv("WAL_SYNC", "1") != "0",
+            snapshot_interval=float(os.getenv("SNAPSHOT_INTERVAL", "60")),
+            snapshot_wal_bytes=int(os.getenv("SNAPSHOT_WAL_BYTES", str(64 * 1024 * 1024))),
+        )
+    if not database_url:
+        return MemoryStorage()
+    from sql_storage import SQLStorage
+    return SQLStorage(
+        database_url,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        id_block_size=int(os.getenv("ID_BLOCK_SIZE", "100")),
+    )
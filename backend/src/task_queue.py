@@ -0,0 +1,158 @@
+"""Очередь задач на исполнение с арендой (lease).
+
+Для каждого агента ведётся куча ожидающих задач, упорядоченная по
+приоритету (больше — важнее), затем по сроку и id. Выдача задачи агенту
+стоит O(log n) независимо от размера очереди. Выданная задача арендуется
+на lease_seconds; если агент не завершил её вовремя, задача возвращается
+в очередь: expire_leases вызывается фоновой корутиной и перед каждой
+выдачей задачи.
+
+Убранные из очереди задачи удаляются из кучи лениво, при выдаче; чтобы
+устаревшие записи не копились, куча агента перестраивается, когда их
+становится больше, чем живых.
+"""
+import heapq
+import time
+from typing import Dict, List, Optional, Tuple
+
+from message_store import to_micros
+
+# (-priority, deadline в микросекундах, task_id)
+QueueKey = Tuple[int, int, int]
+
+
+class Lease:
+    __slots__ = ("task_id", "agent_id", "expires_at", "key")
+
+    def __init__(self, task_id: int, agent_id: int, expires_at: float, key: QueueKey):
+        self.task_id = task_id
+        self.agent_id = agent_id
+        self.expires_at = expires_at
+        self.key = key
+
+
+class TaskQueue:
+    """Кучи ожидающих задач по агентам и куча сроков аренды."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._pending: Dict[int, List[QueueKey]] = {}
+        # task_id -> (agent_id, key) для задач, лежащих в очереди; записи кучи без пары здесь считаются удалёнными
+        self._queued: Dict[int, Tuple[int, QueueKey]] = {}
+        # agent_id -> число живых записей в его куче
+        self._live: Dict[int, int] = {}
+        self._leases: Dict[int, Lease] = {}
+        self._lease_heap: List[Tuple[float, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    @staticmethod
+    def make_key(task: dict) -> QueueKey:
+        return -task["priority"], to_micros(task["deadline"]), task["task_id"]
+
+    def push(self, task: dict):
+        """Ставит задачу (словарь с task_id, priority, deadline, assigned_agent_id) в очередь агента."""
+        self._push(task["assigned_agent_id"], self.make_key(task))
+
+    def _push(self, agent_id: int, key: QueueKey):
+        # Задача, уже стоящая в очереди, переставляется: прежняя запись становится устаревшей
+        self._unqueue(key[2])
+        self._queued[key[2]] = (agent_id, key)
+        self._live[agent_id] = self._live.get(agent_id, 0) + 1
+        heapq.heappush(self._pending.setdefault(agent_id, []), key)
+
+    def _unqueue(self, task_id: int):
+        """Убирает задачу из очереди; её запись в куче остаётся до выдачи или перестройки кучи."""
+        queued = self._queued.pop(task_id, None)
+        if queued is None:
+            return
+        agent_id = queued[0]
+        live = self._live[agent_id] - 1
+        if not live:
+            del self._live[agent_id]
+            self._pending.pop(agent_id, None)
+            return
+        self._live[agent_id] = live
+        heap = self._pending[agent_id]
+        if len(heap) > 2 * live:
+            heap[:] = [key for key in heap if self._queued.get(key[2]) == (agent_id, key)]
+            heapq.heapify(heap)
+
+    def discard(self, task_id: int):
+        """Убирает задачу из очереди и аренды (например, при удалении или ручной смене статуса)."""
+        self._unqueue(task_id)
+        self._leases.pop(task_id, None)
+
+    def drop_agent(self, agent_id: int):
+        """Удаляет очередь агента вместе с его арендами."""
+        self._live.pop(agent_id, None)
+        for key in self._pending.pop(agent_id, []):
+            # Задачу могли переназначить другому агенту
+            if self._queued.get(key[2]) == (agent_id, key):
+                del self._queued[key[2]]
+        for task_id in [t for t, lease in self._leases.items() if lease.agent_id == agent_id]:
+            del self._leases[task_id]
+
+    def expire_leases(self, now: Optional[float] = None) -> List[Lease]:
+        """Снимает истёкшие аренды. Задачи не возвращаются в очередь, пока их снова не поставят через push."""
+        now = time.time() if now is None else now
+        expired = []
+        while self._lease_heap and self._lease_heap[0][0] <= now:
+            expires_at, task_id = heapq.heappop(self._lease_heap)
+            lease = self._leases.get(task_id)
+            # Запись кучи устарела, если аренду уже завершили или выдали заново
+            if lease is None or lease.expires_at != expires_at:
+                continue
+            del self._leases[task_id]
+            expired.append(lease)
+        return expired
+
+    def restore_lease(self, task: dict, expires_at: float):
+        """Регистрирует аренду задачи, уже находящейся в работе (восстановление после перезапуска)."""
+        lease = Lease(task["task_id"], task["assigned_agent_id"], expires_at, self.make_key(task))
+        self._leases[lease.task_id] = lease
+        heapq.heappush(self._lease_heap, (expires_at, lease.task_id))
+
+    def track_lease(self, task: dict, expires_at: float):
+        """Отмечает задачу выданной в аренду (возможно, другим воркером): убирает из очереди и регистрирует аренду."""
+        self._unqueue(task["task_id"])
+        lease = self._leases.get(task["task_id"])
+        if lease is None or lease.expires_at != expires_at:
+            self.restore_lease(task, expires_at)
+
+    def peek(self, agent_id: int) -> Optional[int]:
+        """Возвращает id следующей задачи агента, не извлекая её."""
+        heap = self._pending.get(agent_id)
+        while heap:
+            key = heap[0]
+            queued = self._queued.get(key[2])
+            if queued is not None and queued == (agent_id, key):
+                return key[2]
+            heapq.heappop(heap)
+        return None
+
+    def lease(self, agent_id: int, lease_seconds: float, now: Optional[float] = None) -> Optional[Lease]:
+        """Извлекает следующую задачу агента и выдаёт её в аренду."""
+        task_id = self.peek(agent_id)
+        if task_id is None:
+            return None
+        key = heapq.heappop(self._pending[agent_id])
+        self._unqueue(task_id)
+        now = time.time() if now is None else now
+        lease = Lease(task_id, agent_id, now + lease_seconds, key)
+        self._leases[task_id] = lease
+        heapq.heappush(self._lease_heap, (lease.expires_at, task_id))
+        return lease
+
+    def get_lease(self, task_id: int) -> Optional[Lease]:
+        lease = self._leases.get(task_id)
+        if lease is None or lease.expires_at <= time.time():
+            return None
+        return lease
+
+    def release(self, task_id: int) -> Optional[Lease]:
+        """Завершает аренду (задача выполнена)."""
+        return self._leases.pop(task_id, None)
@@ -0,0 +1,172 @@
+"""Хранилище задач с индексами по сроку выполнения.
+
+Каждый индекс — отсортированный список ключей (deadline в микросекундах,
+task_id): общий, по агенту, по статусу, по приоритету и по парам
+(агент, статус) и (статус, приоритет). Выборка берёт самый короткий из
+индексов, подходящих под фильтры, находит границы интервала сроков
+бинарным поиском и проверяет остальные условия только у задач внутри
+интервала. Результат сразу
+упорядочен по сроку, а продолжение страницы начинается с позиции курсора.
+
+Задачи хранятся как TaskRecord (records.py): срок — микросекунды от
+эпохи (он же первая часть ключа индексов), статус — код.
+"""
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import MutableMapping
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from message_store import from_micros, to_micros
+from records import Codes, Record
+
+# (срок в микросекундах от эпохи, task_id)
+TaskKey = Tuple[int, int]
+IndexName = Tuple[str, Any]
+
+FILTER_FIELDS = ("assigned_agent_id", "status", "priority")
+
+
+def _value(value: Any) -> Any:
+    # TaskStatus хэшируется по имени члена, а не по строковому значению
+    return value.value if isinstance(value, Enum) else value
+
+
+TASK_STATUSES = Codes(("pending", "in_progress", "completed", "expired"))
+
+
+class TaskRecord(Record):
+    __slots__ = ("priority", "assigned_agent_id", "deadline", "status")
+    CODECS = {"deadline": (to_micros, from_micros), "status": TASK_STATUSES.codec}
+
+
+class TaskStore(MutableMapping):
+    """Словарь task_id -> задача с упорядоченными по сроку индексами."""
+
+    def __init__(self):
+        self._tasks: Dict[int, TaskRecord] = {}
+        self._index: Dict[IndexName, List[TaskKey]] = {}
+
+    def __getitem__(self, task_id: int) -> dict:
+        return self._tasks[task_id].to_row()
+
+    def __setitem__(self, task_id: int, task: dict):
+        if task_id in self._tasks:
+            self._unindex(task_id, self._tasks[task_id])
+        record = self._tasks[task_id] = TaskRecord(task)
+        self._reindex(task_id, record)
+
+    def __delitem__(self, task_id: int):
+        self._unindex(task_id, self._tasks.pop(task_id))
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._tasks)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __contains__(self, task_id) -> bool:
+        # Проверка наличия без декодирования записи в словарь
+        return task_id in self._tasks
+
+    @staticmethod
+    def _index_names(task: TaskRecord) -> List[IndexName]:
+        agent_id, task_status, priority = task.assigned_agent_id, task.get("status"), task.priority
+        return [
+            ("all", None),
+            ("assigned_agent_id", agent_id),
+            ("status", task_status),
+            ("priority", priority),
+            ("agent_status", (agent_id, task_status)),
+            ("status_priority", (task_status, priority)),
+        ]
+
+    def _reindex(self, task_id: int, task: TaskRecord):
+        self._insert((task.deadline, task_id), self._index_names(task))
+
+    def _unindex(self, task_id: int, task: TaskRecord):
+        self._remove((task.deadline, task_id), self._index_names(task))
+
+    def _insert(self, key: TaskKey, names: List[IndexName]):
+        for name in names:
+            insort(self._index.setdefault(name, []), key)
+
+    def _remove(self, key: TaskKey, names: List[IndexName]):
+        for name in names:
+            keys = self._index.get(name)
+            if not keys:
+                continue
+            position = bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                del keys[position]
+            if not keys:
+                del self._index[name]
+
+    def record(self, task_id: int) -> TaskRecord:
+        """Запись задачи в закодированном виде (для снимков); её нельзя изменять."""
+        return self._tasks[task_id]
+
+    def load(self, items: Iterable[Tuple[int, TaskRecord]]):
+        """Заполняет пустое хранилище готовыми записями: ключи дописываются, каждый индекс сортируется один раз."""
+        tasks, index = self._tasks, self._index
+        for task_id, record in items:
+            tasks[task_id] = record
+            key = (record.deadline, task_id)
+            for name in self._index_names(record):
+                keys = index.get(name)
+                if keys is None:
+                    keys = index[name] = []
+                keys.append(key)
+        for keys in index.values():
+            keys.sort()
+
+    def update_fields(self, task_id: int, fields: dict):
+        """Изменяет поля задачи, перемещая ключ только в индексах, имя которых изменилось.
+
+        Смена статуса затрагивает индексы статуса и пар с ним, а общий индекс,
+        индексы агента и приоритета не трогает; смена срока меняет ключ во всех.
+        """
+        task = self._tasks[task_id]
+        old_key, old_names = (task.deadline, task_id), self._index_names(task)
+        task.update(fields)
+        new_key, new_names = (task.deadline, task_id), self._index_names(task)
+        if new_key != old_key:
+            self._remove(old_key, old_names)
+            self._insert(new_key, new_names)
+            return
+        self._remove(old_key, [name for name in old_names if name not in new_names])
+        self._insert(new_key, [name for name in new_names if name not in old_names])
+
+    def select(self, filters: dict, deadline_from: Optional[datetime] = None,
+               deadline_to: Optional[datetime] = None, after: Optional[TaskKey] = None) -> Iterator[int]:
+        """id задач, совпадающих с filters (поля из FILTER_FIELDS), в порядке (deadline, task_id).
+
+        deadline_from / deadline_to — границы срока (включительно), after — ключ, после которого продолжить.
+        """
+        filters = {field: _value(value) for field, value in filters.items()}
+        # Кандидаты: (индекс, поля, которые он уже гарантирует)
+        candidates = [(("all", None), ())]
+        candidates += [((field, value), (field,)) for field, value in filters.items()]
+        for name, first, second in (("agent_status", "assigned_agent_id", "status"),
+                                    ("status_priority", "status", "priority")):
+            if first in filters and second in filters:
+                candidates.append(((name, (filters[first], filters[second])), (first, second)))
+        keys, covered = min(((self._index.get(name, []), fields) for name, fields in candidates),
+                            key=lambda candidate: len(candidate[0]))
+        # Строковые перечисления сравниваются со строками по значению
+        checks = [(field, value) for field, value in filters.items() if field not in covered]
+        start, stop = 0, len(keys)
+        if after is not None:
+            start = bisect_right(keys, after)
+        if deadline_from is not None:
+            start = max(start, bisect_left(keys, (to_micros(deadline_from),)))
+        if deadline_to is not None:
+            stop = bisect_left(keys, (to_micros(deadline_to) + 1,))
+        tasks = self._tasks
+        for position in range(start, stop):
+            task_id = keys[position][1]
+            if checks:
+                task = tasks[task_id]
+                if any(task.get(field) != value for field, value in checks):
+                    continue
+            yield task_id
@@ -0,0 +1,217 @@
+"""Метрики процесса и HTTP-запросов в формате Prometheus.
+
+ProcessStats читает загрузку CPU процесса (os.times) и RSS (/proc/self/statm,
+при его отсутствии — пиковое значение из resource). RequestMetrics считает
+запросы и гистограммы задержек по маршрутам. Счётчики изменяются только из
+потока цикла событий (обёртка маршрута выполняется в нём, даже если
+обработчик работает в пуле потоков), поэтому блокировки не нужны.
+
+Учёт встроен в маршруты FastAPI (metrics_route_class), а не в отдельное
+ASGI-middleware: лишняя сопрограмма на запрос и обёртка send на каждое
+сообщение ответа стоили больше самого учёта. Обёртка маршрута знает его
+шаблон заранее и держит серии по (метод, код ответа) в своём словаре, так
+что учёт запроса — два вызова perf_counter, поиск в маленьком словаре,
+bisect по границам корзин и три сложения. Запросы без подходящего маршрута
+учитывает обёртка обработчика по умолчанию роутера (count_unmatched).
+"""
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+from starlette.exceptions import HTTPException
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Границы корзин гистограммы задержек (секунды), как в клиентах Prometheus по умолчанию
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Метка маршрута для запросов, не попавших ни в один маршрут (чтобы не плодить метки из произвольных путей)
+UNMATCHED_ROUTE = "unmatched"
+
+
+class ProcessStats:
+    """Загрузка CPU процесса между соседними вызовами cpu_percent и текущий RSS."""
+
+    def __init__(self):
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self._last_wall = time.monotonic()
+        self._last_cpu = self.cpu_seconds()
+
+    @staticmethod
+    def cpu_seconds() -> float:
+        times = os.times()
+        return times.user + times.system
+
+    def cpu_percent(self) -> float:
+        """Процент одного ядра, потраченный процессом с предыдущего вызова (с запуска — при первом)."""
+        wall, cpu = time.monotonic(), self.cpu_seconds()
+        elapsed = wall - self._last_wall
+        percent = 0.0 if elapsed <= 0 else (cpu - self._last_cpu) / elapsed * 100
+        self._last_wall, self._last_cpu = wall, cpu
+        return percent
+
+    def rss_bytes(self) -> int:
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * self._page_size
+        except (OSError, IndexError, ValueError):
+            if resource is None:
+                return 0
+            # ru_maxrss — пиковое значение: в килобайтах на Linux, в байтах на macOS
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return rss if os.uname().sysname == "Darwin" else rss * 1024
+
+
+class RouteStats:
+    __slots__ = ("count", "total", "buckets")
+
+    def __init__(self, bucket_count: int):
+        self.count = 0
+        self.total = 0.0
+        # Последняя корзина — значения больше всех границ (+Inf)
+        self.buckets = [0] * (bucket_count + 1)
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(self.buckets)
+
+
+class RequestMetrics:
+    """Счётчики и гистограммы задержек запросов по (метод, шаблон маршрута, код ответа)."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self._routes: Dict[Tuple[str, str, int], RouteStats] = {}
+
+    def series(self, method: str, route: str, status_code: int) -> RouteStats:
+        key = (method, route, status_code)
+        stats = self._routes.get(key)
+        if stats is None:
+            stats = self._routes[key] = RouteStats(len(self.bounds))
+        return stats
+
+    def observe(self, method: str, route: str, status_code: int, seconds: float):
+        stats = self.series(method, route, status_code)
+        stats.count += 1
+        stats.total += seconds
+        stats.buckets[bisect_left(self.bounds, seconds)] += 1
+
+    def get(self, method: str, route: str, status_code: int) -> Optional[RouteStats]:
+        return self._routes.get((method, route, status_code))
+
+    def clear(self):
+        # Серии обнуляются, а не удаляются: обёртки маршрутов держат ссылки на них
+        for stats in self._routes.values():
+            stats.reset()
+
+    def instrument(self, handler: Callable[[Any], Awaitable[Any]], route: str,
+                   methods: Optional[set] = None) -> Callable[[Any], Awaitable[Any]]:
+        """Оборачивает обработчик маршрута (Request -> Response) учётом запросов с шаблоном route.
+
+        Если у маршрута один метод, серии выбираются только по коду ответа.
+        """
+        bounds = self.bounds
+        clock = time.perf_counter
+        bucket = bisect_left
+        method = next(iter(methods)) if methods is not None and len(methods) == 1 else None
+        # Код ответа (или (метод, код) для маршрутов с несколькими методами) -> серия
+        series: Dict[Any, RouteStats] = {}
+
+        def record(request, status_code: int, elapsed: float):
+            key = status_code if method is not None else (request.scope["method"], status_code)
+            stats = series.get(key)
+            if stats is None:
+                stats = series[key] = self.series(method or key[0], route, status_code)
+            stats.count += 1
+            stats.total += elapsed
+            stats.buckets[bucket(bounds, elapsed)] += 1
+
+        async def instrumented(request):
+            start = clock()
+            try:
+                response = await handler(request)
+            except HTTPException as exc:
+                record(request, exc.status_code, clock() - start)
+                raise
+            except RequestValidationError:
+                record(request, 422, clock() - start)
+                raise
+            except BaseException:
+                record(request, 500, clock() - start)
+                raise
+            elapsed = clock() - start
+            # Частый случай (серия уже есть) разобран здесь же: без вызова record
+            stats = series.get(response.status_code)
+            if stats is None or method is None:
+                record(request, response.status_code, elapsed)
+            else:
+                stats.count += 1
+                stats.total += elapsed
+                stats.buckets[bucket(bounds, elapsed)] += 1
+            return response
+
+        return instrumented
+
+    def count_unmatched(self, app: Callable) -> Callable:
+        """Оборачивает ASGI-обработчик запросов без маршрута (Router.default): они учитываются как 404."""
+        async def unmatched(scope, receive, send):
+            start = time.perf_counter()
+            try:
+                await app(scope, receive, send)
+            finally:
+                if scope["type"] == "http":
+                    self.observe(scope["method"], UNMATCHED_ROUTE, 404, time.perf_counter() - start)
+
+        return unmatched
+
+    def exposition(self) -> List[str]:
+        """Строки в текстовом формате Prometheus."""
+        routes = sorted(self._routes.items())
+        lines = [
+            "# HELP http_requests_total Total HTTP requests by route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        lines += [f"http_requests_total{{{_labels(*key)}}} {stats.count}" for key, stats in routes]
+        lines += [
+            "# HELP http_request_duration_seconds HTTP request latency by route and status.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for key, stats in routes:
+            labels = _labels(*key)
+            cumulative = 0
+            for bound, count in zip(self.bounds, stats.buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {stats.total}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {stats.count}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(method: str, route: str, status_code: int) -> str:
+    return f'method="{method}",route="{_escape(route)}",status="{status_code}"'
+
+
+def metrics_route_class(metrics: RequestMetrics) -> type:
+    """Класс маршрута FastAPI, учитывающий запросы в metrics.
+
+    Метка маршрута — шаблон (например, /agents/{agent_id}), а не путь,
+    чтобы число меток не росло с числом агентов. Назначается до объявления
+    маршрутов: app.router.route_class = metrics_route_class(metrics).
+    """
+    class MetricsRoute(APIRoute):
+        def get_route_handler(self):
+            return metrics.instrument(super().get_route_handler(), self.path, self.methods)
+
+    return MetricsRoute
@@ -1,33 +1,58 @@
+import asyncio
+import json
+import time
 import pytest
 from fastapi.testclient import TestClient
 from datetime import datetime, timedelta
-from main import app, fake_db, create_access_token  # Замените "your_app_file" на имя файла с API
+from main import app, storage, config_history, deadline_scheduler, delivery_hub, event_bus, expire_overdue_tasks, integration_pool, lease_sweeper, liveness_tracker, log_store, metrics_store, request_metrics, task_event, task_queue, token_cache, create_access_token  # Замените "your_app_file" на имя файла с API
 
 client = TestClient(app)
 
-# Фикстура для очистки fake_db перед каждым тестом
+# Фикстура для очистки хранилища перед каждым тестом
 @pytest.fixture(autouse=True)
 def reset_db():
-    fake_db.clear()
-    fake_db.update({"users": {}, "agents": {}, "tasks": {}, "messages": {}, "integrations": {}})
+    storage.clear()
+    token_cache.clear()
+    task_queue.clear()
+    deadline_scheduler.clear()
+    delivery_hub.clear()
+    metrics_store.clear()
+    liveness_tracker.clear()
+    request_metrics.clear()
+    log_store.clear()
+    integration_pool.clear()
+    config_history.clear()
+
+def add_user(username, password, role, user_id):
+    asyncio.run(storage.add_user({"username": username, "password": password, "role": role, "user_id": user_id}))
 
 # Тесты для аутентификации
 def test_login_success():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     response = client.post("/auth/login", data={"username": "testuser", "password": "testpass"})
     assert response.status_code == 200
     assert "access_token" in response.json()
     assert response.json()["token_type"] == "bearer"
 
 def test_login_failure():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     response = client.post("/auth/login", data={"username": "testuser", "password": "wrongpass"})
     assert response.status_code == 401
     assert response.json()["detail"] == "Incorrect username or password"
 
+def test_login_rehashes_plaintext_password():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    assert client.post("/auth/login", data={"username": "testuser", "password": "testpass"}).status_code == 200
+    stored = asyncio.run(storage.get_user("testuser"))["password"]
+    assert stored.startswith("scrypt$")
+    assert client.post("/auth/login", data={"username": "testuser", "password": "testpass"}).status_code == 200
+    assert client.post("/auth/login", data={"username": "testuser", "password": "wrong"}).status_code == 401
+    assert asyncio.run(storage.get_user("testuser"))["password"] == stored
+    assert client.post("/auth/login", data={"username": "nobody", "password": "testpass"}).status_code == 401
+
 # Тесты для текущего пользователя
 def test_get_current_user():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     response = client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
     assert response.status_code == 200
@@ -36,7 +61,7 @@ def test_get_current_user():
 
 # Тесты для регистрации агента
 def test_register_agent():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     response = client.post(
         "/agents",
@@ -54,7 +79,7 @@ def test_register_agent():
 
 # Тесты для управления жизненным циклом агента
 def test_start_agent():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     agent_response = client.post(
         "/agents",
@@ -67,7 +92,7 @@ def test_start_agent():
     assert response.json()["message"] == "Agent started successfully"
 
 def test_stop_agent():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     agent_response = client.post(
         "/agents",
@@ -80,7 +105,7 @@ def test_stop_agent():
     assert response.json()["message"] == "Agent stopped successfully"
 
 def test_restart_agent():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     agent_response = client.post(
         "/agents",
@@ -93,7 +118,7 @@ def test_restart_agent():
     assert response.json()["message"] == "Agent restarted successfully"
 
 def test_delete_agent():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     agent_response = client.post(
         "/agents",
@@ -105,9 +130,151 @@ def test_delete_agent():
     assert response.status_code == 200
     assert response.json()["message"] == "Agent deleted successfully"
 
+def test_agent_ids_not_reused_after_delete():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    agent_ids = []
+    for agent_type in ("ML", "BDI"):
+        agent_response = client.post(
+            "/agents",
+            json={"agent_type": agent_type, "status": "active", "priority_level": 2, "configuration": {}},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        agent_ids.append(agent_response.json()["agent_id"])
+    client.delete(f"/agents/{agent_ids[0]}", headers={"Authorization": f"Bearer {token}"})
+    agent_response = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "stopped", "priority_level": 2, "configuration": {}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert agent_response.json()["agent_id"] not in agent_ids
+    response = client.get(f"/agents/{agent_ids[1]}/status", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["status"] == "active"
+
+def test_register_agents_batch():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    response = client.post(
+        "/agents/batch",
+        json={"agents": [
+            {"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+            {"agent_type": "ML", "status": "active", "priority_level": 9, "configuration": {}},
+            {"agent_type": "BDI", "status": "stopped", "priority_level": 1, "configuration": {}}
+        ]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["succeeded"] == 2
+    assert body["failed"] == 1
+    assert [r["success"] for r in body["results"]] == [True, False, True]
+    assert body["results"][1]["agent_id"] is None
+    agent_id = body["results"][2]["agent_id"]
+    response = client.get(f"/agents/{agent_id}/status", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["status"] == "stopped"
+
+def test_bulk_agent_action_by_ids():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    response = client.post(
+        "/agents/batch",
+        json={"agents": [
+            {"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}}
+            for _ in range(2)
+        ]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    agent_ids = [r["agent_id"] for r in response.json()["results"]]
+    response = client.post(
+        "/agents/bulk",
+        json={"action": "stop", "agent_ids": agent_ids + [999]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    assert [r["success"] for r in response.json()["results"]] == [True, True, False]
+    assert response.json()["results"][2]["message"] == "Agent not found"
+    for agent_id in agent_ids:
+        response = client.get(f"/agents/{agent_id}/status", headers={"Authorization": f"Bearer {token}"})
+        assert response.json()["status"] == "stopped"
+
+def test_bulk_agent_action_by_selector():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    response = client.post(
+        "/agents/batch",
+        json={"agents": [
+            {"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+            {"agent_type": "BDI", "status": "active", "priority_level": 2, "configuration": {}},
+            {"agent_type": "ML", "status": "stopped", "priority_level": 1, "configuration": {}}
+        ]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    ml_id, bdi_id, stopped_ml_id = [r["agent_id"] for r in response.json()["results"]]
+    response = client.post(
+        "/agents/bulk",
+        json={"action": "delete", "selector": {"agent_type": "ML"}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    assert sorted(r["agent_id"] for r in response.json()["results"]) == sorted([ml_id, stopped_ml_id])
+    response = client.get(f"/agents/{ml_id}/status", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404
+    response = client.get(f"/agents/{bdi_id}/status", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+def test_bulk_agent_action_without_matches_publishes_nothing(monkeypatch):
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    published = []
+    monkeypatch.setattr(event_bus, "publish", lambda topic, payload: published.append(topic))
+    for action, target in (("stop", {"agent_ids": [999]}), ("start", {"agent_ids": [999]}),
+                           ("delete", {"selector": {"agent_type": "missing"}})):
+        response = client.post("/agents/bulk", json={"action": action, **target},
+                               headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+    assert published == []
+
+def test_bulk_agent_action_requires_target():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    response = client.post("/agents/bulk", json={"action": "stop"}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 422
+    response = client.post(
+        "/agents/bulk",
+        json={"action": "delete", "selector": {}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 422
+
+def test_list_agents():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    agent_ids = [
+        client.post(
+            "/agents",
+            json={"agent_type": agent_type, "status": "active", "priority_level": priority, "configuration": {}},
+            headers=headers
+        ).json()["agent_id"]
+        for agent_type, priority in (("ML", 2), ("BDI", 3), ("ML", 1), ("ML", 3))
+    ]
+    client.post(f"/agents/{agent_ids[3]}/stop", headers=headers)
+    response = client.get("/agents", params={"agent_type": "ML", "status": "active"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["total"] == 2
+    assert [agent["agent_id"] for agent in response.json()["agents"]] == [agent_ids[0], agent_ids[2]]
+    response = client.get("/agents", params={"sort_by": "priority_level", "order": "desc", "limit": 2, "offset": 1},
+                          headers=headers)
+    assert response.json()["total"] == 4
+    assert [agent["agent_id"] for agent in response.json()["agents"]] == [agent_ids[1], agent_ids[0]]
+    response = client.get("/metrics", headers=headers)
+    assert response.json()["active_agents"] == 3
+    assert response.json()["agents_by_status"] == {"active": 3, "stopped": 1}
+    assert client.get("/agents", params={"sort_by": "configuration"}, headers=headers).status_code == 422
+
 # Тесты для мониторинга агентов
 def test_get_agent_status():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     agent_response = client.post(
         "/agents",
@@ -119,8 +286,59 @@ def test_get_agent_status():
     assert response.status_code == 200
     assert response.json()["status"] == "active"
 
+def test_heartbeats_and_liveness():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    agent_ids = [
+        client.post(
+            "/agents",
+            json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+            headers=headers
+        ).json()["agent_id"]
+        for _ in range(2)
+    ]
+    asyncio.run(storage.update_agents({"last_heartbeat": datetime.utcnow() - timedelta(hours=1)}, agent_ids=agent_ids))
+    response = client.get(f"/agents/{agent_ids[0]}/status", headers=headers)
+    assert response.json()["liveness"] == "stale"
+    response = client.post("/agents/heartbeats", json={"agent_ids": [agent_ids[0], 999]}, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"accepted": 1, "unknown": [999]}
+    response = client.get(f"/agents/{agent_ids[0]}/status", headers=headers)
+    assert response.json()["liveness"] == "alive"
+    assert response.json()["last_heartbeat"] > (datetime.utcnow() - timedelta(minutes=1)).isoformat()
+    # Фоновая проверка помечает агентов, не приславших heartbeat в течение timeout
+    assert sorted(liveness_tracker.sweep(now=time.time() + liveness_tracker.timeout + 1)) == agent_ids
+    client.post("/agents/heartbeats", json={"agent_ids": [agent_ids[0]]}, headers=headers)
+    assert liveness_tracker.stale == {agent_ids[1]}
+    client.post(f"/agents/{agent_ids[1]}/stop", headers=headers)
+    response = client.get(f"/agents/{agent_ids[1]}/status", headers=headers)
+    assert response.json()["liveness"] == "unknown"
+
+def test_heartbeats_from_stopped_agent():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    active, stopped = [
+        client.post(
+            "/agents",
+            json={"agent_type": "ML", "status": status, "priority_level": 2, "configuration": {}},
+            headers=headers
+        ).json()["agent_id"]
+        for status in ("active", "stopped")
+    ]
+    response = client.post("/agents/heartbeats", json={"agent_ids": [stopped, active]}, headers=headers)
+    assert response.json() == {"accepted": 2, "unknown": []}
+    # Heartbeat записан, но остановленный агент не попадает под проверку живости
+    response = client.get(f"/agents/{stopped}/status", headers=headers)
+    assert response.json()["last_heartbeat"] > (datetime.utcnow() - timedelta(minutes=1)).isoformat()
+    assert response.json()["liveness"] == "unknown"
+    assert liveness_tracker.last_beat(stopped) is None and liveness_tracker.last_beat(active) is not None
+    liveness_tracker.sweep(now=time.time() + liveness_tracker.timeout + 1)
+    assert liveness_tracker.stale == {active}
+
 def test_get_agent_metrics():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     agent_response = client.post(
         "/agents",
@@ -128,13 +346,47 @@ def test_get_agent_metrics():
         headers={"Authorization": f"Bearer {token}"}
     )
     agent_id = agent_response.json()["agent_id"]
+    client.post(
+        f"/agents/{agent_id}/metrics",
+        json={"metrics": [{"metric_type": "CPU", "value": 70.0}, {"metric_type": "Memory", "value": 512.0},
+                          {"metric_type": "CPU", "value": 75.5}]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
     response = client.get(f"/agents/{agent_id}/metrics", headers={"Authorization": f"Bearer {token}"})
     assert response.status_code == 200
     assert len(response.json()["metrics"]) == 2
+    assert {m["metric_type"]: m["value"] for m in response.json()["metrics"]} == {"CPU": 75.5, "Memory": 512.0}
+
+def test_agent_metrics_summary():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    agent_id = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers=headers
+    ).json()["agent_id"]
+    start = datetime(2030, 1, 1)
+    points = [
+        {"metric_type": "CPU", "value": value, "timestamp": (start + timedelta(seconds=seconds)).isoformat()}
+        for seconds, value in ((0, 10.0), (30, 30.0), (60, 50.0), (90, 70.0), (150, 90.0))
+    ]
+    points.append({"metric_type": "CPU", "value": 1.0, "timestamp": start.isoformat()})
+    response = client.post(f"/agents/{agent_id}/metrics", json={"metrics": points}, headers=headers)
+    assert response.json()["accepted"] == 5
+    assert response.json()["rejected"] == 1
+    response = client.get(
+        f"/agents/{agent_id}/metrics/summary",
+        params={"since": start.isoformat(), "until": (start + timedelta(seconds=120)).isoformat(), "step": 60},
+        headers=headers
+    )
+    assert response.status_code == 200
+    buckets = response.json()["series"][0]["buckets"]
+    assert [(b["min"], b["max"], b["avg"], b["count"]) for b in buckets] == [(10.0, 30.0, 20.0, 2), (50.0, 70.0, 60.0, 2)]
 
 # Тесты для коммуникации между агентами
 def test_send_message():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     agent1_response = client.post(
         "/agents",
@@ -157,7 +409,7 @@ def test_send_message():
     assert "message_id" in response.json()
 
 def test_get_messages():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     agent_response = client.post(
         "/agents",
@@ -174,9 +426,235 @@ def test_get_messages():
     assert response.status_code == 200
     assert len(response.json()["messages"]) == 1
 
+def test_get_messages_only_for_agent():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    agent_ids = []
+    for _ in range(3):
+        agent_response = client.post(
+            "/agents",
+            json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        agent_ids.append(agent_response.json()["agent_id"])
+    a, b, c = agent_ids
+    for sender, receiver in [(a, b), (b, c), (c, a), (b, b)]:
+        client.post(
+            "/messages",
+            json={"sender_id": sender, "receiver_id": receiver, "content": f"{sender}->{receiver}"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    response = client.get(f"/messages/{b}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    contents = [m["content"] for m in response.json()["messages"]]
+    assert contents == [f"{a}->{b}", f"{b}->{c}", f"{b}->{b}"]
+
+def test_delete_agent_clears_messages():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    agent_response = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    agent_id = agent_response.json()["agent_id"]
+    client.post(
+        "/messages",
+        json={"sender_id": agent_id, "receiver_id": agent_id, "content": "Self message"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    client.delete(f"/agents/{agent_id}", headers={"Authorization": f"Bearer {token}"})
+    agent_response = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    agent_id = agent_response.json()["agent_id"]
+    response = client.get(f"/messages/{agent_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["messages"] == []
+
+def test_delete_agent_removes_conversation_from_other_party():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'testuser'}, expires_delta=timedelta(minutes=30))}"}
+    deleted, kept, other = [
+        client.post(
+            "/agents",
+            json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+            headers=headers
+        ).json()["agent_id"]
+        for _ in range(3)
+    ]
+    for sender, receiver in ((deleted, kept), (kept, deleted), (kept, other)):
+        client.post("/messages", json={"sender_id": sender, "receiver_id": receiver, "content": f"{sender}->{receiver}"},
+                    headers=headers)
+    assert client.delete(f"/agents/{deleted}", headers=headers).status_code == 200
+    # Переписка с удалённым агентом пропадает и у собеседника, остальная история остаётся
+    response = client.get(f"/messages/{kept}", headers=headers)
+    assert [m["content"] for m in response.json()["messages"]] == [f"{kept}->{other}"]
+    response = client.get(f"/messages/{other}", headers=headers)
+    assert [m["content"] for m in response.json()["messages"]] == [f"{kept}->{other}"]
+
+def test_get_messages_pagination():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    agent_response = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    agent_id = agent_response.json()["agent_id"]
+    for i in range(5):
+        client.post(
+            "/messages",
+            json={"sender_id": agent_id, "receiver_id": agent_id, "content": f"m{i}"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    contents, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["after"] = cursor
+        response = client.get(f"/messages/{agent_id}", params=params, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        pages += 1
+        contents += [m["content"] for m in response.json()["messages"]]
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == 3
+    assert contents == ["m0", "m1", "m2", "m3", "m4"]
+
+def test_get_messages_time_range():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    asyncio.run(storage.add_agent({"agent_type": "ML", "status": "active", "priority_level": 2,
+                                   "configuration": {}, "last_heartbeat": datetime.utcnow()}))
+    for day in range(1, 6):
+        asyncio.run(storage.add_message({"sender_id": 1, "receiver_id": 1, "content": f"day{day}",
+                                         "timestamp": datetime(2024, 1, day, 12)}))
+    response = client.get(
+        "/messages/1",
+        params={"since": "2024-01-02T00:00:00", "until": "2024-01-04T12:00:00"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    assert [m["content"] for m in response.json()["messages"]] == ["day2", "day3", "day4"]
+
+def test_get_messages_invalid_cursor():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    agent_response = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    agent_id = agent_response.json()["agent_id"]
+    response = client.get(f"/messages/{agent_id}", params={"after": "???"}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 400
+
+def test_poll_messages_with_ack():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    agent_response = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    agent_id = agent_response.json()["agent_id"]
+    response = client.get(f"/messages/{agent_id}/poll", params={"timeout": 0}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["deliveries"] == []
+    for content in ("first", "second"):
+        client.post(
+            "/messages",
+            json={"sender_id": agent_id, "receiver_id": agent_id, "content": content},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    response = client.get(f"/messages/{agent_id}/poll", params={"timeout": 0}, headers={"Authorization": f"Bearer {token}"})
+    deliveries = response.json()["deliveries"]
+    assert [d["message"]["content"] for d in deliveries] == ["first", "second"]
+    # Без подтверждения доставки выдаются повторно
+    response = client.get(f"/messages/{agent_id}/poll", params={"timeout": 0}, headers={"Authorization": f"Bearer {token}"})
+    assert [d["seq"] for d in response.json()["deliveries"]] == [d["seq"] for d in deliveries]
+    response = client.get(
+        f"/messages/{agent_id}/poll",
+        params={"timeout": 0, "ack": deliveries[-1]["seq"]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.json()["deliveries"] == []
+
+def test_websocket_message_stream():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    agent_response = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    agent_id = agent_response.json()["agent_id"]
+    with client.websocket_connect(f"/ws/messages/{agent_id}?token={token}&window=1") as websocket:
+        for content in ("first", "second"):
+            client.post(
+                "/messages",
+                json={"sender_id": agent_id, "receiver_id": agent_id, "content": content},
+                headers={"Authorization": f"Bearer {token}"}
+            )
+        frame = websocket.receive_json()
+        assert [d["message"]["content"] for d in frame["deliveries"]] == ["first"]
+        websocket.send_json({"ack": frame["deliveries"][0]["seq"]})
+        frame = websocket.receive_json()
+        assert [d["message"]["content"] for d in frame["deliveries"]] == ["second"]
+
+def test_one_receiver_per_mailbox():
+    from starlette.websockets import WebSocketDisconnect
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    agent_id = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers=headers
+    ).json()["agent_id"]
+    poll_url = f"/messages/{agent_id}/poll"
+    with client.websocket_connect(f"/ws/messages/{agent_id}?token={token}"):
+        # Второй получатель забрал бы неподтверждённые доставки первого
+        assert client.get(poll_url, params={"timeout": 0}, headers=headers).status_code == 409
+        with pytest.raises(WebSocketDisconnect) as error:
+            with client.websocket_connect(f"/ws/messages/{agent_id}?token={token}") as websocket:
+                websocket.receive_json()
+        assert error.value.code == 1013
+    assert client.get(poll_url, params={"timeout": 0}, headers=headers).status_code == 200
+
+def test_websocket_stream_closes_when_sending_fails():
+    from starlette.websockets import WebSocketDisconnect
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    agent_id = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers={"Authorization": f"Bearer {token}"}
+    ).json()["agent_id"]
+    with pytest.raises(WebSocketDisconnect) as error:
+        with client.websocket_connect(f"/ws/messages/{agent_id}?token={token}") as websocket:
+            # Сообщение, которое нельзя сериализовать, роняет цикл отправки
+            delivery_hub.publish(agent_id, {"content": object()})
+            websocket.receive_json()
+    assert error.value.code == 1011
+    assert any("Message stream failed" in entry["message"] for entry in log_store.query(level="ERROR", agent_id=agent_id))
+    # Ящик освобождён, доставка осталась в очереди
+    assert delivery_hub.subscribe(agent_id).claimed is False
+    assert delivery_hub.subscribe(agent_id).pending == 1
+
+def test_websocket_rejects_invalid_token():
+    from starlette.websockets import WebSocketDisconnect
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/ws/messages/1?token=invalid") as websocket:
+            websocket.receive_json()
+
 # Тесты для назначения задач
 def test_create_task():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     agent_response = client.post(
         "/agents",
@@ -198,7 +676,7 @@ def test_create_task():
     assert "task_id" in response.json()
 
 def test_get_task():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     agent_response = client.post(
         "/agents",
@@ -221,9 +699,270 @@ def test_get_task():
     assert response.status_code == 200
     assert response.json()["task_id"] == task_id
 
+def test_claim_tasks_by_priority_and_deadline():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    agent_response = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    agent_id = agent_response.json()["agent_id"]
+    task_ids = {}
+    for name, priority, deadline, task_status in [
+        ("low", 1, "2030-01-01T00:00:00", "pending"),
+        ("high_late", 5, "2030-06-01T00:00:00", "pending"),
+        ("high_early", 5, "2030-02-01T00:00:00", "pending"),
+        ("done", 5, "2030-01-01T00:00:00", "completed"),
+    ]:
+        task_response = client.post(
+            "/tasks",
+            json={"priority": priority, "assigned_agent_id": agent_id, "deadline": deadline, "status": task_status},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        task_ids[task_response.json()["task_id"]] = name
+    claimed = []
+    for _ in range(3):
+        response = client.post(f"/agents/{agent_id}/tasks/claim", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        assert response.json()["status"] == "in_progress"
+        claimed.append(task_ids[response.json()["task_id"]])
+    assert claimed == ["high_early", "high_late", "low"]
+    response = client.post(f"/agents/{agent_id}/tasks/claim", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 204
+
+def test_complete_claimed_task():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    agent_response = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    agent_id = agent_response.json()["agent_id"]
+    task_response = client.post(
+        "/tasks",
+        json={"priority": 3, "assigned_agent_id": agent_id, "deadline": "2030-01-01T00:00:00", "status": "pending"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    task_id = task_response.json()["task_id"]
+    response = client.post(f"/agents/{agent_id}/tasks/{task_id}/complete", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 409
+    client.post(f"/agents/{agent_id}/tasks/claim", headers={"Authorization": f"Bearer {token}"})
+    response = client.post(f"/agents/{agent_id}/tasks/{task_id}/complete", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    response = client.get(f"/tasks/{task_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["status"] == "completed"
+
+def test_expired_lease_is_requeued():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    agent_response = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    agent_id = agent_response.json()["agent_id"]
+    task_response = client.post(
+        "/tasks",
+        json={"priority": 3, "assigned_agent_id": agent_id, "deadline": "2030-01-01T00:00:00", "status": "pending"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    task_id = task_response.json()["task_id"]
+    client.post(f"/agents/{agent_id}/tasks/claim", params={"lease_seconds": 1}, headers={"Authorization": f"Bearer {token}"})
+    time.sleep(1.1)
+    response = client.post(f"/agents/{agent_id}/tasks/{task_id}/complete", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 409
+    response = client.post(f"/agents/{agent_id}/tasks/claim", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["task_id"] == task_id
+
+def test_expired_lease_is_requeued_in_background(monkeypatch):
+    add_user("testuser", "testpass", "admin", user_id=1)
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'testuser'}, expires_delta=timedelta(minutes=30))}"}
+    agent_id = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers=headers
+    ).json()["agent_id"]
+    task_id = client.post(
+        "/tasks",
+        json={"priority": 3, "assigned_agent_id": agent_id, "deadline": "2030-01-01T00:00:00", "status": "pending"},
+        headers=headers
+    ).json()["task_id"]
+    client.post(f"/agents/{agent_id}/tasks/claim", params={"lease_seconds": 1}, headers=headers)
+    monkeypatch.setattr("main.LEASE_SWEEP_INTERVAL", 0.05)
+
+    async def sweep():
+        # Аренда истекает, пока работает фоновая корутина; к claim никто не обращается
+        sweeper = asyncio.ensure_future(lease_sweeper())
+        await asyncio.sleep(1.2)
+        sweeper.cancel()
+    asyncio.run(sweep())
+    assert client.get(f"/tasks/{task_id}", headers=headers).json()["status"] == "pending"
+    assert client.post(f"/agents/{agent_id}/tasks/claim", headers=headers).json()["task_id"] == task_id
+
+def test_task_cannot_be_created_in_progress():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'testuser'}, expires_delta=timedelta(minutes=30))}"}
+    agent_id = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers=headers
+    ).json()["agent_id"]
+    response = client.post(
+        "/tasks",
+        json={"priority": 3, "assigned_agent_id": agent_id, "deadline": "2030-01-01T00:00:00", "status": "in_progress"},
+        headers=headers
+    )
+    assert response.status_code == 422
+    assert asyncio.run(storage.list_tasks({}, 10)) == []
+
+def test_claim_skips_task_deleted_after_transition(monkeypatch):
+    add_user("testuser", "testpass", "admin", user_id=1)
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'testuser'}, expires_delta=timedelta(minutes=30))}"}
+    agent_id = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers=headers
+    ).json()["agent_id"]
+    task_id = client.post(
+        "/tasks",
+        json={"priority": 3, "assigned_agent_id": agent_id, "deadline": "2030-01-01T00:00:00", "status": "pending"},
+        headers=headers
+    ).json()["task_id"]
+
+    async def deleted(task_id):
+        return None
+    # Задачу удалили между переходом в in_progress и её чтением
+    monkeypatch.setattr(storage, "get_task", deleted)
+    assert client.post(f"/agents/{agent_id}/tasks/claim", headers=headers).status_code == 204
+    assert task_queue.get_lease(task_id) is None
+
+def remote_event(topic, payload):
+    """Событие, пришедшее по шине от другого воркера (после кодирования в JSON)."""
+    event_bus._dispatch_remote(topic, json.loads(json.dumps(payload)))
+
+def test_task_events_from_other_worker():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'testuser'}, expires_delta=timedelta(minutes=30))}"}
+    agent_id = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers=headers
+    ).json()["agent_id"]
+    deadline = datetime(2030, 1, 1)
+    # Задачи созданы другим воркером: в хранилище они есть, очередь этого воркера узнаёт о них из событий
+    first, second = (
+        asyncio.run(storage.add_task({"priority": priority, "assigned_agent_id": agent_id, "deadline": deadline,
+                                      "status": "pending"}))
+        for priority in (1, 5)
+    )
+    for task_id, priority in ((first, 1), (second, 5)):
+        remote_event("tasks.created", {"task": task_event(task_id, agent_id, priority, deadline, "pending")})
+    assert len(task_queue) == 2 and len(deadline_scheduler) == 2
+    # Вторую задачу взял в работу другой воркер: здесь её больше не выдают, но завершить её можно
+    asyncio.run(storage.transition_task(second, "pending", "in_progress"))
+    remote_event("tasks.claimed", {"task": task_event(second, agent_id, 5, deadline, "in_progress"),
+                                   "expires_at": time.time() + 60})
+    response = client.post(f"/agents/{agent_id}/tasks/claim", headers=headers)
+    assert response.json()["task_id"] == first
+    assert client.post(f"/agents/{agent_id}/tasks/claim", headers=headers).status_code == 204
+    assert client.post(f"/agents/{agent_id}/tasks/{second}/complete", headers=headers).status_code == 200
+    remote_event("tasks.finished", {"task_ids": [first]})
+    assert client.post(f"/agents/{agent_id}/tasks/{first}/complete", headers=headers).status_code == 409
+    assert len(deadline_scheduler) == 0
+
+def test_agent_and_user_events_from_other_worker():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'testuser'}, expires_delta=timedelta(minutes=30))}"}
+    agent_id = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers=headers
+    ).json()["agent_id"]
+    assert len(token_cache) == 1 and liveness_tracker.last_beat(agent_id) is not None
+    remote_event("agents.active", {"agent_ids": [agent_id], "timestamp": 4102444800.0})
+    assert liveness_tracker.last_beat(agent_id) == 4102444800.0
+    remote_event("agents.deleted", {"agent_ids": [agent_id]})
+    assert liveness_tracker.last_beat(agent_id) is None
+    remote_event("users.changed", {"user_id": 1})
+    assert len(token_cache) == 0
+    remote_event("messages.sent", {"messages": [{"message_id": 7, "sender_id": 1, "receiver_id": 2,
+                                                  "content": "hi", "timestamp": "2030-01-01T00:00:00"}]})
+    mailbox = delivery_hub.subscribe(2)
+    remote_event("messages.sent", {"messages": [{"message_id": 8, "sender_id": 1, "receiver_id": 2,
+                                                  "content": "hi", "timestamp": "2030-01-01T00:00:00"}]})
+    assert [message["message_id"] for _, message in mailbox.take(10)] == [8]
+
+def test_overdue_tasks_expire():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    agent_id = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers=headers
+    ).json()["agent_id"]
+    now = datetime.utcnow()
+    task_ids = [
+        client.post(
+            "/tasks",
+            json={"priority": 2, "assigned_agent_id": agent_id, "deadline": deadline.isoformat(), "status": "pending"},
+            headers=headers
+        ).json()["task_id"]
+        for deadline in (now + timedelta(minutes=1), now + timedelta(hours=1), now + timedelta(minutes=2))
+    ]
+    claimed = client.post(f"/agents/{agent_id}/tasks/claim", headers=headers).json()["task_id"]
+    assert claimed == task_ids[0]
+    asyncio.run(expire_overdue_tasks(now=time.time() + 300))
+    statuses = [client.get(f"/tasks/{task_id}", headers=headers).json()["status"] for task_id in task_ids]
+    assert statuses == ["expired", "pending", "expired"]
+    # Просроченная задача не выдаётся из очереди
+    assert client.post(f"/agents/{agent_id}/tasks/claim", headers=headers).json()["task_id"] == task_ids[1]
+    messages = client.get(f"/messages/{agent_id}", headers=headers).json()["messages"]
+    events = [json.loads(m["content"]) for m in messages if m["sender_id"] == 0]
+    assert [(e["event"], e["task_id"], e["previous_status"]) for e in events] == [
+        ("task_expired", task_ids[0], "in_progress"), ("task_expired", task_ids[2], "pending")
+    ]
+
+def test_list_tasks():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    agent_id = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers=headers
+    ).json()["agent_id"]
+    now = datetime.utcnow()
+    task_ids = [
+        client.post(
+            "/tasks",
+            json={"priority": 2, "assigned_agent_id": agent_id, "deadline": (now + timedelta(minutes=minutes)).isoformat(),
+                  "status": task_status},
+            headers=headers
+        ).json()["task_id"]
+        for minutes, task_status in ((10, "pending"), (3, "pending"), (1, "completed"), (4, "pending"))
+    ]
+    response = client.get("/tasks", params={"assigned_agent_id": agent_id, "status": "pending", "limit": 2},
+                          headers=headers)
+    assert response.status_code == 200
+    assert [task["task_id"] for task in response.json()["tasks"]] == [task_ids[1], task_ids[3]]
+    cursor = response.json()["next_cursor"]
+    response = client.get("/tasks", params={"assigned_agent_id": agent_id, "status": "pending", "after": cursor},
+                          headers=headers)
+    assert [task["task_id"] for task in response.json()["tasks"]] == [task_ids[0]]
+    assert response.json()["next_cursor"] is None
+    # Задачи со сроком в ближайшие 5 минут
+    response = client.get("/tasks", params={"deadline_from": now.isoformat(),
+                                            "deadline_to": (now + timedelta(minutes=5)).isoformat()}, headers=headers)
+    assert [task["task_id"] for task in response.json()["tasks"]] == [task_ids[2], task_ids[1], task_ids[3]]
+    assert client.get("/tasks", params={"after": "???"}, headers=headers).status_code == 400
+
 # Тесты для координации агентов
 def test_coordinate_agents():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     agent1_response = client.post(
         "/agents",
@@ -244,10 +983,52 @@ def test_coordinate_agents():
     )
     assert response.status_code == 200
     assert "coordination_id" in response.json()
+    # Срок подтверждения ограничен сутками
+    for ack_timeout in (0, 86401, 1e300):
+        response = client.post(
+            "/coordination",
+            json={"agents": [agent1_id], "action": "collaborate", "ack_timeout": ack_timeout},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 422
+
+def test_coordination_progress_and_acks():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    agent_ids = [
+        client.post("/agents", json={"agent_type": "ML", "status": "active", "priority_level": 1, "configuration": {}},
+                    headers=headers).json()["agent_id"]
+        for _ in range(3)
+    ]
+    response = client.post("/coordination", json={"agents": agent_ids + [agent_ids[0]], "action": "rebalance"},
+                           headers=headers)
+    assert response.status_code == 200
+    assert response.json()["delivered"] == 3 and response.json()["failed"] == 0
+    coordination_id = response.json()["coordination_id"]
+    # Действие пришло каждому агенту системным сообщением
+    messages = client.get(f"/messages/{agent_ids[1]}", headers=headers).json()["messages"]
+    assert json.loads(messages[-1]["content"])["coordination_id"] == coordination_id
+    response = client.get(f"/coordination/{coordination_id}", headers=headers)
+    assert response.json()["status"] == "in_progress"
+    assert response.json()["counts"]["delivered"] == 3
+    assert response.json()["participants"] is None
+    ack_url = f"/coordination/{coordination_id}/ack"
+    assert client.post(ack_url, json={"agent_id": agent_ids[0]}, headers=headers).status_code == 200
+    assert client.post(ack_url, json={"agent_id": agent_ids[0]}, headers=headers).status_code == 409
+    assert client.post(ack_url, json={"agent_id": 999}, headers=headers).status_code == 409
+    assert client.post("/coordination/999/ack", json={"agent_id": agent_ids[0]}, headers=headers).status_code == 404
+    client.post(ack_url, json={"agent_id": agent_ids[1]}, headers=headers)
+    client.post(ack_url, json={"agent_id": agent_ids[2], "success": False}, headers=headers)
+    response = client.get(f"/coordination/{coordination_id}", params={"details": "true"}, headers=headers)
+    assert response.json()["status"] == "completed"
+    assert response.json()["counts"]["acknowledged"] == 2 and response.json()["counts"]["rejected"] == 1
+    assert [p["state"] for p in response.json()["participants"]] == ["acknowledged", "acknowledged", "rejected"]
+    assert client.get("/coordination/999", headers=headers).status_code == 404
 
 # Тесты для обновления конфигурации агента
 def test_update_config():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     agent_response = client.post(
         "/agents",
@@ -263,9 +1044,55 @@ def test_update_config():
     assert response.status_code == 200
     assert response.json()["message"] == "Configuration updated"
 
+def test_patch_config_versions():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    agent_id = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2,
+              "configuration": {"model": {"layers": [64, 32]}, "optimizer": {"lr": 0.01}}},
+        headers=headers
+    ).json()["agent_id"]
+    response = client.get(f"/agents/{agent_id}/config", headers=headers)
+    assert response.json()["version"] == 1
+    etag = response.headers["ETag"]
+    assert client.get(f"/agents/{agent_id}/config", headers={**headers, "If-None-Match": etag}).status_code == 304
+    # JSON Merge Patch
+    response = client.patch(f"/agents/{agent_id}/config", content=json.dumps({"optimizer": {"lr": 0.001}}),
+                            headers={**headers, "Content-Type": "application/merge-patch+json", "If-Match": etag})
+    assert response.status_code == 200 and response.json()["version"] == 2
+    # JSON Patch, тип определяется по телу
+    response = client.patch(f"/agents/{agent_id}/config",
+                            json=[{"op": "add", "path": "/model/layers/-", "value": 16}], headers=headers)
+    assert response.json()["version"] == 3
+    assert response.headers["ETag"] == '"3"'
+    assert client.get(f"/agents/{agent_id}/config", headers={**headers, "If-None-Match": etag}).status_code == 200
+    response = client.get(f"/agents/{agent_id}/config", params={"since_version": 1}, headers=headers)
+    assert response.json()["configuration"] is None
+    # Изменённые массивы заменяются целиком
+    assert response.json()["patch"] == [{"op": "replace", "path": "/model/layers", "value": [64, 32, 16]},
+                                        {"op": "replace", "path": "/optimizer/lr", "value": 0.001}]
+    response = client.get(f"/agents/{agent_id}/config", params={"since_version": 3}, headers=headers)
+    assert response.json()["patch"] == []
+    response = client.get(f"/agents/{agent_id}/config", headers=headers)
+    assert response.json()["configuration"] == {"model": {"layers": [64, 32, 16]}, "optimizer": {"lr": 0.001}}
+    # Устаревший If-Match, неприменимый патч и замена конфигурации не объектом
+    response = client.patch(f"/agents/{agent_id}/config", json={"x": 1}, headers={**headers, "If-Match": etag})
+    assert response.status_code == 412
+    response = client.patch(f"/agents/{agent_id}/config", json=[{"op": "remove", "path": "/missing"}], headers=headers)
+    assert response.status_code == 422
+    response = client.patch(f"/agents/{agent_id}/config", json=[{"op": "replace", "path": "", "value": 1}],
+                            headers=headers)
+    assert response.status_code == 422
+    assert client.patch("/agents/999/config", json={}, headers=headers).status_code == 404
+    # PUT заменяет конфигурацию целиком и тоже создаёт версию
+    response = client.put(f"/agents/{agent_id}/config", json={"configuration": {"model": "svm"}}, headers=headers)
+    assert response.headers["ETag"] == '"4"'
+
 # Тесты для интеграции внешних систем
 def test_add_integration():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     response = client.post(
         "/integrations",
@@ -276,189 +1103,61 @@ def test_add_integration():
     assert "integration_id" in response.json()
 
 def test_get_integrations():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     client.post(
         "/integrations",
         json={"system_name": "External", "api_url": "https://example.com", "auth_details": {"token": "abc"}},
         headers={"Authorization": f"Bearer {token}"}
     )
-    response = client.get("/integrations", headers={"Authorization": f"Bearer Angled brackets < > are used instead of square brackets [ ] to avoid interpretation as markup by the renderer."})
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
-from datetime import datetime, timedelta
-import jwt  # PyJWT для работы с токенами
-from enum import Enum
-
-# Инициализация приложения FastAPI
-app = FastAPI(
-    title="AI Agent Management System API",
-    description="API для управления ИИ-агентами: регистрация, жизненный цикл, мониторинг, задачи, коммуникация и интеграция.",
-    version="1.0.0"
-)
-
-# Конфигурация для JWT
-SECRET_KEY = "1"  # Замените на безопасный ключ
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
-
-# Схема OAuth2 для аутентификации
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
-
-# Перечисления для статусов
-class AgentStatus(str, Enum):
-    ACTIVE = "active"
-    STOPPED = "stopped"
-    PAUSED = "paused"
-
-class TaskStatus(str, Enum):
-    PENDING = "pending"
-    IN_PROGRESS = "in_progress"
-    COMPLETED = "completed"
-
-# Модели данных (Pydantic)
-class AgentCreate(BaseModel):
-    agent_type: str = Field(..., max_length=255, description="Тип агента (например, BDI, ML)")
-    status: AgentStatus = Field(..., description="Статус агента")
-    priority_level: int = Field(..., ge=1, le=3, description="Уровень приоритета (1-3)")
-    configuration: Dict = Field(..., description="Конфигурация агента в формате JSON")
-
-    class Config:
-        schema_extra = {
-            "example": {
-                "agent_type": "ML",
-                "status": "active",
-                "priority_level": 2,
-                "configuration": {"model": "neural_network", "params": {"learning_rate": 0.01}}
-            }
-        }
-
-class AgentResponse(BaseModel):
-    agent_id: int
-    message: str
-
-class AgentStatusResponse(BaseModel):
-    agent_id: int
-    status: AgentStatus
-    last_heartbeat: datetime
-
-class Metric(BaseModel):
-    metric_type: str = Field(..., max_length=50, description="Тип метрики (например, CPU, Memory)")
-    value: float
-
-class AgentMetricsResponse(BaseModel):
-    agent_id: int
-    metrics: List[Metric]
-
-class MessageCreate(BaseModel):
-    sender_id: int
-    receiver_id: int
-    content: str
-
-class MessageResponse(BaseModel):
-    message_id: int
-    timestamp: datetime
-
-class MessageListResponse(BaseModel):
-    agent_id: int
-    messages: List[Dict[str, str]]
-
-class TaskCreate(BaseModel):
-    priority: int = Field(..., ge=1, le=5, description="Приоритет задачи (1-5)")
-    assigned_agent_id: int
-    deadline: datetime
-    status: TaskStatus
-
-class TaskResponse(BaseModel):
-    task_id: int
-    message: str
-
-class TaskInfo(BaseModel):
-    task_id: int
-    priority: int
-    assigned_agent_id: int
-    deadline: datetime
-    status: TaskStatus
-
-class CoordinationRequest(BaseModel):
-    agents: List[int]
-    action: str
-
-class CoordinationResponse(BaseModel):
-    coordination_id: int
-    message: str
-
-class ConfigurationUpdate(BaseModel):
-    configuration: Dict
-
-class IntegrationCreate(BaseModel):
-    system_name: str
-    api_url: str
-    auth_details: Dict
-
-class IntegrationResponse(BaseModel):
-    integration_id: int
-    message: str
-
-class IntegrationInfo(BaseModel):
-    integration_id: int
-    system_name: str
-    api_url: str
-
-class UserCreate(BaseModel):
-    username: str
-    password: str
-    role_id: int
-
-class UserResponse(BaseModel):
-    user_id: int
-    message: str
-
-class UserInfo(BaseModel):
-    user_id: int
-    username: str
-    role: str
-
-class Role(BaseModel):
-    role_id: int
-    role_name: str
-
-class LogEntry(BaseModel):
-    timestamp: datetime
-    level: str
-    message: str
-
-class SystemMetrics(BaseModel):
-    cpu_usage: float
-    memory_usage: float
-    active_agents: int
-
-fake_db = {"users": {}, "agents": {}, "tasks": {}, "messages": {}, "integrations": {}}
-
-# Функция создания JWT-токена
-def create_access_token(data: dict, expires_delta: timedelta):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + expires_delta
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
-# Проверка токена и получение текущего пользователя
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username not in fake_db["users"]:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return {"username": username, "role": fake_db["users"][username]["role"]}
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    response = client.get("/integrations", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert response.json()[0]["system_name"] == "External"
+
+def test_call_integration(stub_server):
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    integration_id = client.post(
+        "/integrations",
+        json={"system_name": "Stub", "api_url": stub_server.url, "auth_details": {"token": "abc"}},
+        headers=headers
+    ).json()["integration_id"]
+    response = client.post(f"/integrations/{integration_id}/call",
+                           json={"method": "POST", "path": "/ok", "params": {"q": "1"}, "body": {"x": 1}},
+                           headers=headers)
+    assert response.status_code == 200
+    assert response.json()["status_code"] == 200
+    assert response.json()["body"] == {"method": "POST", "path": "/ok?q=1", "body": {"x": 1}}
+    assert stub_server.requests[-1][2] == "Bearer abc"
+    response = client.post(f"/integrations/{integration_id}/call", json={"path": "/fail"}, headers=headers)
+    assert response.json()["status_code"] == 500
+    stats = client.get(f"/integrations/{integration_id}/stats", headers=headers).json()
+    assert stats["calls"] == 2 and stats["failures"] == 1 and stats["circuit"] == "closed"
+    assert [s["integration_id"] for s in client.get("/integrations/stats", headers=headers).json()] == [integration_id]
+    assert client.post("/integrations/999/call", json={}, headers=headers).status_code == 404
+
+def test_call_integration_unreachable():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    integration_id = client.post(
+        "/integrations", json={"system_name": "Down", "api_url": "http://127.0.0.1:9", "auth_details": {}},
+        headers=headers
+    ).json()["integration_id"]
+    connector = integration_pool.connector({"integration_id": integration_id, "system_name": "Down",
+                                            "api_url": "http://127.0.0.1:9", "auth_details": {}})
+    connector.retries, connector.breaker.failure_threshold = 0, 1
+    response = client.post(f"/integrations/{integration_id}/call", json={"path": "/"}, headers=headers)
+    assert response.status_code == 502
+    response = client.post(f"/integrations/{integration_id}/call", json={"path": "/"}, headers=headers)
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
 
 # Тесты для управления пользователями и ролями
 def test_create_user():
-    fake_db["users"]["admin"] = {"user_id": 1, "password": "adminpass", "role": "admin"}
+    add_user("admin", "adminpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "admin"}, expires_delta=timedelta(minutes=30))
     response = client.post(
         "/users",
@@ -468,9 +1167,12 @@ def test_create_user():
     assert response.status_code == 200
     assert "user_id" in response.json()
     assert response.json()["message"] == "User created"
+    # Пароль хранится в виде хэша, вход по нему работает
+    assert asyncio.run(storage.get_user("newuser"))["password"].startswith("scrypt$")
+    assert client.post("/auth/login", data={"username": "newuser", "password": "newpass"}).status_code == 200
 
 def test_create_user_non_admin():
-    fake_db["users"]["user"] = {"user_id": 1, "password": "userpass", "role": "user"}
+    add_user("user", "userpass", "user", user_id=1)
     token = create_access_token(data={"sub": "user"}, expires_delta=timedelta(minutes=30))
     response = client.post(
         "/users",
@@ -481,8 +1183,8 @@ def test_create_user_non_admin():
     assert response.json()["detail"] == "Admin access required"
 
 def test_update_user():
-    fake_db["users"]["admin"] = {"user_id": 1, "password": "adminpass", "role": "admin"}
-    fake_db["users"]["testuser"] = {"user_id": 2, "password": "testpass", "role": "user"}
+    add_user("admin", "adminpass", "admin", user_id=1)
+    add_user("testuser", "testpass", "user", user_id=2)
     token = create_access_token(data={"sub": "admin"}, expires_delta=timedelta(minutes=30))
     response = client.put(
         "/users/2",
@@ -492,8 +1194,52 @@ def test_update_user():
     assert response.status_code == 200
     assert response.json()["message"] == "User updated"
 
+def test_update_user_invalidates_cached_token():
+    add_user("admin", "adminpass", "admin", user_id=1)
+    add_user("testuser", "testpass", "admin", user_id=2)
+    admin_token = create_access_token(data={"sub": "admin"}, expires_delta=timedelta(minutes=30))
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    response = client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["role"] == "admin"
+    client.put(
+        "/users/2",
+        json={"username": "testuser", "password": "newpass", "role_id": 1},
+        headers={"Authorization": f"Bearer {admin_token}"}
+    )
+    response = client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["role"] == "user"
+    response = client.post(
+        "/users",
+        json={"username": "other", "password": "pass", "role_id": 1},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 403
+
+def test_list_rename_and_delete_users():
+    add_user("admin", "adminpass", "admin", user_id=1)
+    add_user("testuser", "testpass", "user", user_id=2)
+    add_user("other", "otherpass", "user", user_id=3)
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'admin'}, expires_delta=timedelta(minutes=30))}"}
+    user_token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    assert client.get("/users/me", headers={"Authorization": f"Bearer {user_token}"}).json()["user_id"] == 2
+    response = client.get("/users", params={"limit": 2, "offset": 1}, headers=headers)
+    assert response.json()["total"] == 3
+    assert [user["username"] for user in response.json()["users"]] == ["testuser", "other"]
+    assert client.get("/users", headers={"Authorization": f"Bearer {user_token}"}).status_code == 403
+    response = client.put("/users/2", json={"username": "other", "password": "x", "role_id": 1}, headers=headers)
+    assert response.status_code == 409
+    response = client.put("/users/2", json={"username": "renamed", "password": "x", "role_id": 1}, headers=headers)
+    assert response.status_code == 200
+    # Токен со старым именем больше не действует, вход под новым именем работает
+    assert client.get("/users/me", headers={"Authorization": f"Bearer {user_token}"}).status_code == 401
+    assert client.post("/auth/login", data={"username": "renamed", "password": "x"}).status_code == 200
+    assert client.delete("/users/3", headers=headers).status_code == 200
+    assert client.delete("/users/3", headers=headers).status_code == 404
+    assert client.delete("/users/1", headers=headers).status_code == 409
+    assert [user["user_id"] for user in client.get("/users", headers=headers).json()["users"]] == [1, 2]
+
 def test_get_roles():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     response = client.get("/roles", headers={"Authorization": f"Bearer {token}"})
     assert response.status_code == 200
@@ -503,20 +1249,117 @@ def test_get_roles():
 
 # Тесты для логирования и мониторинга
 def test_get_logs():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
-    response = client.get("/logs", headers={"Authorization": f"Bearer {token}"})
+    headers = {"Authorization": f"Bearer {token}"}
+    agent_id = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers=headers
+    ).json()["agent_id"]
+    client.post(f"/agents/{agent_id}/stop", headers=headers)
+    response = client.get("/logs", headers=headers)
     assert response.status_code == 200
     assert len(response.json()) == 2
     assert response.json()[0]["level"] == "INFO"
+    assert [entry["message"] for entry in response.json()] == ["Agent stopped", "Agent registered"]
+    assert response.json()[0]["agent_id"] == agent_id
+
+def test_get_logs_filters():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    log_store.write("INFO", "first", agent_id=1)
+    log_store.write("ERROR", "failure", agent_id=2, task_id=7)
+    middle = datetime.utcnow()
+    log_store.write("WARNING", "warning", agent_id=1)
+    log_store.write("DEBUG", "details")
+    response = client.get("/logs", params={"level": "WARNING"}, headers=headers)
+    assert [entry["message"] for entry in response.json()] == ["warning", "failure"]
+    assert response.json()[1]["task_id"] == 7
+    response = client.get("/logs", params={"agent_id": 1}, headers=headers)
+    assert [entry["message"] for entry in response.json()] == ["warning", "first"]
+    response = client.get("/logs", params={"until": middle.isoformat()}, headers=headers)
+    assert [entry["message"] for entry in response.json()] == ["failure", "first"]
+    response = client.get("/logs", params={"since": middle.isoformat(), "limit": 1}, headers=headers)
+    assert [entry["message"] for entry in response.json()] == ["details"]
+    response = client.get("/logs", params={"level": "TRACE"}, headers=headers)
+    assert response.status_code == 422
 
 def test_get_system_metrics():
-    fake_db["users"]["testuser"] = {"user_id": 1, "password": "testpass", "role": "admin"}
+    add_user("testuser", "testpass", "admin", user_id=1)
     token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
     response = client.get("/metrics", headers={"Authorization": f"Bearer {token}"})
     assert response.status_code == 200
     assert "cpu_usage" in response.json()
     assert response.json()["active_agents"] == 0
 
+def test_prometheus_metrics():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(3):
+        client.get("/agents/1/status", headers=headers)
+    client.get("/no-such-path")
+    response = client.get("/metrics/prometheus", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/agents/{agent_id}/status",status="404"} 3' in body
+    assert 'http_request_duration_seconds_count{method="GET",route="/agents/{agent_id}/status",status="404"} 3' in body
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in body
+    assert "process_resident_memory_bytes" in body
+    response = client.get("/metrics", headers=headers)
+    assert response.json()["memory_usage"] > 0
+
+# Тесты для выгрузки данных
+def test_export_messages():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    agent_response = client.post(
+        "/agents",
+        json={"agent_type": "ML", "status": "active", "priority_level": 2, "configuration": {}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    agent_id = agent_response.json()["agent_id"]
+    for i in range(3):
+        client.post(
+            "/messages",
+            json={"sender_id": agent_id, "receiver_id": agent_id, "content": f"m{i}"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    response = client.get("/export/messages", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["content"] for r in records] == ["m0", "m1", "m2"]
+    response = client.get(
+        "/export/messages",
+        params={"after_id": records[1]["id"]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert [json.loads(line)["content"] for line in response.text.splitlines()] == ["m2"]
+
+def test_export_agents():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    client.post(
+        "/agents",
+        json={"agent_type": "BDI", "status": "stopped", "priority_level": 1, "configuration": {"a": 1}},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    response = client.get("/export/agents", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    record = json.loads(response.text)
+    assert record["agent_type"] == "BDI"
+    assert record["status"] == "stopped"
+    assert record["configuration"] == {"a": 1}
+
+def test_export_unknown_collection():
+    add_user("testuser", "testpass", "admin", user_id=1)
+    token = create_access_token(data={"sub": "testuser"}, expires_delta=timedelta(minutes=30))
+    response = client.get("/export/users", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 422
+
 if __name__ == "__main__":
     pytest.main(["-v"])
\ No newline at end of file
@@ -0,0 +1,47 @@
+import time
+
+from auth_cache import TokenCache
+
+
+def test_hit_and_miss():
+    cache = TokenCache()
+    assert cache.get("token") is None
+    cache.put("token", {"username": "alice", "role": "admin", "user_id": 1}, time.time() + 60)
+    assert cache.get("token")["username"] == "alice"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_expires_at_token_exp():
+    cache = TokenCache()
+    cache.put("expired", {"username": "alice", "role": "admin", "user_id": 1}, time.time() - 1)
+    assert cache.get("expired") is None
+    cache.put("short", {"username": "alice", "role": "admin", "user_id": 1}, time.time() + 0.05)
+    time.sleep(0.1)
+    assert cache.get("short") is None
+    assert len(cache) == 0
+
+def test_bounded_lru():
+    cache = TokenCache(max_size=2)
+    exp = time.time() + 60
+    cache.put("a", {"username": "a", "role": "user", "user_id": 1}, exp)
+    cache.put("b", {"username": "b", "role": "user", "user_id": 2}, exp)
+    cache.get("a")
+    cache.put("c", {"username": "c", "role": "user", "user_id": 3}, exp)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+def test_invalidate_user():
+    cache = TokenCache()
+    exp = time.time() + 60
+    cache.put("t1", {"username": "alice", "role": "admin", "user_id": 1}, exp)
+    cache.put("t2", {"username": "alice", "role": "admin", "user_id": 1}, exp)
+    cache.put("t3", {"username": "bob", "role": "user", "user_id": 2}, exp)
+    cache.invalidate_user(1)
+    assert cache.get("t1") is None
+    assert cache.get("t2") is None
+    assert cache.get("t3") is not None
+
+def test_disabled():
+    cache = TokenCache(max_size=0)
+    cache.put("token", {"username": "alice", "role": "admin", "user_id": 1}, time.time() + 60)
+    assert cache.get("token") is None
@@ -0,0 +1,81 @@
+import pytest
+
+from config_versions import ConfigHistory, PatchError, diff, json_patch, merge_patch
+
+
+def test_merge_patch_shares_unchanged_subtrees():
+    base = {"model": {"layers": [64, 32], "activation": "relu"}, "optimizer": {"lr": 0.01}, "tags": ["a"]}
+    patched = merge_patch(base, {"optimizer": {"lr": 0.001, "momentum": None}, "tags": None, "seed": 1})
+    assert patched == {"model": {"layers": [64, 32], "activation": "relu"}, "optimizer": {"lr": 0.001}, "seed": 1}
+    assert patched["model"] is base["model"]
+    assert base["optimizer"] == {"lr": 0.01} and "tags" in base
+
+
+def test_json_patch_operations():
+    base = {"model": {"layers": [64, 32]}, "optimizer": {"lr": 0.01}, "a/b": 1}
+    patched = json_patch(base, [
+        {"op": "test", "path": "/optimizer/lr", "value": 0.01},
+        {"op": "replace", "path": "/optimizer/lr", "value": 0.001},
+        {"op": "add", "path": "/model/layers/-", "value": 16},
+        {"op": "add", "path": "/model/layers/0", "value": 128},
+        {"op": "copy", "from": "/optimizer", "path": "/backup"},
+        {"op": "move", "from": "/a~1b", "path": "/ab"},
+        {"op": "remove", "path": "/model/layers/1"},
+    ])
+    assert patched == {"model": {"layers": [128, 32, 16]}, "optimizer": {"lr": 0.001}, "backup": {"lr": 0.001},
+                       "ab": 1}
+    assert base == {"model": {"layers": [64, 32]}, "optimizer": {"lr": 0.01}, "a/b": 1}
+    assert patched["backup"] is patched["optimizer"]
+
+
+@pytest.mark.parametrize("operations", [
+    [{"op": "remove", "path": "/missing"}],
+    [{"op": "replace", "path": "/x/0", "value": 1}],
+    [{"op": "add", "path": "/list/5", "value": 1}],
+    [{"op": "test", "path": "/x", "value": "1"}],
+    [{"op": "move", "from": "/list", "path": "/list/0"}],
+    [{"op": "jump", "path": "/x"}],
+    [{"path": "/x"}],
+    {"op": "add"},
+])
+def test_json_patch_errors(operations):
+    with pytest.raises(PatchError):
+        json_patch({"x": 1, "list": [1]}, operations)
+
+
+@pytest.mark.parametrize("value, expected, equal", [
+    (1, 1.0, True),
+    (0.5, 0.5, True),
+    ({"lr": 1, "layers": [64, 32.0]}, {"lr": 1.0, "layers": [64.0, 32]}, True),
+    (True, 1, False),
+    (False, 0.0, False),
+    ({"flag": True}, {"flag": 1}, False),
+    ([1, 2], [1, 2, 3], False),
+    ({"a": 1}, {"a": 1, "b": 2}, False),
+])
+def test_json_patch_test_compares_numbers_by_value(value, expected, equal):
+    operations = [{"op": "test", "path": "/x", "value": expected}]
+    if equal:
+        assert json_patch({"x": value}, operations) == {"x": value}
+    else:
+        with pytest.raises(PatchError):
+            json_patch({"x": value}, operations)
+
+
+def test_diff_roundtrip():
+    old = {"model": {"layers": [64, 32], "activation": "relu"}, "optimizer": {"lr": 0.01}, "flag": True}
+    new = merge_patch(old, {"model": {"activation": "gelu"}, "optimizer": None, "flag": 1, "x/y": {"z": 2}})
+    operations = diff(old, new)
+    assert json_patch(old, operations) == new
+    assert {"op": "replace", "path": "/flag", "value": 1} in operations
+    assert diff(new, new) == []
+
+
+def test_config_history_bounded():
+    history = ConfigHistory(max_versions=2)
+    for version in (1, 3, 2):
+        history.record(7, version, {"v": version})
+    assert [version for version, _ in history.versions(7)] == [2, 3]
+    assert history.get(7, 1) is None and history.get(7, 3) == {"v": 3}
+    history.forget(7)
+    assert history.versions(7) == []
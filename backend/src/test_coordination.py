@@ -0,0 +1,41 @@
+import asyncio
+
+from coordination import CoordinationEngine
+from delivery import DeliveryHub
+from storage import MemoryStorage
+
+
+class SlowStorage(MemoryStorage):
+    """Хранилище, у которого запись сообщений для агента 2 зависает."""
+
+    async def add_messages(self, messages):
+        if any(message["receiver_id"] == 2 for message in messages):
+            await asyncio.sleep(10)
+        return await super().add_messages(messages)
+
+
+def test_chunk_timeout_marks_failed():
+    async def scenario():
+        engine = CoordinationEngine(SlowStorage(), DeliveryHub().publish_many, chunk_size=2, delivery_timeout=0.05)
+        coordination_id, delivered, failed = await engine.start("sync", [1, 2, 3, 4, 5], ack_timeout=60)
+        assert sorted(delivered) == [3, 4, 5] and sorted(failed) == [1, 2]
+        # Участник с неудачной доставкой всё ещё может подтвердить действие
+        assert await engine.acknowledge(coordination_id, 1)
+        progress = await engine.progress(coordination_id)
+        assert progress["counts"]["failed"] == 1 and progress["counts"]["acknowledged"] == 1
+        assert progress["status"] == "in_progress"
+    asyncio.run(scenario())
+
+
+def test_broadcast_to_thousands():
+    async def scenario():
+        storage, hub = MemoryStorage(), DeliveryHub()
+        engine = CoordinationEngine(storage, hub.publish_many, chunk_size=500)
+        mailbox = hub.subscribe(1)
+        agent_ids = list(range(1, 5001))
+        coordination_id, delivered, failed = await engine.start("restart", agent_ids, ack_timeout=60)
+        assert len(delivered) == 5000 and not failed
+        assert len(storage.messages) == 5000
+        assert mailbox.pending == 1
+        assert (await engine.progress(coordination_id))["counts"]["delivered"] == 5000
+    asyncio.run(scenario())
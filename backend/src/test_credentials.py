@@ -0,0 +1,59 @@
+import asyncio
+import threading
+import time
+
+import credentials
+from credentials import PBKDF2, SCRYPT, PasswordHasher
+
+
+def fast_hasher(**options):
+    return PasswordHasher(scrypt_n=2 ** 10, pbkdf2_iterations=1000, **options)
+
+
+def test_hash_and_verify():
+    hasher = fast_hasher()
+    stored = hasher.hash_sync("secret")
+    assert stored.startswith("scrypt$1024$8$1$") and "secret" not in stored
+    assert stored != hasher.hash_sync("secret")
+    assert hasher.verify_sync("secret", stored) == (True, False)
+    assert hasher.verify_sync("wrong", stored) == (False, False)
+    assert hasher.verify_sync("secret", None) == (False, False)
+    assert hasher.verify_sync("secret", "scrypt$broken") == (False, False)
+
+
+def test_rehash_legacy_and_outdated():
+    hasher = fast_hasher()
+    # Пароль открытым текстом
+    assert hasher.verify_sync("secret", "secret") == (True, True)
+    assert hasher.verify_sync("secret", "other") == (False, True)
+    # Другие параметры или схема
+    assert hasher.verify_sync("secret", PasswordHasher(scrypt_n=2 ** 11).hash_sync("secret")) == (True, True)
+    assert hasher.verify_sync("secret", fast_hasher(scheme=PBKDF2).hash_sync("secret")) == (True, True)
+    assert fast_hasher(scheme=PBKDF2).verify_sync("secret", hasher.hash_sync("secret")) == (True, True)
+
+
+def test_async_pool(monkeypatch):
+    hasher = fast_hasher(max_workers=2)
+    derive, lock = credentials._derive, threading.Lock()
+    running, peak = [0], [0]
+
+    def counting_derive(*args):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        try:
+            time.sleep(0.01)
+            return derive(*args)
+        finally:
+            with lock:
+                running[0] -= 1
+    monkeypatch.setattr(credentials, "_derive", counting_derive)
+
+    async def scenario():
+        hashes = await asyncio.gather(*(hasher.hash(f"pw{i}") for i in range(6)))
+        return await asyncio.gather(*(hasher.verify(f"pw{i}", stored) for i, stored in enumerate(hashes)))
+    assert asyncio.run(scenario()) == [(True, False)] * 6
+    # Одновременно считается не больше max_workers хэшей
+    assert hasher.max_workers == 2 and peak[0] == 2
+    hasher.close()
+    assert hasher.scheme == SCRYPT
@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+from deadline_scheduler import DeadlineScheduler
+
+
+def test_pop_due_in_deadline_order():
+    scheduler = DeadlineScheduler()
+    for task_id, deadline in ((1, 30.0), (2, 10.0), (3, 20.0), (4, 100.0)):
+        scheduler.schedule(task_id, deadline)
+    assert scheduler.pop_due(now=5) == []
+    assert scheduler.pop_due(now=25) == [2, 3]
+    assert scheduler.pop_due(now=50, limit=1) == [1]
+    assert scheduler.next_deadline() == 100.0
+    assert len(scheduler) == 1
+
+def test_cancel_and_reschedule():
+    scheduler = DeadlineScheduler()
+    scheduler.schedule(1, 10.0)
+    scheduler.schedule(2, 10.0)
+    scheduler.cancel(1)
+    scheduler.schedule(2, 40.0)
+    assert scheduler.next_deadline() == 40.0
+    assert scheduler.pop_due(now=30) == []
+    assert scheduler.pop_due(now=40) == [2]
+
+def test_run_wakes_for_earlier_deadline():
+    async def scenario():
+        scheduler = DeadlineScheduler(max_sleep=10)
+        fired = []
+
+        async def on_due(task_ids):
+            fired.extend(task_ids)
+
+        runner = asyncio.create_task(scheduler.run(on_due))
+        scheduler.schedule(1, time.time() + 60)
+        await asyncio.sleep(0.01)
+        # Планировщик спит до задачи 1; более ранний срок должен его разбудить
+        scheduler.schedule(2, time.time() + 0.05)
+        await asyncio.sleep(0.2)
+        runner.cancel()
+        return fired
+    assert asyncio.run(scenario()) == [2]
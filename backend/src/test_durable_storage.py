@@ -0,0 +1,210 @@
+import asyncio
+import os
+import pickle
+from datetime import datetime
+from enum import Enum
+
+import pytest
+
+from durable_storage import (SNAPSHOT_MAGIC, SNAPSHOT_NAME, DurableMemoryStorage, _dumps, _frame, _read_frames,
+                             list_segments, segment_path)
+
+
+class Status(str, Enum):
+    ACTIVE = "active"
+    STOPPED = "stopped"
+
+
+def agent_row(status=Status.ACTIVE):
+    return {"agent_type": "ML", "status": status, "priority_level": 2,
+            "configuration": {"model": "nn"}, "last_heartbeat": datetime(2024, 1, 1)}
+
+
+def message_row(sender, receiver, second=0):
+    return {"sender_id": sender, "receiver_id": receiver, "content": "hi", "timestamp": datetime(2024, 1, 1, 0, 0, second)}
+
+
+def reopen(directory, scenario, **options):
+    async def main():
+        storage = DurableMemoryStorage(str(directory), snapshot_interval=0, **options)
+        await storage.connect()
+        try:
+            return await scenario(storage)
+        finally:
+            await storage.close()
+    return asyncio.run(main())
+
+
+async def mutate(storage):
+    first, second, third = await storage.add_agents([agent_row(), agent_row(), agent_row()])
+    await storage.update_agents({"status": Status.STOPPED}, agent_ids=[second])
+    await storage.update_config(first, {"model": "tree"})
+    await storage.add_messages([message_row(first, second), message_row(third, first, 1)])
+    await storage.delete_agent(third)
+    task_id = await storage.add_task({"priority": 3, "assigned_agent_id": first, "deadline": datetime(2030, 1, 1),
+                                      "status": "pending"})
+    await storage.transition_task(task_id, "pending", "in_progress")
+    coordination_id = await storage.add_coordination(
+        {"action": "sync", "created_at": datetime(2024, 1, 1), "deadline": datetime(2024, 1, 2)}, [first, second]
+    )
+    await storage.set_participant_state(coordination_id, [second], ["pending"], "acknowledged")
+    await storage.add_integration({"system_name": "crm", "api_endpoint": "http://crm", "auth_token": None})
+    alice = await storage.add_user({"username": "alice", "password": "p", "role": "user"})
+    bob = await storage.add_user({"username": "bob", "password": "p", "role": "user"})
+    await storage.update_user(alice, {"username": "alice2"})
+    await storage.delete_user(bob)
+    return first, second, third, task_id, coordination_id
+
+
+async def state(storage, ids):
+    first, second, third, task_id, coordination_id = ids
+    return {
+        "agents": [await storage.get_agent(agent_id) for agent_id in (first, second, third)],
+        "by_status": await storage.count_agents_by_status(),
+        "messages": [await storage.list_messages(agent_id, 10) for agent_id in (first, second, third)],
+        "task": await storage.get_task(task_id),
+        "participants": await storage.list_participants(coordination_id),
+        "integrations": await storage.list_integrations(),
+        "users": await storage.list_users(10),
+        "alice": await storage.get_user("alice"),
+    }
+
+
+def test_state_survives_restart(tmp_path):
+    async def first_run(storage):
+        ids = await mutate(storage)
+        return ids, await state(storage, ids)
+
+    ids, before = reopen(tmp_path, first_run)
+
+    async def second_run(storage):
+        assert storage.recovery["snapshot_records"] == 0 and storage.recovery["wal_records"] > 0
+        after = await state(storage, ids)
+        # Новые id продолжают последовательность, а не начинают её заново
+        assert await storage.add_agent(agent_row()) > ids[2]
+        return after
+
+    after = reopen(tmp_path, second_run)
+    assert after == before
+    assert after["agents"][0]["configuration"] == {"model": "tree"} and after["agents"][0]["config_version"] == 2
+    assert after["agents"][2] is None and after["alice"] is None
+    # Enum сохраняются значениями
+    assert type(after["agents"][1]["status"]) is str and after["by_status"] == {"active": 1, "stopped": 1}
+
+
+def test_snapshot_replaces_old_segments(tmp_path):
+    async def first_run(storage):
+        ids = await mutate(storage)
+        await storage.snapshot()
+        await storage.update_agent(ids[0], {"priority_level": 3})
+        await storage.add_message(message_row(ids[0], ids[1], 5))
+        assert list_segments(str(tmp_path)) == [2]
+        return ids, await state(storage, ids)
+
+    ids, before = reopen(tmp_path, first_run)
+
+    async def second_run(storage):
+        assert storage.recovery["wal_records"] == 2 and storage.recovery["snapshot_records"] > 0
+        return await state(storage, ids)
+
+    after = reopen(tmp_path, second_run)
+    assert after == before
+    # Сообщения удалённого агента удалены вместе с ним и не возвращаются при загрузке снимка
+    assert after["messages"][2] == [] and len(after["messages"][0]) == 2
+
+
+def read_snapshot(directory):
+    with open(os.path.join(directory, SNAPSHOT_NAME), "rb") as file:
+        assert file.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+        return [pickle.loads(payload) for payload in _read_frames(file)]
+
+
+def test_snapshot_stores_encoded_columns(tmp_path):
+    async def first_run(storage):
+        ids = await mutate(storage)
+        await storage.snapshot()
+        return ids, await state(storage, ids)
+
+    ids, before = reopen(tmp_path, first_run)
+    header, *chunks = read_snapshot(tmp_path)
+    agents = next(chunk for chunk in chunks if chunk and chunk[0] == "agents")
+    collection, agent_ids, columns = agents
+    # Время — микросекунды, статус — код из таблицы в заголовке
+    heartbeats, statuses = columns[4], columns[1]
+    assert agent_ids == [ids[0], ids[1]] and all(type(value) is int for value in heartbeats + statuses)
+    assert [header["codes"]["agents.status"][code] for code in statuses] == ["active", "stopped"]
+
+    # Таблица кодов изменилась после записи снимка: коды переводятся по значениям из заголовка
+    header["codes"]["agents.status"] = list(reversed(header["codes"]["agents.status"]))
+    last = len(header["codes"]["agents.status"]) - 1
+    columns[1][:] = [last - code for code in statuses]
+    with open(os.path.join(tmp_path, SNAPSHOT_NAME), "wb") as file:
+        file.write(SNAPSHOT_MAGIC + b"".join(_frame(_dumps(chunk)) for chunk in [header, *chunks]))
+
+    async def second_run(storage):
+        assert storage.recovery["snapshot_records"] > 0
+        # Индексы, построенные при загрузке, отвечают на выборки
+        assert [task["task_id"] for task in await storage.list_tasks({"status": "in_progress"}, 10)] == [ids[3]]
+        assert (await storage.list_agents({"status": "stopped"}))[0] == 1
+        return await state(storage, ids)
+
+    assert reopen(tmp_path, second_run) == before
+
+
+def test_torn_tail_is_discarded(tmp_path):
+    async def write(storage):
+        return await storage.add_agent(agent_row())
+
+    agent_id = reopen(tmp_path, write)
+    path = segment_path(str(tmp_path), list_segments(str(tmp_path))[-1])
+    size = os.path.getsize(path)
+    with open(path, "ab") as file:
+        file.write(b"\x40\x00\x00\x00\x00\x00\x00\x00partial")
+
+    async def check(storage):
+        assert await storage.get_agent(agent_id) is not None
+        return await storage.add_agent(agent_row())
+
+    second = reopen(tmp_path, check)
+    assert os.path.getsize(path) > size
+
+    async def check_again(storage):
+        return await storage.get_agent(second)
+
+    assert reopen(tmp_path, check_again)["agent_id"] == second
+
+
+def test_group_commit_batches_fsyncs(tmp_path):
+    async def scenario(storage):
+        await asyncio.gather(*(storage.add_message(message_row(1, 2)) for _ in range(300)))
+        return storage.stats()
+
+    stats = reopen(tmp_path, scenario)
+    assert stats["wal_records"] == 300
+    assert 1 <= stats["fsyncs"] < 300
+
+
+def test_data_directory_is_locked(tmp_path):
+    async def scenario(storage):
+        other = DurableMemoryStorage(str(tmp_path))
+        with pytest.raises(RuntimeError):
+            await other.connect()
+
+    reopen(tmp_path, scenario)
+
+
+def test_write_failure_stops_the_log(tmp_path):
+    async def scenario(storage):
+        def broken(pending):
+            raise ValueError("write to closed file")
+
+        storage.wal._write = broken
+        with pytest.raises(ValueError):
+            await storage.add_agent(agent_row())
+        # Журнал остановлен: следующие записи не зависают, а сразу получают ошибку
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(storage.add_agent(agent_row()), 1)
+        with pytest.raises(RuntimeError):
+            storage.wal.flush()
+
+    reopen(tmp_path, scenario)
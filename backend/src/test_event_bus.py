@@ -0,0 +1,130 @@
+import asyncio
+import fcntl
+import os
+
+import pytest
+
+from event_bus import RECONNECTED, EventBus, SocketEventBus, create_event_bus
+
+
+def test_local_bus_calls_handlers_in_order():
+    bus, calls = EventBus(), []
+    bus.subscribe("a", lambda event: calls.append(("first", event["n"])))
+    bus.subscribe("a", lambda event: calls.append(("second", event["n"])))
+    bus.publish("a", {"n": 1})
+    bus.publish("b", {"n": 2})
+    assert calls == [("first", 1), ("second", 1)]
+    assert bus.published == 2
+
+
+def test_handler_errors():
+    errors = []
+    bus = EventBus(on_error=lambda topic, exc: errors.append(topic))
+    calls = []
+    bus.subscribe("a", lambda event: 1 / 0)
+    bus.subscribe("a", lambda event: calls.append(event))
+    # Ошибка при локальной публикации видна вызывающему, при получении от другого воркера — только on_error;
+    # остальные подписчики вызываются в обоих случаях
+    with pytest.raises(ZeroDivisionError):
+        bus.publish("a", {})
+    bus._dispatch_remote("a", {})
+    assert errors == ["a"] and len(calls) == 2
+
+
+def test_create_event_bus(tmp_path):
+    assert type(create_event_bus("")) is EventBus
+    assert isinstance(create_event_bus(str(tmp_path / "bus.sock")), SocketEventBus)
+
+
+def test_socket_bus_between_workers(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "bus.sock")
+        workers = [SocketEventBus(path, retry_interval=0.05) for _ in range(3)]
+        received = [[] for _ in workers]
+        for bus, events in zip(workers, received):
+            bus.subscribe("agents.deleted", lambda event, events=events: events.append(event["agent_ids"]))
+            bus.subscribe(RECONNECTED, lambda event, events=events: events.append(RECONNECTED))
+
+        async def wait_until(condition):
+            for _ in range(200):
+                if condition():
+                    return
+                await asyncio.sleep(0.01)
+            raise AssertionError(f"condition not reached: {received}")
+
+        for bus in workers:
+            await bus.start()
+            await bus.wait_connected(2)
+        broker, first, second = workers
+        assert broker.is_broker and not first.is_broker and not second.is_broker
+        await wait_until(lambda: broker.peers == 2)
+
+        first.publish("agents.deleted", {"agent_ids": [1]})
+        broker.publish("agents.deleted", {"agent_ids": [2]})
+        await wait_until(lambda: all(len(events) == 2 for events in received))
+        assert all(sorted(events) == [[1], [2]] for events in received)
+        assert first.received == 1 and broker.received == 1
+
+        # Ошибка локального подписчика не мешает переслать событие остальным воркерам
+        first.subscribe("agents.deleted", lambda event: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            first.publish("agents.deleted", {"agent_ids": [9]})
+        await wait_until(lambda: all(events[-1] == [9] for events in received))
+
+        # Брокер завершился: один из оставшихся воркеров становится брокером, второй подключается к нему
+        await broker.close()
+        await wait_until(lambda: RECONNECTED in received[1] and RECONNECTED in received[2])
+        assert first.is_broker != second.is_broker
+        new_broker = first if first.is_broker else second
+        await wait_until(lambda: new_broker.peers == 1)
+        second.publish("agents.deleted", {"agent_ids": [3]})
+        await wait_until(lambda: received[1][-1] == [3])
+        for bus in (first, second):
+            await bus.close()
+
+    asyncio.run(scenario())
+
+
+def test_first_connect_and_missed_startup_events(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "bus.sock")
+        # Блокировку держит брокер, который ещё не начал слушать сокет
+        lock_fd = os.open(path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        worker, other = SocketEventBus(path, retry_interval=0.05), SocketEventBus(path, retry_interval=0.05)
+        events = []
+        worker.subscribe("tasks.created", lambda event: events.append(event["task_id"]))
+        worker.subscribe(RECONNECTED, lambda event: events.append(RECONNECTED))
+        await worker.start()
+        await other.start()
+        with pytest.raises(asyncio.TimeoutError):
+            await worker.wait_connected(0.2)
+        # Воркер загрузил состояние, а событие другого воркера до подключения до него не дошло
+        other.publish("tasks.created", {"task_id": 1})
+        os.close(lock_fd)
+        await worker.wait_connected(2)
+        await other.wait_connected(2)
+        # Первое подключение после пропущенных событий вызывает пересинхронизацию
+        assert events == [RECONNECTED]
+
+        # Дождавшийся подключения воркер не пересинхронизируется и получает события сразу
+        late, late_events = SocketEventBus(path, retry_interval=0.05), []
+        late.subscribe("tasks.created", lambda event: late_events.append(event["task_id"]))
+        late.subscribe(RECONNECTED, lambda event: late_events.append(RECONNECTED))
+        await late.start()
+        await late.wait_connected(2)
+        broker = worker if worker.is_broker else other
+        for _ in range(200):
+            if broker.peers == 2:
+                break
+            await asyncio.sleep(0.01)
+        broker.publish("tasks.created", {"task_id": 2})
+        for _ in range(200):
+            if late_events:
+                break
+            await asyncio.sleep(0.01)
+        assert late_events == [2]
+        for bus in (worker, other, late):
+            await bus.close()
+
+    asyncio.run(scenario())
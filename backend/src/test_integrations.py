@@ -0,0 +1,146 @@
+import asyncio
+
+import httpx
+import pytest
+
+from integrations import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, Connector, ConnectorPool
+
+
+def integration(url, **auth_details):
+    return {"integration_id": 1, "system_name": "stub", "api_url": url, "auth_details": auth_details}
+
+
+def test_circuit_breaker_states():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.before_call(now=0)
+    breaker.record_failure(now=0)
+    assert breaker.state == CLOSED
+    breaker.record_failure(now=1)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call(now=5)
+    # Через reset_timeout пропускается ровно один пробный вызов
+    breaker.before_call(now=11)
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call(now=11)
+    breaker.record_failure(now=12)
+    assert breaker.state == OPEN
+    breaker.before_call(now=23)
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+
+
+def test_connection_reuse_and_auth(stub_server):
+    async def scenario():
+        connector = Connector(integration(stub_server.url, token="secret"))
+        for _ in range(5):
+            response = await connector.request("GET", "/ok")
+            assert response.status_code == 200
+        response = await connector.request("POST", "/ok", json={"x": 1})
+        assert response.json()["body"] == {"x": 1}
+        await connector.aclose()
+        return connector
+    connector = asyncio.run(scenario())
+    assert len(stub_server.connections) == 1
+    assert all(auth == "Bearer secret" for _, _, auth in stub_server.requests)
+    stats = connector.to_dict()
+    assert stats["calls"] == 6 and stats["successes"] == 6 and stats["latency_p50_ms"] is not None
+
+
+def test_retries_idempotent_only(stub_server):
+    async def scenario():
+        connector = Connector(integration(stub_server.url), retries=2, backoff=0.001)
+        assert (await connector.request("GET", "/flaky/2")).status_code == 200
+        assert connector.stats.retries == 2
+        # POST не повторяется без явного разрешения
+        assert (await connector.request("POST", "/flaky/1")).status_code == 503
+        assert (await connector.request("POST", "/flaky/1")).status_code == 200
+        await connector.aclose()
+    asyncio.run(scenario())
+    assert stub_server.hits["/flaky/2"] == 3 and stub_server.hits["/flaky/1"] == 2
+
+
+def test_circuit_opens_on_failures(stub_server):
+    async def scenario():
+        connector = Connector(integration(stub_server.url), retries=0, failure_threshold=3, reset_timeout=60)
+        for _ in range(3):
+            assert (await connector.request("GET", "/fail")).status_code == 500
+        with pytest.raises(CircuitOpenError):
+            await connector.request("GET", "/ok")
+        await connector.aclose()
+        return connector
+    connector = asyncio.run(scenario())
+    assert stub_server.hits.get("/ok") is None
+    assert connector.to_dict()["circuit"] == OPEN
+    assert connector.stats.failures == 3 and connector.stats.rejected == 1
+
+
+def test_concurrency_limit_and_timeout(stub_server):
+    async def scenario():
+        connector = Connector(integration(stub_server.url), max_connections=2, retries=0)
+        started = asyncio.get_running_loop().time()
+        responses = await asyncio.gather(*(connector.request("GET", "/slow/0.1") for _ in range(4)))
+        elapsed = asyncio.get_running_loop().time() - started
+        assert all(response.status_code == 200 for response in responses)
+        # Четыре запроса по 0.1 с при двух соединениях идут в две волны
+        assert elapsed >= 0.2
+        slow = Connector(integration(stub_server.url), retries=0, timeout=0.05)
+        with pytest.raises(httpx.TimeoutException):
+            await slow.request("GET", "/slow/0.5")
+        assert slow.stats.failures == 1
+        await connector.aclose()
+        await slow.aclose()
+    asyncio.run(scenario())
+    assert len(stub_server.connections) <= 3
+
+
+def test_pool_survives_event_loop_change(stub_server):
+    pool = ConnectorPool(retries=0)
+
+    async def call():
+        return (await pool.connector(integration(stub_server.url)).request("GET", "/ok")).status_code
+
+    assert asyncio.run(call()) == 200
+    first_client = pool.get(1)._client
+    assert asyncio.run(call()) == 200
+    assert len(pool) == 1 and pool.stats()[0]["calls"] == 2
+    # Клиент прежнего цикла событий закрыт, а не брошен
+    assert first_client.is_closed and not pool.get(1)._client.is_closed
+
+
+def test_absolute_paths_never_leave_the_connector():
+    sent = []
+    transport = httpx.MockTransport(lambda request: sent.append(request) or httpx.Response(200))
+    connector = Connector(integration("http://stub.local", token="secret"), transport=transport)
+
+    async def scenario():
+        for path in ("http://other-host/", "//other-host/x", "https:other-host"):
+            with pytest.raises(ValueError):
+                await connector.request("GET", path)
+        await connector.request("GET", "/ok")
+    asyncio.run(scenario())
+    assert [str(request.url) for request in sent] == ["http://stub.local/ok"]
+
+
+def test_call_endpoint_rejects_absolute_path(stub_server):
+    from datetime import timedelta
+
+    from fastapi.testclient import TestClient
+    from main import app, create_access_token, integration_pool, storage
+
+    storage.clear()
+    integration_pool.clear()
+    asyncio.run(storage.add_user({"username": "caller", "password": "pw", "role": "admin", "user_id": 1}))
+    token = create_access_token(data={"sub": "caller"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    client = TestClient(app)
+    integration_id = client.post(
+        "/integrations", json={"system_name": "Stub", "api_url": stub_server.url, "auth_details": {"token": "secret"}},
+        headers=headers
+    ).json()["integration_id"]
+    for path in ("http://other-host/", f"{stub_server.url}/ok", "//127.0.0.1/ok"):
+        response = client.post(f"/integrations/{integration_id}/call", json={"path": path}, headers=headers)
+        assert response.status_code == 422
+    assert stub_server.requests == []
+    assert integration_pool.get(integration_id) is None
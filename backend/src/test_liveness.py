@@ -0,0 +1,36 @@
+from liveness import LivenessTracker
+
+
+def test_sweep_marks_agents_without_heartbeat():
+    tracker = LivenessTracker(timeout=10)
+    tracker.beat(1, 100)
+    tracker.beat(2, 100)
+    assert tracker.sweep(now=105) == []
+    tracker.beat(1, 108)
+    assert tracker.sweep(now=112) == [2]
+    assert tracker.stale == {2}
+    assert tracker.sweep(now=117) == []
+    assert tracker.sweep(now=118) == [1]
+
+def test_heartbeat_clears_stale_mark():
+    tracker = LivenessTracker(timeout=10)
+    tracker.beat(1, 100)
+    assert tracker.sweep(now=111) == [1]
+    tracker.beat(1, 112)
+    assert tracker.stale == set()
+    assert tracker.sweep(now=121) == []
+    assert tracker.sweep(now=123) == [1]
+
+def test_one_heap_entry_per_agent():
+    tracker = LivenessTracker(timeout=10)
+    for t in range(1000):
+        tracker.beat(1, float(t))
+    assert len(tracker._heap) == 1
+    assert tracker.last_beat(1) == 999.0
+
+def test_forgotten_agent_not_marked():
+    tracker = LivenessTracker(timeout=10)
+    tracker.beat(1, 100)
+    tracker.forget(1)
+    assert tracker.sweep(now=200) == []
+    assert tracker.last_beat(1) is None
@@ -0,0 +1,46 @@
+import json
+
+from log_store import LogSpill, LogStore
+
+
+def messages(records):
+    return [record["message"] for record in records]
+
+def test_ring_evicts_oldest_from_indexes():
+    store = LogStore(capacity=3)
+    store.write("INFO", "a", agent_id=1)
+    store.write("ERROR", "b", agent_id=2)
+    store.write("INFO", "c", agent_id=1)
+    store.write("INFO", "d", agent_id=3)
+    assert len(store) == 3
+    assert messages(store.query()) == ["d", "c", "b"]
+    assert messages(store.query(agent_id=1)) == ["c"]
+    store.write("INFO", "e")
+    assert store.query(agent_id=2) == []
+    assert store.query(level="ERROR") == []
+
+def test_level_is_minimum():
+    store = LogStore(capacity=10)
+    for level in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        store.write(level, level.lower())
+    assert messages(store.query(level="WARNING")) == ["critical", "error", "warning"]
+    assert messages(store.query(limit=2)) == ["critical", "error"]
+
+def test_index_compaction_keeps_order():
+    store = LogStore(capacity=100)
+    for i in range(1000):
+        store.write("INFO", str(i), agent_id=i % 2)
+    assert messages(store.query(agent_id=1, limit=3)) == ["999", "997", "995"]
+    assert len(store._by_agent[0]) == 50
+
+def test_spill_writes_json_lines(tmp_path):
+    path = tmp_path / "app.log"
+    spill = LogSpill(str(path), max_bytes=200, backup_count=2)
+    store = LogStore(capacity=10, spill=spill)
+    spill.start()
+    for i in range(10):
+        store.write("INFO", f"message {i}", agent_id=i)
+    spill.stop()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert json.loads(lines[-1])["message"] == "message 9"
+    assert (tmp_path / "app.log.1").exists()
@@ -0,0 +1,34 @@
+from metrics_store import MetricSeries, MetricsStore
+
+
+def test_ring_buffer_overwrites_oldest():
+    series = MetricSeries(capacity=3)
+    for t in range(5):
+        assert series.append(float(t), t * 10.0)
+    assert len(series) == 3
+    assert list(series.points(0, 100)) == [(2.0, 20.0), (3.0, 30.0), (4.0, 40.0)]
+    assert series.latest() == (4.0, 40.0)
+
+def test_out_of_order_point_rejected():
+    series = MetricSeries(capacity=3)
+    series.append(10.0, 1.0)
+    assert not series.append(5.0, 2.0)
+    assert series.append(10.0, 3.0)
+    assert len(series) == 2
+
+def test_downsample_window():
+    series = MetricSeries(capacity=8)
+    for t in range(10):
+        series.append(float(t), float(t))
+    # В буфере точки 2..9; окно [3, 9) по 3 секунды
+    assert series.downsample(3, 9, 3) == [(3, 3.0, 5.0, 4.0, 3), (6, 6.0, 8.0, 7.0, 3)]
+    assert series.downsample(20, 30, 5) == []
+
+def test_store_limits_metric_types():
+    store = MetricsStore(capacity=4, max_types=2)
+    assert store.add(1, "CPU", 1.0, 1.0)
+    assert store.add(1, "Memory", 1.0, 2.0)
+    assert not store.add(1, "Disk", 1.0, 3.0)
+    assert sorted(store.latest(1)) == [("CPU", 1.0, 1.0), ("Memory", 1.0, 2.0)]
+    store.drop_agent(1)
+    assert store.latest(1) == []
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+
+from agent_store import AgentRecord, AgentStore
+from message_store import MessageRecord
+from task_store import TaskRecord
+
+
+class Status(str, Enum):
+    ACTIVE = "active"
+    PAUSED = "paused"
+
+
+def test_record_round_trip():
+    row = {"agent_type": "ML", "status": Status.PAUSED, "priority_level": 2,
+           "configuration": {"model": "nn"}, "last_heartbeat": datetime(2024, 1, 1, 12, 30, 0, 15), "config_version": 1}
+    record = AgentRecord(row)
+    assert not hasattr(record, "__dict__")
+    assert type(record.status) is int and type(record.last_heartbeat) is int
+    assert record.to_row() == {**row, "status": "paused"}
+    # Одинаковые типы хранятся одной строкой
+    assert AgentRecord({"agent_type": "".join(["M", "L"])}).agent_type is record.agent_type
+
+    # Время с часовым поясом приводится к наивному UTC; неизвестный статус получает новый код
+    task = TaskRecord({"priority": 1, "assigned_agent_id": 7, "status": "archived",
+                       "deadline": datetime(2030, 1, 1, 3, tzinfo=timezone(timedelta(hours=3)))})
+    assert task.get("deadline") == datetime(2030, 1, 1) and task.get("status") == "archived"
+
+    # Поля вне схемы сохраняются, отсутствующие не появляются
+    message = MessageRecord({"sender_id": 1, "content": "hi", "thread": 5})
+    assert message.to_row() == {"sender_id": 1, "content": "hi", "thread": 5}
+    message.update({"receiver_id": 2, "thread": 6})
+    assert message.get("receiver_id") == 2 and message.get("thread") == 6 and message.get("timestamp") is None
+
+
+def test_agent_store_returns_copies():
+    store = AgentStore()
+    store[1] = {"agent_type": "ML", "status": "active", "priority_level": 1, "configuration": {}}
+    row = store[1]
+    row["status"] = "stopped"
+    assert store[1]["status"] == "active" and store.counts("status") == {"active": 1}
+    store.update_fields(1, {"status": Status.PAUSED})
+    assert store.value(1, "status") == "paused" and store.select({"status": "paused"}) == [1]
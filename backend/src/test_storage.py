@@ -0,0 +1,360 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from ids import IdAllocator
+from message_store import SYSTEM_SENDER_ID, MessageStore
+from storage import MemoryStorage, create_storage
+from task_store import TaskStore
+
+
+@pytest.fixture(params=["memory", "durable", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStorage()
+    if request.param == "durable":
+        return create_storage("", data_dir=str(tmp_path / "data"))
+    pytest.importorskip("sqlalchemy")
+    pytest.importorskip("aiosqlite")
+    pytest.importorskip("greenlet")
+    return create_storage(f"sqlite+aiosqlite:///{tmp_path / 'storage.db'}")
+
+def run(storage, scenario):
+    async def main():
+        await storage.connect()
+        try:
+            await scenario(storage)
+        finally:
+            await storage.close()
+    asyncio.run(main())
+
+def agent_row(agent_type="ML", status="active"):
+    return {"agent_type": agent_type, "status": status, "priority_level": 2,
+            "configuration": {"model": "nn"}, "last_heartbeat": datetime(2024, 1, 1)}
+
+def test_agents(storage):
+    async def scenario(storage):
+        first = await storage.add_agent(agent_row())
+        second = await storage.add_agent(agent_row("BDI"))
+        assert first != second
+        assert (await storage.get_agent(second))["agent_type"] == "BDI"
+        assert (await storage.get_agent(first))["configuration"] == {"model": "nn"}
+        assert await storage.update_agent(first, {"status": "stopped"})
+        assert (await storage.get_agent(first))["status"] == "stopped"
+        assert await storage.missing_agents([first, second, 999]) == [999]
+        assert await storage.count_agents() == 2
+        assert await storage.delete_agent(first)
+        assert not await storage.delete_agent(first)
+        assert await storage.get_agent(first) is None
+        assert not await storage.update_agent(first, {"status": "active"})
+    run(storage, scenario)
+
+def test_update_config_versions(storage):
+    async def scenario(storage):
+        agent_id = await storage.add_agent(agent_row())
+        assert (await storage.get_agent(agent_id))["config_version"] == 1
+        assert await storage.update_config(agent_id, {"model": "svm"}, expected_version=1) == 2
+        assert await storage.update_config(agent_id, {"model": "knn"}, expected_version=1) is None
+        assert await storage.update_config(agent_id, {"model": "rf"}) == 3
+        agent = await storage.get_agent(agent_id)
+        assert agent["configuration"] == {"model": "rf"} and agent["config_version"] == 3
+        assert await storage.update_config(agent_id + 1, {}) is None
+    run(storage, scenario)
+
+def test_bulk_agent_operations(storage):
+    async def scenario(storage):
+        ids = await storage.add_agents([agent_row("ML"), agent_row("BDI"), agent_row("ML", "stopped")])
+        assert len(set(ids)) == 3
+        assert sorted(await storage.update_agents({"status": "paused"}, selector={"agent_type": "ML"})) == sorted([ids[0], ids[2]])
+        assert (await storage.get_agent(ids[2]))["status"] == "paused"
+        assert await storage.update_agents({"status": "active"}, agent_ids=[ids[1], 999]) == [ids[1]]
+        # Список и selector вместе: только агенты из списка, совпадающие с selector
+        assert await storage.update_agents({"priority_level": 3}, agent_ids=[ids[0], ids[1]], selector={"status": "active"}) == [ids[1]]
+        assert (await storage.get_agent(ids[0]))["priority_level"] == 2
+        assert await storage.delete_agents(selector={"status": "active"}) == [ids[1]]
+        assert await storage.missing_agents(ids) == [ids[1]]
+        assert sorted(await storage.delete_agents(agent_ids=ids)) == sorted([ids[0], ids[2]])
+        assert await storage.count_agents() == 0
+    run(storage, scenario)
+
+def test_list_and_count_agents(storage):
+    async def scenario(storage):
+        rows = [agent_row("ML"), agent_row("BDI"), agent_row("ML", "stopped"), agent_row("ML")]
+        rows[3]["priority_level"] = 1
+        ids = await storage.add_agents(rows)
+        assert await storage.count_agents_by_status() == {"active": 3, "stopped": 1}
+        total, page = await storage.list_agents({"agent_type": "ML", "status": "active"})
+        assert total == 2
+        assert [agent["agent_id"] for agent in page] == [ids[0], ids[3]]
+        total, page = await storage.list_agents({}, sort_by="priority_level", limit=2)
+        assert total == 4
+        assert [agent["agent_id"] for agent in page] == [ids[3], ids[0]]
+        total, page = await storage.list_agents({}, descending=True, limit=2, offset=1)
+        assert [agent["agent_id"] for agent in page] == [ids[2], ids[1]]
+        # Индексы следуют за изменениями и удалениями
+        await storage.update_agent(ids[2], {"status": "active"})
+        await storage.update_agents({"status": "paused"}, selector={"agent_type": "BDI"})
+        await storage.delete_agent(ids[0])
+        assert await storage.count_agents_by_status() == {"active": 2, "paused": 1}
+        total, page = await storage.list_agents({"status": "active"}, sort_by="agent_id")
+        assert [agent["agent_id"] for agent in page] == [ids[2], ids[3]]
+        total, page = await storage.list_agents({}, descending=True, limit=5, offset=1)
+        assert total == 3
+        assert [agent["agent_id"] for agent in page] == [ids[2], ids[1]]
+        total, page = await storage.list_agents({}, limit=2, offset=2)
+        assert [agent["agent_id"] for agent in page] == [ids[3]]
+        assert (await storage.list_agents({}, descending=True, offset=3))[1] == []
+        assert await storage.list_agents({"agent_type": "LLM"}) == (0, [])
+    run(storage, scenario)
+
+def test_messages(storage):
+    async def scenario(storage):
+        a = await storage.add_agent(agent_row())
+        b = await storage.add_agent(agent_row())
+        for day in range(1, 6):
+            sender, receiver = (a, b) if day % 2 else (b, a)
+            await storage.add_message({"sender_id": sender, "receiver_id": receiver,
+                                       "content": f"day{day}", "timestamp": datetime(2024, 1, day)})
+        await storage.add_message({"sender_id": b, "receiver_id": b, "content": "self",
+                                   "timestamp": datetime(2024, 1, 6)})
+        page = await storage.list_messages(a, limit=2)
+        assert [m["content"] for m in page] == ["day1", "day2"]
+        last = page[-1]
+        after = (int((last["timestamp"] - datetime(1970, 1, 1)).total_seconds() * 1_000_000), last["message_id"])
+        assert [m["content"] for m in await storage.list_messages(a, limit=10, after=after)] == ["day3", "day4", "day5"]
+        window = await storage.list_messages(b, limit=10, since=datetime(2024, 1, 4), until=datetime(2024, 1, 6))
+        assert [m["content"] for m in window] == ["day4", "day5", "self"]
+    run(storage, scenario)
+
+def test_deleting_agents_deletes_their_messages(storage):
+    async def scenario(storage):
+        a, b, c, d = await storage.add_agents([agent_row() for _ in range(4)])
+        for sender, receiver, day in ((a, b, 1), (b, c, 2), (c, a, 3), (c, d, 4), (d, c, 5)):
+            await storage.add_message({"sender_id": sender, "receiver_id": receiver, "content": f"{sender}->{receiver}",
+                                       "timestamp": datetime(2024, 1, day)})
+        assert await storage.delete_agent(a)
+        assert await storage.delete_agents(agent_ids=[d]) == [d]
+        assert [m["content"] for m in await storage.list_messages(b, limit=10)] == [f"{b}->{c}"]
+        assert [m["content"] for m in await storage.list_messages(c, limit=10)] == [f"{b}->{c}"]
+        exported = [record for batch in [batch async for batch in storage.iter_records("messages")] for record in batch]
+        assert [(row["sender_id"], row["receiver_id"]) for _, row in exported] == [(b, c)]
+    run(storage, scenario)
+
+def test_tasks_and_integrations(storage):
+    async def scenario(storage):
+        agent_id = await storage.add_agent(agent_row())
+        task_id = await storage.add_task({"priority": 3, "assigned_agent_id": agent_id,
+                                          "deadline": datetime(2024, 12, 31), "status": "pending"})
+        assert (await storage.get_task(task_id))["deadline"] == datetime(2024, 12, 31)
+        assert await storage.get_task(task_id + 1) is None
+        assert await storage.transition_task(task_id, "pending", "in_progress")
+        assert not await storage.transition_task(task_id, "pending", "in_progress")
+        assert (await storage.get_task(task_id))["status"] == "in_progress"
+        await storage.add_integration({"system_name": "CRM", "api_url": "http://crm", "auth_details": {"token": "t"}})
+        assert [i["system_name"] for i in await storage.list_integrations()] == ["CRM"]
+    run(storage, scenario)
+
+def test_list_tasks(storage):
+    async def scenario(storage):
+        ids = []
+        for day, agent_id, priority, status in ((5, 1, 1, "pending"), (2, 1, 3, "pending"), (3, 2, 3, "pending"),
+                                                (1, 1, 2, "completed"), (4, 1, 3, "pending")):
+            ids.append(await storage.add_task({"priority": priority, "assigned_agent_id": agent_id,
+                                               "deadline": datetime(2030, 1, day), "status": status}))
+        page = await storage.list_tasks({"assigned_agent_id": 1, "status": "pending"}, limit=10)
+        assert [t["task_id"] for t in page] == [ids[1], ids[4], ids[0]]
+        page = await storage.list_tasks({"priority": 3}, limit=10, deadline_from=datetime(2030, 1, 3),
+                                        deadline_to=datetime(2030, 1, 4))
+        assert [t["task_id"] for t in page] == [ids[2], ids[4]]
+        first = await storage.list_tasks({}, limit=2)
+        assert [t["task_id"] for t in first] == [ids[3], ids[1]]
+        after = (int((first[-1]["deadline"] - datetime(1970, 1, 1)).total_seconds() * 1_000_000), first[-1]["task_id"])
+        assert [t["task_id"] for t in await storage.list_tasks({}, limit=2, after=after)] == [ids[2], ids[4]]
+        # Смена статуса переносит задачу между индексами
+        assert await storage.transition_task(ids[1], "pending", "in_progress")
+        page = await storage.list_tasks({"assigned_agent_id": 1, "status": "pending"}, limit=10)
+        assert [t["task_id"] for t in page] == [ids[4], ids[0]]
+        assert [t["task_id"] for t in await storage.list_tasks({"status": "in_progress"}, limit=10)] == [ids[1]]
+    run(storage, scenario)
+
+def test_aware_datetimes_are_stored_as_naive_utc(storage):
+    moscow = timezone(timedelta(hours=3))
+
+    async def scenario(storage):
+        a, b = await storage.add_agents([agent_row(), agent_row()])
+        task_id = await storage.add_task({"priority": 1, "assigned_agent_id": a, "status": "pending",
+                                          "deadline": datetime(2030, 1, 1, 12, tzinfo=moscow)})
+        assert (await storage.get_task(task_id))["deadline"] == datetime(2030, 1, 1, 9)
+        page = await storage.list_tasks({}, limit=10, deadline_from=datetime(2030, 1, 1, 11, 59, tzinfo=moscow),
+                                        deadline_to=datetime(2030, 1, 1, 9, 0, tzinfo=timezone.utc))
+        assert [task["task_id"] for task in page] == [task_id]
+        assert await storage.list_tasks({}, limit=10, deadline_from=datetime(2030, 1, 1, 12, 1, tzinfo=moscow)) == []
+        await storage.add_message({"sender_id": a, "receiver_id": b, "content": "hi",
+                                   "timestamp": datetime(2024, 1, 1, 3, tzinfo=moscow)})
+        window = await storage.list_messages(a, limit=10, since=datetime(2024, 1, 1, tzinfo=timezone.utc),
+                                             until=datetime(2024, 1, 1, 3, tzinfo=moscow))
+        assert [message["timestamp"] for message in window] == [datetime(2024, 1, 1)]
+        await storage.update_agents({"last_heartbeat": datetime(2024, 1, 2, 3, tzinfo=moscow)}, agent_ids=[a])
+        assert (await storage.get_agent(a))["last_heartbeat"] == datetime(2024, 1, 2)
+    run(storage, scenario)
+
+def test_coordinations(storage):
+    async def scenario(storage):
+        a = await storage.add_agent(agent_row())
+        b = await storage.add_agent(agent_row())
+        message_ids = await storage.add_messages([
+            {"sender_id": 0, "receiver_id": agent_id, "content": "go", "timestamp": datetime(2024, 1, 1)}
+            for agent_id in (a, b)
+        ])
+        assert len(set(message_ids)) == 2
+        assert [m["message_id"] for m in await storage.list_messages(b, limit=10)] == [message_ids[1]]
+        coordination_id = await storage.add_coordination(
+            {"action": "sync", "created_at": datetime(2024, 1, 1), "deadline": datetime(2024, 1, 2)}, [a, b]
+        )
+        assert (await storage.get_coordination(coordination_id))["action"] == "sync"
+        assert await storage.get_coordination(coordination_id + 1) is None
+        assert await storage.count_participants(coordination_id) == {"pending": 2}
+        assert await storage.set_participant_state(coordination_id, [a, b], ["pending"], "delivered") in ([a, b], [b, a])
+        assert await storage.set_participant_state(coordination_id, [a], ["delivered"], "acknowledged") == [a]
+        assert await storage.set_participant_state(coordination_id, [a], ["delivered"], "rejected") == []
+        assert await storage.count_participants(coordination_id) == {"acknowledged": 1, "delivered": 1}
+        assert [(p["agent_id"], p["state"]) for p in await storage.list_participants(coordination_id)] == \
+            [(a, "acknowledged"), (b, "delivered")]
+    run(storage, scenario)
+
+def test_users(storage):
+    async def scenario(storage):
+        user_id = await storage.add_user({"username": "alice", "password": "secret", "role": "admin"})
+        user = await storage.get_user("alice")
+        assert user["user_id"] == user_id
+        assert user["role"] == "admin"
+        assert await storage.update_user(user_id, {"role": "user"})
+        assert (await storage.get_user("alice"))["role"] == "user"
+        assert await storage.get_user("bob") is None
+        assert not await storage.update_user(user_id + 1, {"role": "user"})
+    run(storage, scenario)
+
+def test_user_directory(storage):
+    async def scenario(storage):
+        ids = [await storage.add_user({"username": name, "password": "p", "role": "user"})
+               for name in ("u1", "u2", "u3")]
+        with pytest.raises(ValueError):
+            await storage.add_user({"username": "u2", "password": "p", "role": "user"})
+        assert (await storage.get_user_by_id(ids[1]))["username"] == "u2"
+        # Переименование освобождает старое имя и занимает новое
+        assert await storage.update_user(ids[1], {"username": "renamed"})
+        assert await storage.get_user("u2") is None
+        assert (await storage.get_user("renamed"))["user_id"] == ids[1]
+        with pytest.raises(ValueError):
+            await storage.update_user(ids[0], {"username": "renamed"})
+        assert (await storage.get_user("u1"))["user_id"] == ids[0]
+        assert await storage.delete_user(ids[0])
+        assert not await storage.delete_user(ids[0])
+        assert await storage.get_user("u1") is None and await storage.get_user_by_id(ids[0]) is None
+        total, page = await storage.list_users(limit=1, offset=1)
+        assert total == 2 and [user["username"] for user in page] == ["u3"]
+        await storage.add_user({"username": "u1", "password": "p", "role": "user"})
+        assert [user["username"] for user in (await storage.list_users(limit=10))[1]] == ["renamed", "u3", "u1"]
+    run(storage, scenario)
+
+def test_iter_records(storage):
+    async def scenario(storage):
+        ids = [await storage.add_agent(agent_row(f"T{i}")) for i in range(5)]
+        batches = [batch async for batch in storage.iter_records("agents", after_id=ids[1], batch_size=2)]
+        assert [len(batch) for batch in batches] == [2, 1]
+        assert [record["agent_type"] for batch in batches for _, record in batch] == ["T2", "T3", "T4"]
+        # Удалённые после начала выгрузки записи пропускаются, добавленные не попадают в неё
+        exported = []
+        async for batch in storage.iter_records("agents", batch_size=2):
+            if not exported:
+                await storage.delete_agents(agent_ids=[ids[2], ids[4]])
+                await storage.add_agent(agent_row("T5"))
+            exported += [record["agent_type"] for _, record in batch]
+        assert exported == ["T0", "T1", "T3"]
+    run(storage, scenario)
+
+def test_ids_not_reused_after_delete(storage):
+    async def scenario(storage):
+        ids = [await storage.add_agent(agent_row()) for _ in range(3)]
+        await storage.delete_agent(ids[0])
+        await storage.delete_agent(ids[1])
+        new_id = await storage.add_agent(agent_row("BDI"))
+        assert new_id not in ids
+        assert (await storage.get_agent(ids[2]))["agent_type"] == "ML"
+    run(storage, scenario)
+
+def test_task_update_moves_only_changed_index_keys():
+    store = TaskStore()
+    for task_id in (1, 2):
+        store[task_id] = {"priority": 2, "assigned_agent_id": 7, "deadline": datetime(2030, 1, task_id), "status": "pending"}
+    untouched = {name: store._index[name] for name in (("all", None), ("assigned_agent_id", 7), ("priority", 2))}
+    before = {name: list(keys) for name, keys in untouched.items()}
+    inserted = []
+    store._insert = lambda key, names: (inserted.extend(names), TaskStore._insert(store, key, names))
+    store.update_fields(1, {"status": "in_progress"})
+    # Ключ переносится только в индексах, зависящих от статуса
+    assert sorted(name[0] for name in inserted) == ["agent_status", "status", "status_priority"]
+    assert {name: store._index[name] for name in untouched} == before
+    assert list(store.select({"status": "in_progress"})) == [1]
+    assert list(store.select({"assigned_agent_id": 7, "status": "pending"})) == [2]
+    # Смена срока меняет ключ во всех индексах
+    store.update_fields(1, {"deadline": datetime(2030, 1, 3)})
+    assert list(store.select({})) == [2, 1] and list(store.select({"priority": 2, "status": "in_progress"})) == [1]
+
+def test_system_messages_are_indexed_only_by_receiver():
+    store = MessageStore()
+    for message_id, receiver_id in ((1, 5), (2, 6), (3, 5)):
+        store[message_id] = {"sender_id": SYSTEM_SENDER_ID, "receiver_id": receiver_id,
+                             "content": "expired", "timestamp": datetime(2024, 1, 1, 0, message_id)}
+    assert SYSTEM_SENDER_ID not in store.indexed_agents()
+    assert list(store.for_agent(5)) == [1, 3]
+    del store[1]
+    store.drop_agent(6)
+    assert list(store.for_agent(5)) == [3] and sorted(store) == [3]
+
+def test_id_allocator_reserves_blocks():
+    calls = []
+    counter = {"next": 1}
+
+    async def reserve(collection, count):
+        calls.append(count)
+        await asyncio.sleep(0)
+        first = counter["next"]
+        counter["next"] += count
+        return first
+
+    async def scenario():
+        allocator = IdAllocator(reserve, block_size=10)
+        ids = await asyncio.gather(*(allocator.next_id("agents") for _ in range(95)))
+        ids += await allocator.next_ids("agents", 30)
+        return ids
+
+    ids = asyncio.run(scenario())
+    assert len(set(ids)) == 125
+    assert calls == [10] * 10 + [25]
+
+def test_sql_ids_shared_between_workers(tmp_path):
+    pytest.importorskip("aiosqlite")
+    pytest.importorskip("greenlet")
+    url = f"sqlite+aiosqlite:///{tmp_path / 'workers.db'}"
+
+    async def scenario():
+        first, second = create_storage(url), create_storage(url)
+        await first.connect()
+        await second.connect()
+        ids = []
+        for _ in range(3):
+            ids.append(await first.add_agent(agent_row()))
+            ids.append(await second.add_agent(agent_row()))
+        await first.close()
+        await second.close()
+        restarted = create_storage(url)
+        await restarted.connect()
+        ids.append(await restarted.add_agent(agent_row()))
+        await restarted.close()
+        return ids
+
+    ids = asyncio.run(scenario())
+    assert len(set(ids)) == len(ids)
+    assert ids[-1] > max(ids[:-1])
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from task_queue import TaskQueue
+
+
+def task(task_id, priority, day, agent_id=1):
+    return {"task_id": task_id, "priority": priority, "deadline": datetime(2030, 1, day), "assigned_agent_id": agent_id}
+
+def test_lease_order():
+    queue = TaskQueue()
+    for t in (task(1, 1, 1), task(2, 3, 5), task(3, 3, 2), task(4, 2, 1, agent_id=2)):
+        queue.push(t)
+    assert [queue.lease(1, 60).task_id for _ in range(3)] == [3, 2, 1]
+    assert queue.lease(1, 60) is None
+    assert queue.lease(2, 60).task_id == 4
+
+def test_expired_lease_requeue():
+    queue = TaskQueue()
+    queue.push(task(1, 1, 1))
+    lease = queue.lease(1, 10, now=100)
+    assert queue.expire_leases(now=105) == []
+    expired = queue.expire_leases(now=110)
+    assert [l.task_id for l in expired] == [lease.task_id]
+    assert queue.lease(1, 10, now=110) is None
+    queue.push(task(1, 1, 1))
+    assert queue.lease(1, 10, now=111).task_id == 1
+
+def test_released_lease_does_not_expire():
+    queue = TaskQueue()
+    queue.push(task(1, 1, 1))
+    queue.lease(1, 10, now=100)
+    queue.release(1)
+    assert queue.expire_leases(now=200) == []
+
+def test_discard_and_drop_agent():
+    queue = TaskQueue()
+    for t in (task(1, 1, 1), task(2, 1, 2), task(3, 1, 3, agent_id=2)):
+        queue.push(t)
+    queue.discard(1)
+    assert queue.lease(1, 10).task_id == 2
+    queue.drop_agent(2)
+    assert queue.lease(2, 10) is None
+    assert len(queue) == 0
+
+def test_stale_heap_entries_are_compacted():
+    queue = TaskQueue()
+    queue.push(task(1, 1, 1))
+    # Задачи ставятся и убираются, живой остаётся одна
+    for task_id in range(2, 1000):
+        queue.push(task(task_id, 2, 2))
+        queue.discard(task_id)
+        queue.push(task(1, 1, 1))
+    assert len(queue._pending[1]) <= 2
+    assert queue.lease(1, 10).task_id == 1 and len(queue) == 0
+    assert queue._pending == {} and queue._live == {}
+
+def test_reassigned_task_survives_drop_agent():
+    queue = TaskQueue()
+    queue.push(task(1, 1, 1, agent_id=1))
+    queue.push(task(1, 1, 1, agent_id=2))
+    queue.drop_agent(1)
+    assert queue.lease(2, 10).task_id == 1
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from telemetry import ProcessStats, RequestMetrics
+
+
+def test_histogram_buckets():
+    metrics = RequestMetrics(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.1, 0.5, 2.0):
+        metrics.observe("GET", "/tasks/{task_id}", 200, seconds)
+    metrics.observe("GET", "/tasks/{task_id}", 404, 0.01)
+    stats = metrics.get("GET", "/tasks/{task_id}", 200)
+    assert stats.count == 4
+    assert stats.buckets == [2, 1, 1]
+    assert metrics.get("GET", "/tasks/{task_id}", 404).count == 1
+    lines = metrics.exposition()
+    labels = 'method="GET",route="/tasks/{task_id}",status="200"'
+    assert f'http_request_duration_seconds_bucket{{{labels},le="1.0"}} 3' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 4' in lines
+
+def test_label_escaping():
+    metrics = RequestMetrics()
+    metrics.observe("GET", 'a"b', 200, 0.001)
+    assert 'http_requests_total{method="GET",route="a\\"b",status="200"} 1' in metrics.exposition()
+
+def test_process_stats():
+    stats = ProcessStats()
+    sum(range(100000))
+    assert stats.cpu_percent() >= 0
+    assert stats.rss_bytes() > 0
+
+def test_instrumented_route():
+    class Request:
+        scope = {"type": "http", "method": "GET"}
+
+    class Response:
+        status_code = 201
+
+    async def handler(request):
+        if request.fail:
+            raise HTTPException(status_code=409)
+        return Response()
+
+    metrics = RequestMetrics()
+    instrumented = metrics.instrument(handler, "/tasks/{task_id}", {"GET"})
+    ok, conflict = Request(), Request()
+    ok.fail, conflict.fail = False, True
+    for _ in range(2):
+        asyncio.run(instrumented(ok))
+    with pytest.raises(HTTPException):
+        asyncio.run(instrumented(conflict))
+    assert metrics.get("GET", "/tasks/{task_id}", 201).count == 2
+    assert metrics.get("GET", "/tasks/{task_id}", 409).count == 1
+    # clear обнуляет серии, на которые ссылается обёртка, и учёт продолжается
+    metrics.clear()
+    asyncio.run(instrumented(ok))
+    assert metrics.get("GET", "/tasks/{task_id}", 201).count == 1
@@ -0,0 +1,61 @@
+"""Каталог пользователей с поиском по id и по имени.
+
+Записи хранятся по user_id, рядом ведётся индекс username -> user_id и
+упорядоченный список id для постраничной выдачи. Поиск по любому ключу
+стоит O(1); переименование и удаление обновляют оба индекса, а занятое
+имя отклоняется до изменения записи.
+"""
+from bisect import bisect_left, insort
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional
+
+
+class UserStore(MutableMapping):
+    """Словарь user_id -> пользователь {username, password, role} с индексом по username."""
+
+    def __init__(self):
+        self._users: Dict[int, dict] = {}
+        self._by_username: Dict[str, int] = {}
+        self._ids: List[int] = []
+
+    def __getitem__(self, user_id: int) -> dict:
+        return self._users[user_id]
+
+    def __setitem__(self, user_id: int, user: dict):
+        owner = self._by_username.get(user["username"])
+        if owner is not None and owner != user_id:
+            raise ValueError(f"Username {user['username']!r} already exists")
+        previous = self._users.get(user_id)
+        if previous is None:
+            insort(self._ids, user_id)
+        elif previous["username"] != user["username"]:
+            del self._by_username[previous["username"]]
+        self._users[user_id] = user
+        self._by_username[user["username"]] = user_id
+
+    def __delitem__(self, user_id: int):
+        user = self._users.pop(user_id)
+        del self._by_username[user["username"]]
+        del self._ids[bisect_left(self._ids, user_id)]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def id_for(self, username: str) -> Optional[int]:
+        return self._by_username.get(username)
+
+    def update_fields(self, user_id: int, fields: dict):
+        """Изменяет поля пользователя; при смене username бросает ValueError, если имя занято."""
+        self[user_id] = {**self._users[user_id], **fields}
+
+    @property
+    def sorted_ids(self) -> List[int]:
+        """Упорядоченный список id (не копия: вызывающий код его не изменяет)."""
+        return self._ids
+
+    def page(self, offset: int, limit: int) -> List[int]:
+        """id пользователей по возрастанию, начиная с позиции offset."""
+        return self._ids[offset:offset + limit]